@@ -0,0 +1,216 @@
+"""
+Time every backend over the bundled test pdfs and generated long ones
+
+Each conversion runs in its own process with an empty artifact cache and
+the result cache off, so every stage is paid for and peak rss is that of
+the one conversion. Metadata lookups still go through the usual meta
+cache, so run twice to keep the network out of the numbers.
+
+    python bench/run.py --out bench/results.json --baseline bench/baseline.json
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from bench.synthetic import make_pdf
+
+BACKENDS = {
+    "text": {"force_text": True},
+    "html": {"force_html": True},
+    "html-ex": {"force_html_ex": True},
+}
+
+# Stages quicker than this are too noisy to call a regression
+MIN_DELTA = 0.05
+
+
+def run_one(pdf_path, backend, report_path):
+    """
+    Convert in this process, meant to be the only thing the process does
+    """
+    from pdf2ebook.cache import ARTIFACT_CACHE
+    from pdf2ebook.batch import Job, run_job
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ARTIFACT_CACHE.path = os.path.join(tmp_dir, "artifacts")
+        options = dict(BACKENDS[backend], use_cache=False, htmlex_ok=False)
+        result = run_job(
+            Job(pdf_path, os.path.join(tmp_dir, "out.epub"), None), options
+        )
+
+    report = dict(result.report, ok=result.ok, error=result.error)
+    with open(report_path, "w") as f:
+        json.dump(report, f)
+
+
+def time_conversion(pdf_path, backend, repeat):
+    reports = []
+    for _ in range(repeat):
+        with tempfile.NamedTemporaryFile(suffix=".json") as report_file:
+            subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--one",
+                    pdf_path,
+                    backend,
+                    report_file.name,
+                ],
+                env=dict(os.environ, TEST_ENV="True"),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            with open(report_file.name) as f:
+                content = f.read()
+        if not content:
+            return {"ok": False, "error": "conversion process died"}
+        report = json.loads(content)
+        if not report["ok"]:
+            return {"ok": False, "error": report["error"].splitlines()[0]}
+        reports.append(report)
+
+    # medians over the repeats, stages that didn't run every time are left out
+    stages = {}
+    for name in reports[0]["stages"]:
+        runs = [report["stages"].get(name) for report in reports]
+        if None in runs:
+            continue
+        stages[name] = {
+            key: statistics.median(run[key] or 0 for run in runs)
+            for key in ("wall", "cpu", "child_cpu", "peak_rss")
+        }
+
+    return {
+        "ok": True,
+        "wall": statistics.median(report["wall"] for report in reports),
+        "peak_rss": max(report["peak_rss"] or 0 for report in reports),
+        "stages": stages,
+        "counters": reports[-1]["counters"],
+    }
+
+
+def documents(pdfs, synthetic_pages, tmp_dir):
+    docs = {os.path.splitext(os.path.basename(pdf))[0]: pdf for pdf in pdfs}
+    for pages in synthetic_pages:
+        docs[f"synthetic_{pages}"] = make_pdf(
+            os.path.join(tmp_dir, f"synthetic_{pages}.pdf"), pages
+        )
+    return docs
+
+
+def compare(results, baseline, tolerance, min_delta=MIN_DELTA):
+    """
+    :return: list of (run, stage, baseline seconds, result seconds) that
+        are slower than the baseline by more than tolerance
+    """
+    regressions = []
+    for name, run in results["runs"].items():
+        base = baseline["runs"].get(name)
+        if not base or not base["ok"] or not run["ok"]:
+            continue
+
+        timings = [("total", base["wall"], run["wall"])]
+        for stage, timing in run["stages"].items():
+            if stage in base["stages"]:
+                timings.append((stage, base["stages"][stage]["wall"], timing["wall"]))
+
+        for stage, before, after in timings:
+            if after > before * (1 + tolerance) and after - before > min_delta:
+                regressions.append((name, stage, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--pdfs",
+        nargs="*",
+        default=sorted(glob.glob(os.path.join(ROOT, "test", "resources", "*.pdf"))),
+    )
+    parser.add_argument(
+        "--synthetic-pages",
+        nargs="*",
+        type=int,
+        dest="synthetic_pages",
+        default=[300, 800],
+        help="page counts of generated pdfs to convert too",
+    )
+    parser.add_argument(
+        "--backends", nargs="*", default=list(BACKENDS), choices=list(BACKENDS)
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--out",
+        type=str,
+        dest="out_file",
+        default=os.path.join(BENCH_DIR, "results.json"),
+    )
+    parser.add_argument("--baseline", type=str, dest="baseline", default=None)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="how much slower than the baseline a stage can be, 0.2 is 20%%",
+    )
+    parser.add_argument("--one", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        run_one(*args.one)
+        return
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "runs": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for doc, pdf_path in documents(
+            args.pdfs, args.synthetic_pages, tmp_dir
+        ).items():
+            for backend in args.backends:
+                name = f"{doc}/{backend}"
+                run = time_conversion(pdf_path, backend, args.repeat)
+                results["runs"][name] = run
+                if run["ok"]:
+                    print(
+                        f"{name}: {run['wall']:.2f}s, {run['peak_rss'] / 2 ** 20:.0f}MiB"
+                    )
+                else:
+                    print(f"{name}: failed, {run['error']}")
+
+    with open(args.out_file, "w") as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+    print(f"Results written to {args.out_file}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, stage, before, after in regressions:
+            print(f"Slower: {name} {stage}: {before:.2f}s -> {after:.2f}s")
+        if regressions:
+            sys.exit(1)
+        print(
+            f"No stages slower than {args.baseline} by more than {args.tolerance:.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
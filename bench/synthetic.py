@@ -0,0 +1,98 @@
+"""
+Generate a long text pdf to benchmark with, each page has a running
+header, a page number footer and a few paragraphs of made up words
+"""
+
+import random
+import argparse
+
+WORDS = (
+    "the of and to in a is that for it as was with be by on not he this are or "
+    "his from at which but have an they you were her she there had all one "
+    "river garden letter window morning evening journey harbour lantern "
+    "carriage orchard parlour meadow chapter silence distance fortune stranger"
+).split()
+
+LINES_PER_PAGE = 40
+WORDS_PER_LINE = 12
+
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(rng, number, title):
+    lines = [title.upper(), ""]
+    for idx in range(LINES_PER_PAGE):
+        if idx % 10 == 9:
+            lines.append("")
+            continue
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(WORDS_PER_LINE)))
+    lines.extend(["", str(number)])
+    return lines
+
+
+def page_stream(lines):
+    ops = ["BT", "/F1 11 Tf", "14 TL", "72 760 Td"]
+    for line in lines:
+        ops.append(f"({escape(line)}) Tj T*")
+    ops.append("ET")
+    return "\n".join(ops).encode("latin-1")
+
+
+def make_pdf(path, pages, title="Synthetic Book", seed=0):
+    rng = random.Random(seed)
+
+    # 1 catalog, 2 page tree, 3 font, then a page and its content per page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for number in range(1, pages + 1):
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {page_id + 1} 0 R >>".encode()
+        )
+        stream = page_stream(page_lines(rng, number, title))
+        objects.append(
+            f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream"
+        )
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    content = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for idx, obj in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f"{idx} 0 obj\n".encode() + obj + b"\nendobj\n"
+
+    xref = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        content += f"{offset:010} 00000 n \n".encode()
+    content += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode()
+
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", type=str, dest="out_file", required=True)
+    parser.add_argument("--pages", type=int, dest="pages", default=500)
+    parser.add_argument("--seed", type=int, dest="seed", default=0)
+    args = parser.parse_args()
+
+    make_pdf(args.out_file, args.pages, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
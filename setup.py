@@ -17,7 +17,7 @@ INSTALL_REQUIRES = (
 setup(
     name='pdf2ebook',
     version='2.3.0',
-    python_requires='>=3.6',
+    python_requires='>=3.9',
     description='PDF to ebook',
     long_description='PDF to ebook',
     author='Robert Lucey',
@@ -27,7 +27,8 @@ setup(
     install_requires=INSTALL_REQUIRES,
     entry_points={
         'console_scripts': [
-            'pdf2epub = pdf2ebook.bin.convert:main'
+            'pdf2epub = pdf2ebook.bin.convert:main',
+            'pdf2ebook-catalog = pdf2ebook.bin.catalog:main',
         ]
     }
 )
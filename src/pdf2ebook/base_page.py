@@ -4,13 +4,33 @@ import langdetect
 from cached_property import cached_property
 from boltons.iterutils import strip
 
-from pdf2ebook.utils import remove_page_no
+from pdf2ebook.utils import remove_page_no, fingerprint
 
 
 class BasePage:
+    _fingerprint = None
+
     def __init__(self, *args, **kwargs):
         self.page_number_position = kwargs.get("page_number_position", None)
 
+    @property
+    def fingerprint_content(self):
+        raise NotImplementedError()
+
+    @property
+    def fingerprint(self):
+        # Only rehashed after the content has been changed
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self.fingerprint_content)
+        return self._fingerprint
+
+    def invalidate_fingerprint(self):
+        self._fingerprint = None
+
+    @property
+    def content_hash(self):
+        return self.fingerprint
+
     @cached_property
     def lang(self):
         try:
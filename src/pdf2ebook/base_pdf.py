@@ -1,64 +1,111 @@
 import os
 import re
+import time
 import difflib
+import hashlib
 import unicodedata
-from collections import defaultdict
-
-import isbnlib
 
 from pdf2ebook import logger
-from pdf2ebook.utils import (
-    get_isbn,
-    isbns_from_words,
-    get_isbn_from_content,
-    get_thumbnail_url_from_isbn,
+from pdf2ebook.cache import META_CACHE, MISSING
+from pdf2ebook.instrumentation import stage
+from pdf2ebook.metadata import (
+    resolve_meta,
+    resolve_all_meta,
+    lookup_title_isbn,
+    lookup_thumbnail_url,
 )
-
-
-META_CACHE = defaultdict(dict)
-ISBN_CACHE = defaultdict(str)
-ISBNS_CACHE = defaultdict(list)
+from pdf2ebook.constants import ISBN_LOOKUP_CANDIDATES, META_LOOKUP_DEADLINE
+from pdf2ebook.isbn_scanner import scan_isbns
+from pdf2ebook.utils import get_isbn_from_content
+
+
+def guess_title(pdf_path, first_page):
+    """
+    The title from the first page of the pdf if it's close enough to its
+    filename
+    """
+    filename = os.path.splitext(os.path.basename(pdf_path))[0]
+    filename = filename.replace("_", " ").lower()
+    filename_title = filename
+    # if by... remove by... to just get the title
+    # FIXME: if by is in the title this confuses things.
+    # Maybe see if there's a author name after the by
+    filename_title = re.sub("([- ]by[-: ].*)", "", filename_title)
+
+    content_title = ""
+    clean_content = first_page.lower()
+    found_idx = None
+    for idx, line in enumerate(clean_content.split("\n")):
+        if line.startswith("by:") or line.startswith("by ") or line == "by":
+            found_idx = idx
+
+    if found_idx is not None:
+        possible_title = "\n".join(clean_content.split("\n")[:found_idx]).strip()
+        logger.debug(f"Guessing the title from page content is: {possible_title}")
+        content_title = unicodedata.normalize("NFKD", possible_title.strip())
+
+    if difflib.SequenceMatcher(None, filename_title, content_title).ratio() > 0.4:
+        logger.debug("filename_title and content_title close enough")
+        return content_title
 
 
 class BasePDF:
     @property
     def content_hash(self):
-        return hash(sum([page.content_hash for page in self.pages]))
+        return self.fingerprint
+
+    @property
+    def fingerprint(self):
+        # Combined from the page fingerprints which are only recomputed for
+        # pages that changed, stable between processes so it can be persisted
+        digest = hashlib.blake2b(digest_size=16)
+        for page in self.pages:
+            digest.update(page.fingerprint)
+        return digest.hexdigest()
+
+    # When the isbn metadata lookups of the book have to be done by
+    _lookup_end = None
+
+    def lookup_deadline(self):
+        """
+        Seconds left of the one META_LOOKUP_DEADLINE every isbn metadata
+        lookup of the book shares, starting from the first
+        """
+        if self._lookup_end is None:
+            self._lookup_end = time.monotonic() + META_LOOKUP_DEADLINE
+        return max(self._lookup_end - time.monotonic(), 0)
+
+    @property
+    def meta_key(self):
+        """
+        What the looked up metadata of the book is cached under, the
+        expected title goes into the lookup so it's part of it
+        """
+        return f"{self.fingerprint}:{self.get_expected_title() or ''}"
 
     @property
     def isbn_meta(self):
-        if self.content_hash in META_CACHE:
-            return META_CACHE[self.content_hash]
-        isbns = self.get_isbn(multi=True)
-        if isbns:
-            data = None
-            for isbn in isbns:
-                for service in isbnlib._metadata.get_services().keys():
-                    try:
-                        data = isbnlib.meta(isbn, service=service)
-                    except isbnlib.dev._exceptions.ISBNNotConsistentError:
-                        logger.warning(f"ISBN is not consistent: {isbn}")
-                    except isbnlib._exceptions.NotValidISBNError:
-                        logger.warning(f"ISBN is not valid: {isbn}")
-                    except isbnlib.dev._exceptions.DataNotFoundAtServiceError:
-                        logger.warning(
-                            f"ISBN data not found at service ({service}): {isbn}"
-                        )
-                    except isbnlib.dev._exceptions.ISBNLibHTTPError:
-                        logger.warning(f"ISBNLib HTTP Error ({service}): {isbn}")
-                    else:
-                        if data:
-                            logger.debug(f"Found ISBNLib data ({isbn}): {data}")
-                            break
-
-                if data:
-                    break
-
-            if not data:
-                raise Exception("Could not get isbn meta")
-
-            META_CACHE[self.content_hash] = data
-        return META_CACHE[self.content_hash]
+        key = self.meta_key
+        data = META_CACHE.get("meta", key)
+        if data is MISSING:
+            isbns = self.get_isbn(multi=True)
+            complete = True
+            if isbns:
+                with stage("isbn_meta"):
+                    (_, data), complete = resolve_meta(
+                        isbns, deadline=self.lookup_deadline(), with_complete=True
+                    )
+            else:
+                # Nothing to look up, not the same as a lookup failing
+                data = {}
+            # A service being down isn't remembered as the book having none
+            if complete or data is not None:
+                META_CACHE.set("meta", key, data)
+
+        if data is None:
+            raise Exception("Could not get isbn meta")
+
+        return data
 
     def get_expected_title(self):
         if self._title:
@@ -68,87 +115,66 @@ class BasePDF:
 
         # Maybe check the first line of the second page too
 
-        filename = os.path.splitext(os.path.basename(self.pdf_path))[0]
-        filename = filename.replace("_", " ").lower()
-        filename_title = filename
-        # if by... remove by... to just get the title
-        # FIXME: if by is in the title this confuses things.
-        # Maybe see if there's a author name after the by
-        filename_title = re.sub("([- ]by[-: ].*)", "", filename_title)
-
-        content_title = ""
-        clean_content = self.pages[0].cleaned_text_content.lower()
-        found_idx = None
-        for idx, line in enumerate(clean_content.split("\n")):
-            if line.startswith("by:") or line.startswith("by ") or line == "by":
-                found_idx = idx
-
-        if found_idx is not None:
-            possible_title = "\n".join(clean_content.split("\n")[:found_idx]).strip()
-            logger.debug(f"Guessing the title from page content is: {possible_title}")
-            content_title = unicodedata.normalize("NFKD", possible_title.strip())
-
-        if difflib.SequenceMatcher(None, filename_title, content_title).ratio() > 0.4:
-            logger.debug("filename_title and content_title close enough")
-            return content_title
+        return guess_title(self.pdf_path, self.pages[0].cleaned_text_content)
 
     def get_isbn(self, multi=False):
+        namespace = "isbns" if multi else "isbn"
+        key = self.meta_key
+
+        result = META_CACHE.get(namespace, key)
+        if result is MISSING:
+            with stage("isbn_lookup"):
+                result, complete = self._find_isbn(multi=multi)
+            found = any(result) if multi else bool(result)
+            # Only what the services were all there to answer for is kept
+            if complete if multi else (found or complete):
+                META_CACHE.set(
+                    namespace,
+                    key,
+                    result,
+                    ttl=META_CACHE.ttl if found else META_CACHE.negative_ttl,
+                )
+
+        return result
+
+    def _find_isbn(self, multi=False):
+        """
+        :return: tuple of the isbn, or list of isbns if multi, and whether
+            the lookups all got an answer rather than hitting an outage or
+            running out of time
+        """
+        # Only the most likely few of the valid isbns in the book go online
+        candidates = scan_isbns([page.cleaned_text_content for page in self.pages])
+        candidates = candidates[:ISBN_LOOKUP_CANDIDATES]
+        logger.debug(f"ISBN candidates: {candidates}")
+
         if multi:
-            if self.content_hash in ISBNS_CACHE:
-                return ISBNS_CACHE[self.content_hash]
+            resolved, complete = resolve_all_meta(
+                candidates, deadline=self.lookup_deadline(), with_complete=True
+            )
+            isbns = [isbn for isbn, _ in resolved]
         else:
-            if self.content_hash in ISBN_CACHE:
-                return ISBN_CACHE[self.content_hash]
-
-        for page in self.pages:
-            isbn = get_isbn(page.cleaned_text_content)
-
-            for service in isbnlib._metadata.get_services().keys():
-                try:
-                    data = isbnlib.meta(isbn, service=service)
-                except isbnlib._exceptions.NotValidISBNError:
-                    logger.warning(f"ISBN is not valid: {isbn}")
-                else:
-                    if data:
-                        if multi:
-                            ISBNS_CACHE[self.content_hash].append(isbn)
-                            break
-                        else:
-                            ISBN_CACHE[self.content_hash] = isbn
-                            break
-
-        if not multi:
-            if self.content_hash in ISBN_CACHE:
-                return ISBN_CACHE[self.content_hash]
+            (isbn, _), complete = resolve_meta(
+                candidates, deadline=self.lookup_deadline(), with_complete=True
+            )
+            if isbn:
+                return isbn, True
 
         expected_title = self.get_expected_title()
         if expected_title:
             logger.info(f"Guessing the isbn from title: {expected_title}")
             if multi:
-                ISBNS_CACHE[self.content_hash].extend(isbns_from_words(expected_title))
+                isbns.extend(lookup_title_isbn(expected_title, multi=True))
             else:
-                ISBN_CACHE[self.content_hash] = isbnlib.isbn_from_words(expected_title)
+                return lookup_title_isbn(expected_title), complete
 
-        if multi:
-            if self.content_hash in ISBNS_CACHE:
-                return ISBNS_CACHE[self.content_hash]
-            else:
-                logger.warning("Could not get isbn")
-                ISBNS_CACHE[self.content_hash] = [
-                    get_isbn_from_content(self.pages[0].text_content)
-                ]
-                if ISBNS_CACHE[self.content_hash]:
-                    return ISBNS_CACHE[self.content_hash]
-        else:
-            if self.content_hash in ISBN_CACHE:
-                return ISBN_CACHE[self.content_hash]
-            else:
-                logger.warning("Could not get isbn")
-                ISBN_CACHE[self.content_hash] = get_isbn_from_content(
-                    self.pages[0].text_content
-                )
-                if ISBN_CACHE[self.content_hash]:
-                    return ISBN_CACHE[self.content_hash]
+        if multi and isbns:
+            return isbns, complete
+
+        logger.warning("Could not get isbn")
+        with stage("isbn_search"):
+            isbn = get_isbn_from_content(self.pages[0].text_content)
+        return ([isbn] if multi else isbn), complete
 
     def get_authors(self):
         isbn = self.get_isbn()
@@ -175,7 +201,8 @@ class BasePDF:
         isbns = self.get_isbn(multi=True)
         isbns = [isbn for isbn in isbns if isbn] if isbns else []
         for isbn in isbns:
-            thumbnail_url = get_thumbnail_url_from_isbn(isbn)
+            with stage("thumbnail_url"):
+                thumbnail_url = lookup_thumbnail_url(isbn)
             if thumbnail_url:
                 return thumbnail_url
 
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import traceback
+import multiprocessing
+from functools import partial
+from collections import namedtuple
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+
+from pdf2ebook import logger
+from pdf2ebook.cache import META_CACHE, RESULT_CACHE
+from pdf2ebook.instrumentation import REPORT, stage
+from pdf2ebook.base_pdf import guess_title
+from pdf2ebook.isbn_scanner import scan_isbns
+from pdf2ebook import extract, network
+from pdf2ebook.extract import get_page_count, extract_pages_text
+from pdf2ebook.metadata import (
+    resolve_all_meta,
+    lookup_title_isbn,
+    lookup_thumbnail_url,
+    prefetch_lookups,
+)
+from pdf2ebook.constants import (
+    EXTRACT_WORKERS,
+    ISBN_FRONT_PAGES,
+    ISBN_BACK_PAGES,
+    ISBN_LOOKUP_CANDIDATES,
+    META_PREFETCH_DEADLINE,
+)
+from pdf2ebook.utils import is_local_htmlex_ok, is_docker_installed, remove_page_no
+
+
+Job = namedtuple("Job", ["in_file", "out_file", "title"])
+JobResult = namedtuple(
+    "JobResult", ["in_file", "out_file", "ok", "error", "report"], defaults=[None]
+)
+
+
+def convert(
+    in_file,
+    out_file,
+    force_html_ex=None,
+    force_html=None,
+    force_text=None,
+    title=None,
+    htmlex_ok=None,
+    use_cache=True,
+):
+    # Imported here so spawned workers only pay for the backends on first use
+    from pdf2ebook.pdf import PDF
+    from pdf2ebook.htmlex_pdf import HTMLEX_PDF
+
+    if htmlex_ok is None:
+        htmlex_ok = is_local_htmlex_ok() or is_docker_installed()
+
+    use_html_ex = bool(
+        force_html_ex or (htmlex_ok and not force_html and not force_text)
+    )
+
+    if use_cache:
+        key = RESULT_CACHE.key(
+            in_file,
+            {
+                "html_ex": use_html_ex,
+                "force_html": force_html,
+                "force_text": force_text,
+                "title": title,
+            },
+        )
+        if RESULT_CACHE.get(key, out_file):
+            logger.info(f"Using cached conversion of {in_file}")
+            return out_file
+
+    if use_html_ex:
+        pdf = HTMLEX_PDF(
+            path=in_file,
+            title=title,
+        )
+        pdf.to_epub(path=out_file)
+    else:
+        logger.warning("Not using pdf2epubEX which is recommended")
+        pdf = PDF(
+            path=in_file,
+            use_html_ex=force_html_ex,
+            use_html=force_html,
+            use_text=force_text,
+            title=title,
+        )
+        pdf.to_epub(path=out_file)
+
+    if use_cache and os.path.exists(out_file):
+        RESULT_CACHE.put(key, out_file)
+
+    return out_file
+
+
+def jobs_from_dir(in_dir, out_dir):
+    jobs = []
+    for filename in sorted(os.listdir(in_dir)):
+        if not filename.lower().endswith(".pdf"):
+            continue
+        jobs.append(
+            Job(
+                os.path.abspath(os.path.join(in_dir, filename)),
+                os.path.abspath(
+                    os.path.join(out_dir, os.path.splitext(filename)[0] + ".epub")
+                ),
+                None,
+            )
+        )
+    return jobs
+
+
+def jobs_from_manifest(manifest, out_dir):
+    """
+    One book per line, either a plain path to a pdf or a json object
+    with "in" and optionally "out" and "title"
+    """
+    jobs = []
+    with open(manifest, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            if line.startswith("{"):
+                data = json.loads(line)
+            else:
+                data = {"in": line}
+
+            in_file = os.path.abspath(data["in"])
+            out_file = data.get("out", None) or os.path.join(
+                out_dir,
+                os.path.splitext(os.path.basename(in_file))[0] + ".epub",
+            )
+            jobs.append(Job(in_file, os.path.abspath(out_file), data.get("title")))
+    return jobs
+
+
+def book_report(job):
+    return {"in_file": job.in_file, "out_file": job.out_file, **REPORT.as_dict()}
+
+
+def init_worker(workers):
+    """
+    Set up a batch worker process, the cpus are shared by the workers so
+    each extracts over fewer page ranges at once
+    """
+    network.install()
+    extract.set_workers(EXTRACT_WORKERS // workers)
+
+
+def run_job(job, options):
+    """
+    Convert a job, what went wrong and the report of how it went are
+    returned rather than raised
+    """
+    REPORT.reset()
+    try:
+        with stage("convert"):
+            convert(job.in_file, job.out_file, title=job.title, **options)
+    except Exception as ex:
+        return JobResult(
+            job.in_file,
+            job.out_file,
+            False,
+            f"{ex}\n{traceback.format_exc()}",
+            book_report(job),
+        )
+    return JobResult(job.in_file, job.out_file, True, None, book_report(job))
+
+
+def scan_book(job):
+    """
+    Likely isbns of a pdf, best first, and the title it is expected to
+    have, from a quick look at its front and back pages as its conversion
+    would find them
+    """
+    page_count = get_page_count(job.in_file)
+    if not page_count:
+        return [], job.title
+
+    front = extract_pages_text(job.in_file, 1, min(ISBN_FRONT_PAGES, page_count))
+    back_first = max(ISBN_FRONT_PAGES + 1, page_count - ISBN_BACK_PAGES + 1)
+    back = None
+    if back_first <= page_count:
+        back = extract_pages_text(job.in_file, back_first, page_count)
+    front, back = front or [], back or []
+
+    title = job.title
+    if not title and front:
+        title = guess_title(job.in_file, remove_page_no(front[0]))
+
+    # Blanks for the pages between so the back pages count as the back
+    pages = front + [""] * (page_count - len(front) - len(back)) + back
+    return scan_isbns(pages)[:ISBN_LOOKUP_CANDIDATES], title
+
+
+def scan_books(jobs, deadline):
+    """
+    scan_book every job at once, ones not done by the deadline are taken
+    to have nothing
+    """
+    executor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS)
+    try:
+        futures = [executor.submit(scan_book, job) for job in jobs]
+        wait(futures, timeout=deadline)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    books = []
+    for job, future in zip(jobs, futures):
+        if future.done() and not future.cancelled() and not future.exception():
+            books.append(future.result())
+        else:
+            books.append(([], job.title))
+    return books
+
+
+def prefetch_metadata(jobs, deadline=META_PREFETCH_DEADLINE):
+    """
+    Look up the metadata of every book of a batch before converting any,
+    each isbn / title once however many books share it. The conversions
+    then find it in META_CACHE
+
+    Titles are looked up as the conversions would, every isbn google has
+    for each and isbnlib's guess for books no isbn was found for, and then
+    the metadata of the isbns they turned up
+    """
+    end = time.monotonic() + deadline
+
+    def remaining():
+        return max(end - time.monotonic(), 0)
+
+    books = scan_books(jobs, remaining())
+    isbns = list(dict.fromkeys(isbn for book_isbns, _ in books for isbn in book_isbns))
+    found = dict(resolve_all_meta(isbns, deadline=remaining()))
+
+    titles = [title for _, title in books if title]
+    untitled = [
+        title
+        for book_isbns, title in books
+        if title and not any(isbn in found for isbn in book_isbns)
+    ]
+    title_isbns = []
+    for result in prefetch_lookups(
+        partial(lookup_title_isbn, multi=True), titles, deadline=remaining()
+    ).values():
+        title_isbns.extend(result or [])
+    title_isbns.extend(
+        prefetch_lookups(lookup_title_isbn, untitled, deadline=remaining()).values()
+    )
+    title_isbns = [
+        isbn for isbn in dict.fromkeys(title_isbns) if isbn and isbn not in isbns
+    ]
+    found.update(resolve_all_meta(title_isbns, deadline=remaining()))
+
+    prefetch_lookups(lookup_thumbnail_url, found, deadline=remaining())
+
+    logger.info(
+        f"Prefetched metadata of {len(found)}/{len(isbns) + len(title_isbns)} "
+        f"isbns and {len(set(titles))} titles for {len(jobs)} books"
+    )
+
+
+def run_batch(jobs, workers=None, prefetch=True, **options):
+    """
+    Convert jobs over a pool of worker processes, a failing book is
+    reported and does not stop the rest of the batch
+
+    :param prefetch: look up the metadata of every book first, see
+        prefetch_metadata
+    """
+    workers = workers or os.cpu_count() or 1
+    options.setdefault("htmlex_ok", is_local_htmlex_ok() or is_docker_installed())
+
+    for job in jobs:
+        os.makedirs(os.path.dirname(job.out_file), exist_ok=True)
+
+    # Before the lookups so the cache doesn't grow run after run
+    META_CACHE.purge_expired()
+
+    if prefetch:
+        try:
+            prefetch_metadata(jobs)
+        except Exception as ex:
+            logger.warning(f"Could not prefetch metadata: {ex}")
+
+    logger.info(f"Converting {len(jobs)} books with {workers} workers")
+
+    results = []
+    # spawn so every worker gets its own module level state (workspaces, caches)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(workers,),
+    ) as executor:
+        futures = {executor.submit(run_job, job, options): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as ex:
+                # The worker itself died, not just the conversion
+                result = JobResult(job.in_file, job.out_file, False, str(ex))
+
+            if result.ok:
+                logger.info(f"Converted: {result.in_file} -> {result.out_file}")
+            else:
+                logger.error(f"Failed to convert: {result.in_file}: {result.error}")
+            results.append(result)
+
+    failed = [result for result in results if not result.ok]
+    logger.info(f"Converted {len(results) - len(failed)}/{len(results)} books")
+
+    return results
@@ -0,0 +1,32 @@
+import argparse
+
+from pdf2ebook import logger
+from pdf2ebook.catalog import Catalog, read_records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="build a local catalog of books to look up isbns and metadata in"
+    )
+    parser.add_argument(
+        "dumps",
+        nargs="+",
+        help=".jsonl or .csv files of books with isbn, title, authors, publisher and year",
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        dest="out_file",
+        required=True,
+        help="sqlite file to add the books to, point PDF2EBOOK_CATALOG at it to use it",
+    )
+    args = parser.parse_args()
+
+    catalog = Catalog(args.out_file)
+    for dump in args.dumps:
+        added, skipped = catalog.add(read_records(dump))
+        logger.info(f"Added {added} books from {dump}, skipped {skipped}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,48 @@
+import sys
 import argparse
 
-from pdf2ebook import logger
+from pdf2ebook import logger, network
 
-from pdf2ebook.utils import is_local_htmlex_ok, is_docker_installed
-from pdf2ebook.pdf import PDF
-from pdf2ebook.htmlex_pdf import HTMLEX_PDF
+from pdf2ebook.batch import (
+    Job,
+    run_job,
+    run_batch,
+    jobs_from_dir,
+    jobs_from_manifest,
+)
+from pdf2ebook.instrumentation import write_report
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--in", type=str, dest="in_file", required=True)
-    parser.add_argument("--out", type=str, dest="out_file", required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--in", type=str, dest="in_file")
+    source.add_argument(
+        "--in-dir",
+        type=str,
+        dest="in_dir",
+        help="convert every pdf in this directory",
+    )
+    source.add_argument(
+        "--manifest",
+        type=str,
+        dest="manifest",
+        help="file listing the pdfs to convert, one path or json object per line",
+    )
+    parser.add_argument("--out", type=str, dest="out_file")
+    parser.add_argument(
+        "--out-dir",
+        type=str,
+        dest="out_dir",
+        help="where to write the epubs of a batch conversion",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        dest="workers",
+        default=None,
+        help="number of books to convert at once, defaults to the number of cores",
+    )
     parser.add_argument(
         "--force-html-ex",
         action="store_true",
@@ -32,34 +64,71 @@ def main():
         dest="title",
         help="title of the book to get metadata from the internet / set metadata on the ebook",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        dest="no_cache",
+        help="convert even if the same pdf was already converted with the same options",
+    )
+    parser.add_argument(
+        "--no-prefetch",
+        action="store_true",
+        dest="no_prefetch",
+        help="don't look up the metadata of every book of a batch before converting them",
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        dest="report",
+        help="write how long each stage took, memory used and cache hits to this json file",
+    )
     args = parser.parse_args()
 
+    network.install()
+
     if not args.force_text:
         args.force_text = None
 
     if not args.force_html:
         args.force_html = None
 
-    if args.force_html_ex or (
-        (is_local_htmlex_ok() or is_docker_installed())
-        and not args.force_html
-        and not args.force_text
-    ):
-        pdf = HTMLEX_PDF(
-            path=args.in_file,
-            title=args.title,
-        )
-        pdf.to_epub(path=args.out_file)
+    options = {
+        "force_html_ex": args.force_html_ex,
+        "force_html": args.force_html,
+        "force_text": args.force_text,
+        "use_cache": not args.no_cache,
+    }
+
+    if args.in_file:
+        if not args.out_file:
+            parser.error("--out is required with --in")
+        result = run_job(Job(args.in_file, args.out_file, args.title), options)
+        if args.report:
+            write_report(args.report, result.report)
+        if not result.ok:
+            logger.error(f"Failed to convert: {result.in_file}: {result.error}")
+            sys.exit(1)
+        return
+
+    if not args.out_dir:
+        parser.error("--out-dir is required with --in-dir / --manifest")
+
+    if args.in_dir:
+        jobs = jobs_from_dir(args.in_dir, args.out_dir)
     else:
-        logger.warning("Not using pdf2epubEX which is recommended")
-        pdf = PDF(
-            path=args.in_file,
-            use_html_ex=args.force_html_ex,
-            use_html=args.force_html,
-            use_text=args.force_text,
-            title=args.title,
-        )
-        pdf.to_epub(path=args.out_file)
+        jobs = jobs_from_manifest(args.manifest, args.out_dir)
+
+    if not jobs:
+        logger.warning("Nothing to convert")
+        return
+
+    results = run_batch(
+        jobs, workers=args.workers, prefetch=not args.no_prefetch, **options
+    )
+    if args.report:
+        write_report(args.report, {"books": [result.report for result in results]})
+    if not all(result.ok for result in results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
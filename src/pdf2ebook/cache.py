@@ -0,0 +1,350 @@
+import os
+import json
+import gzip
+import time
+import shutil
+import sqlite3
+import hashlib
+import tarfile
+import tempfile
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from pdf2ebook import logger
+from pdf2ebook.constants import (
+    CACHE_DIR,
+    META_CACHE_TTL,
+    META_CACHE_NEGATIVE_TTL,
+    RESULT_CACHE_MAX_SIZE,
+    ARTIFACT_CACHE_MAX_SIZE,
+)
+from pdf2ebook.utils import file_digest
+from pdf2ebook.instrumentation import count
+
+
+MISSING = object()
+
+
+class MetaCache:
+    """
+    Persistent store for isbn / metadata lookups so they survive between runs
+
+    Values are json, a value of None is a "not found" and is kept for
+    negative_ttl rather than ttl
+    """
+
+    def __init__(
+        self, path=None, ttl=META_CACHE_TTL, negative_ttl=META_CACHE_NEGATIVE_TTL
+    ):
+        self.path = path or os.path.join(CACHE_DIR, "meta.sqlite3")
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        # sqlite connections can't be carried over a fork
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS meta (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    expires REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )"""
+            )
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, namespace, key, default=MISSING):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value, expires FROM meta WHERE namespace = ? AND key = ?",
+                (namespace, str(key)),
+            ).fetchone()
+
+        if row is None or row[1] < time.time():
+            count(f"meta_cache.{namespace}.misses")
+            return default
+
+        count(f"meta_cache.{namespace}.hits")
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl if value else self.negative_ttl
+
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (namespace, str(key), json.dumps(value), time.time() + ttl),
+            )
+            self.connection.commit()
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self.connection.execute(
+                "DELETE FROM meta WHERE namespace = ? AND key = ?",
+                (namespace, str(key)),
+            )
+            self.connection.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self.connection.execute("DELETE FROM meta WHERE expires < ?", (time.time(),))
+            self.connection.commit()
+
+
+META_CACHE = MetaCache()
+
+
+def get_version():
+    try:
+        from importlib.metadata import version
+
+        return version("pdf2ebook")
+    except Exception:
+        return "unknown"
+
+
+class FileCache:
+    """
+    Files under path named by key, using an entry bumps its mtime and the
+    least recently used entries are evicted once the cache is over
+    max_size bytes
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+    def entry_path(self, key, suffix):
+        return os.path.join(self.path, key[:2], f"{key}{suffix}")
+
+    def touch(self, entry):
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            # evicted by another process since it was read, what was read is fine
+            pass
+
+    def write_entry(self, entry, write):
+        """
+        Call write(path) to fill in the entry under a temporary name and
+        move it into place so nothing reads half an entry
+        """
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry), suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, entry)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for root, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries())
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            logger.debug(f"Evicting cached file: {path}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+
+class ResultCache(FileCache):
+    """
+    Converted epubs keyed by the digest of the pdf, the options it was
+    converted with and the version of pdf2ebook that did it
+    """
+
+    def __init__(self, path=None, max_size=RESULT_CACHE_MAX_SIZE):
+        super().__init__(path or os.path.join(CACHE_DIR, "results"), max_size)
+
+    def key(self, in_file, options):
+        data = json.dumps(
+            {
+                "digest": file_digest(in_file),
+                "options": options,
+                "version": get_version(),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key, out_file):
+        """
+        Copy the cached epub for key to out_file
+
+        :return: whether there was one
+        """
+        entry = self.entry_path(key, ".epub")
+        try:
+            shutil.copyfile(entry, out_file)
+        except FileNotFoundError:
+            count("result_cache.misses")
+            return False
+
+        count("result_cache.hits")
+        self.touch(entry)
+        return True
+
+    def put(self, key, out_file):
+        self.write_entry(
+            self.entry_path(key, ".epub"),
+            lambda path: shutil.copyfile(out_file, path),
+        )
+
+
+def compressed_open(path, mode, suffix):
+    """
+    Open a file compressed as suffix, .zst or .gz, for reading / writing bytes
+    """
+    if suffix == ".zst":
+        if mode == "rb":
+            return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+    return gzip.open(path, mode, compresslevel=6)
+
+
+class ArtifactCache(FileCache):
+    """
+    Compressed output of the extraction tools keyed by the digest of the
+    pdf, the tool, its version and its arguments, so changes to everything
+    after extraction don't have to wait on the tools again
+
+    zstd if zstandard is installed, gzip otherwise
+    """
+
+    def __init__(self, path=None, max_size=ARTIFACT_CACHE_MAX_SIZE):
+        super().__init__(path or os.path.join(CACHE_DIR, "artifacts"), max_size)
+        self.suffix = ".zst" if zstandard else ".gz"
+
+    def key(self, pdf_path, tool, version, args):
+        data = json.dumps(
+            {
+                "digest": file_digest(pdf_path),
+                "tool": tool,
+                "version": version,
+                "args": args,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def find_entry(self, key):
+        # Either compression, so entries outlive zstandard being installed
+        for suffix in (".zst", ".gz") if zstandard else (".gz",):
+            entry = self.entry_path(key, suffix)
+            if os.path.exists(entry):
+                count("artifact_cache.hits")
+                return entry
+        count("artifact_cache.misses")
+
+    def get_text(self, key):
+        entry = self.find_entry(key)
+        if entry is None:
+            return None
+
+        try:
+            with compressed_open(entry, "rb", os.path.splitext(entry)[1]) as f:
+                text = f.read().decode("utf-8", "surrogatepass")
+        except FileNotFoundError:
+            return None
+
+        self.touch(entry)
+        return text
+
+    def put_text(self, key, text):
+        def write(path):
+            with compressed_open(path, "wb", self.suffix) as f:
+                f.write(text.encode("utf-8", "surrogatepass"))
+
+        self.write_entry(self.entry_path(key, self.suffix), write)
+
+    def get_dir(self, key, dest_dir):
+        """
+        Extract the files stored for key into dest_dir
+
+        :return: the directory they were stored from, or None if there
+            were none stored
+        """
+        entry = self.find_entry(key)
+        if entry is None:
+            return None
+
+        try:
+            with compressed_open(entry, "rb", os.path.splitext(entry)[1]) as f:
+                with tarfile.open(fileobj=f, mode="r|") as tar:
+                    source_dir = tar.pax_headers.get("pdf2ebook.dir")
+                    for member in tar:
+                        # Only ever plain files directly in the directory
+                        if not member.isfile() or "/" in member.name:
+                            continue
+                        with open(os.path.join(dest_dir, member.name), "wb") as out:
+                            shutil.copyfileobj(tar.extractfile(member), out)
+        except FileNotFoundError:
+            return None
+
+        self.touch(entry)
+        return source_dir
+
+    def put_dir(self, key, src_dir, exclude=()):
+        """
+        Store the files directly in src_dir, bar the names in exclude
+        """
+
+        def write(path):
+            with compressed_open(path, "wb", self.suffix) as f:
+                with tarfile.open(
+                    fileobj=f,
+                    mode="w|",
+                    format=tarfile.PAX_FORMAT,
+                    pax_headers={"pdf2ebook.dir": src_dir},
+                ) as tar:
+                    for name in sorted(os.listdir(src_dir)):
+                        src_path = os.path.join(src_dir, name)
+                        if name in exclude or not os.path.isfile(src_path):
+                            continue
+                        tar.add(src_path, arcname=name)
+
+        self.write_entry(self.entry_path(key, self.suffix), write)
+
+
+RESULT_CACHE = ResultCache()
+ARTIFACT_CACHE = ArtifactCache()
@@ -0,0 +1,203 @@
+import os
+import re
+import csv
+import json
+import sqlite3
+import difflib
+import threading
+import unicodedata
+
+import isbnlib
+
+from pdf2ebook import logger
+from pdf2ebook.constants import CATALOG_PATH, CATALOG_MIN_SIMILARITY
+
+# Most full text matches of a title to compare with it
+SEARCH_CANDIDATES = 20
+
+
+def normalise_title(title):
+    title = unicodedata.normalize("NFKD", title or "").lower()
+    return " ".join(re.findall(r"\w+", title))
+
+
+def normalise_isbn(isbn):
+    isbn = isbnlib.canonical(str(isbn or ""))
+    if isbnlib.is_isbn10(isbn):
+        return isbnlib.to_isbn13(isbn)
+    if isbnlib.is_isbn13(isbn):
+        return isbn
+    return None
+
+
+def normalise_authors(authors):
+    # a list in json, ; separated in csv
+    if isinstance(authors, str):
+        authors = authors.split(";")
+    return [str(author).strip() for author in authors or [] if str(author).strip()]
+
+
+def read_records(path):
+    """
+    Books of a .jsonl or .csv dump, each with isbn, title and optionally
+    authors, publisher and year
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+        return
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class Catalog:
+    """
+    Local index of books so isbns and titles can be looked up in
+    milliseconds with no network, metadata is in the shape isbnlib.meta
+    gives it
+
+    Titles are searched with sqlite's full text search (fts5) if it has
+    it, LIKE otherwise, and the best few compared with difflib
+    """
+
+    def __init__(self, path, use_fts=True, min_similarity=CATALOG_MIN_SIMILARITY):
+        self.path = path
+        self.use_fts = use_fts
+        self.min_similarity = min_similarity
+
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    @property
+    def connection(self):
+        # sqlite connections can't be carried over a fork
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS books (
+                    isbn TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    normalised_title TEXT NOT NULL,
+                    authors TEXT NOT NULL,
+                    publisher TEXT,
+                    year TEXT
+                )""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS books_title ON books (normalised_title)"
+            )
+            if self.use_fts:
+                try:
+                    self._connection.execute(
+                        """CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+                            normalised_title, content='books', content_rowid='rowid'
+                        )"""
+                    )
+                except sqlite3.OperationalError:
+                    logger.warning("sqlite has no fts5, searching titles with LIKE")
+                    self.use_fts = False
+            self._connection.commit()
+            self._pid = os.getpid()
+        return self._connection
+
+    def add(self, records):
+        """
+        :return: tuple of how many records were added and skipped for not
+            having a valid isbn or a title
+        """
+        rows = []
+        skipped = 0
+        for record in records:
+            isbn = normalise_isbn(record.get("isbn"))
+            title = (record.get("title") or "").strip()
+            if not isbn or not title:
+                skipped += 1
+                continue
+            rows.append(
+                (
+                    isbn,
+                    title,
+                    normalise_title(title),
+                    json.dumps(normalise_authors(record.get("authors"))),
+                    record.get("publisher") or None,
+                    str(record.get("year") or "") or None,
+                )
+            )
+
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            if self.use_fts:
+                self.connection.execute(
+                    "INSERT INTO books_fts(books_fts) VALUES ('rebuild')"
+                )
+            self.connection.commit()
+        return len(rows), skipped
+
+    def meta(self, isbn):
+        isbn = normalise_isbn(isbn)
+        if not isbn:
+            return None
+
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT title, authors, publisher, year FROM books WHERE isbn = ?",
+                (isbn,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        title, authors, publisher, year = row
+        return {
+            "ISBN-13": isbn,
+            "Title": title,
+            "Authors": json.loads(authors),
+            "Publisher": publisher or "",
+            "Year": year or "",
+            "Language": "",
+        }
+
+    def candidates(self, words):
+        with self._lock:
+            if self.use_fts:
+                return self.connection.execute(
+                    """SELECT books.isbn, books.normalised_title
+                    FROM books_fts JOIN books ON books.rowid = books_fts.rowid
+                    WHERE books_fts MATCH ? ORDER BY rank LIMIT ?""",
+                    (" OR ".join(f'"{word}"' for word in words), SEARCH_CANDIDATES),
+                ).fetchall()
+
+            # The longest words are the least likely to be in every title
+            words = sorted(words, key=len, reverse=True)[:3]
+            return self.connection.execute(
+                "SELECT isbn, normalised_title FROM books WHERE "
+                + " OR ".join(["normalised_title LIKE ?"] * len(words))
+                + " LIMIT ?",
+                (*(f"%{word}%" for word in words), SEARCH_CANDIDATES),
+            ).fetchall()
+
+    def search(self, title):
+        """
+        :return: list of the isbns of books with a title close enough to
+            title, closest first
+        """
+        title = normalise_title(title)
+        if not title:
+            return []
+
+        scored = []
+        for isbn, candidate in self.candidates(title.split()):
+            ratio = difflib.SequenceMatcher(None, title, candidate).ratio()
+            if ratio >= self.min_similarity:
+                scored.append((-ratio, isbn))
+        return [isbn for _, isbn in sorted(scored)]
+
+
+CATALOG = Catalog(CATALOG_PATH) if CATALOG_PATH else None
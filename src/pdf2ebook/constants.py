@@ -5,3 +5,87 @@ LOG_LOCATION = (
     if os.getenv("TEST_ENV", "False") == "False"
     else "/tmp/log/pdf2ebook/pdf2ebook.log"
 )
+
+CACHE_DIR = os.getenv(
+    "PDF2EBOOK_CACHE_DIR",
+    os.path.expanduser("~/.cache/pdf2ebook")
+    if os.getenv("TEST_ENV", "False") == "False"
+    else "/tmp/cache/pdf2ebook",
+)
+
+# seconds to keep found / not found metadata for
+META_CACHE_TTL = int(os.getenv("PDF2EBOOK_META_CACHE_TTL", 60 * 60 * 24 * 30))
+META_CACHE_NEGATIVE_TTL = int(
+    os.getenv("PDF2EBOOK_META_CACHE_NEGATIVE_TTL", 60 * 60 * 24)
+)
+
+# Converted epubs are kept for the same pdf + options, oldest used go past this
+RESULT_CACHE_MAX_SIZE = int(
+    os.getenv("PDF2EBOOK_RESULT_CACHE_MAX_SIZE", 1024 * 1024 * 1024)
+)
+
+# Compressed pdftotext / pdftohtml / pdf2htmlEX output kept for the same pdf
+ARTIFACT_CACHE_MAX_SIZE = int(
+    os.getenv("PDF2EBOOK_ARTIFACT_CACHE_MAX_SIZE", 4 * 1024 * 1024 * 1024)
+)
+
+# Most isbnlib requests to have in flight at once and how many seconds a
+# book gets to find its metadata
+META_LOOKUP_WORKERS = int(os.getenv("PDF2EBOOK_META_LOOKUP_WORKERS", 16))
+META_LOOKUP_DEADLINE = float(os.getenv("PDF2EBOOK_META_LOOKUP_DEADLINE", 30))
+# Seconds a batch gets to look up the metadata of all its books before
+# converting them, whatever isn't found by then is left to the conversions
+META_PREFETCH_DEADLINE = float(os.getenv("PDF2EBOOK_META_PREFETCH_DEADLINE", 120))
+
+# Most isbns found in the text of a book to look up, best candidates first
+ISBN_LOOKUP_CANDIDATES = int(os.getenv("PDF2EBOOK_ISBN_LOOKUP_CANDIDATES", 3))
+# Pages at the start / end of a book that count as front / back matter
+ISBN_FRONT_PAGES = int(os.getenv("PDF2EBOOK_ISBN_FRONT_PAGES", 10))
+ISBN_BACK_PAGES = int(os.getenv("PDF2EBOOK_ISBN_BACK_PAGES", 5))
+
+# sqlite catalog of books (see pdf2ebook-catalog) to look isbns / titles up in
+# before the network, and how close a title has to be to count as the same
+CATALOG_PATH = os.getenv("PDF2EBOOK_CATALOG", None)
+CATALOG_MIN_SIMILARITY = float(os.getenv("PDF2EBOOK_CATALOG_MIN_SIMILARITY", 0.8))
+
+# Fetching search results to find an isbn in when nothing else worked,
+# seconds per request / for all of them and the most of a page to read
+ISBN_SEARCH_WORKERS = int(os.getenv("PDF2EBOOK_ISBN_SEARCH_WORKERS", 5))
+ISBN_SEARCH_TIMEOUT = float(os.getenv("PDF2EBOOK_ISBN_SEARCH_TIMEOUT", 10))
+ISBN_SEARCH_DEADLINE = float(os.getenv("PDF2EBOOK_ISBN_SEARCH_DEADLINE", 30))
+ISBN_SEARCH_MAX_BYTES = int(
+    os.getenv("PDF2EBOOK_ISBN_SEARCH_MAX_BYTES", 2 * 1024 * 1024)
+)
+
+# http(s) requests share kept alive connections per host, made at most
+# NETWORK_HOST_RATE a second. Failing requests are retried with backoff
+# and a host that keeps failing is skipped for a while
+NETWORK_POOLING = os.getenv("PDF2EBOOK_NETWORK_POOLING", "True") == "True"
+NETWORK_TIMEOUT = float(os.getenv("PDF2EBOOK_NETWORK_TIMEOUT", 30))
+NETWORK_POOL_SIZE = int(os.getenv("PDF2EBOOK_NETWORK_POOL_SIZE", 4))
+NETWORK_HOST_RATE = float(os.getenv("PDF2EBOOK_NETWORK_HOST_RATE", 5))
+NETWORK_RETRIES = int(os.getenv("PDF2EBOOK_NETWORK_RETRIES", 2))
+NETWORK_BACKOFF = float(os.getenv("PDF2EBOOK_NETWORK_BACKOFF", 0.5))
+NETWORK_BREAKER_FAILURES = int(os.getenv("PDF2EBOOK_NETWORK_BREAKER_FAILURES", 5))
+NETWORK_BREAKER_COOLDOWN = float(
+    os.getenv("PDF2EBOOK_NETWORK_BREAKER_COOLDOWN", 60)
+)
+
+# BeautifulSoup parser for html pages, "lxml" is a good bit faster if installed
+HTML_PARSER = os.getenv("PDF2EBOOK_HTML_PARSER", "html.parser")
+
+# pdftotext / pdftohtml are run over page ranges at once for big pdfs
+EXTRACT_WORKERS = int(os.getenv("PDF2EBOOK_EXTRACT_WORKERS", os.cpu_count() or 1))
+MIN_PAGES_PER_SHARD = int(os.getenv("PDF2EBOOK_MIN_PAGES_PER_SHARD", 50))
+
+# Where working files go, in a pdf2ebook dir under it, e.g. /dev/shm.
+# Defaults to the system temp dir
+SCRATCH_ROOT = os.getenv("PDF2EBOOK_SCRATCH_ROOT", None)
+
+# pdf2htmlEX runs at once per process, as local processes or warm docker containers
+HTMLEX_WORKERS = int(os.getenv("PDF2EBOOK_HTMLEX_WORKERS", 1))
+HTMLEX_IMAGE = os.getenv("PDF2EBOOK_HTMLEX_IMAGE", "bwits/pdf2htmlex")
+
+# zlib level for everything but the mimetype in an epub, 0 stores them
+# uncompressed
+EPUB_COMPRESSLEVEL = int(os.getenv("PDF2EBOOK_EPUB_COMPRESSLEVEL", 9))
@@ -0,0 +1,87 @@
+import os
+import uuid
+import zipfile
+
+from pdf2ebook import logger
+from pdf2ebook.constants import EPUB_COMPRESSLEVEL
+
+MIMETYPE = "application/epub+zip"
+
+
+class EpubPackager:
+    """
+    Writes an epub straight into its zip, the mimetype first and stored as
+    the spec needs, then every other entry from memory or from where the
+    file already is
+
+    Use as a context manager. The archive is written next to path and
+    only moved to it once complete, if anything goes wrong it's removed
+    and whatever was at path is left be
+    """
+
+    def __init__(self, path, compresslevel=EPUB_COMPRESSLEVEL):
+        self.path = path
+        # zlib level 0 still deflates, store rather than pay for that
+        if compresslevel:
+            self.compress_type = zipfile.ZIP_DEFLATED
+            self.compresslevel = compresslevel
+        else:
+            self.compress_type = zipfile.ZIP_STORED
+            self.compresslevel = None
+        self._zip = None
+        self._tmp_path = None
+
+    def __enter__(self):
+        directory, filename = os.path.split(os.path.abspath(self.path))
+        self._tmp_path = os.path.join(directory, f".{filename}.{uuid.uuid4().hex}.tmp")
+        self._zip = zipfile.ZipFile(self._tmp_path, "w")
+        try:
+            self._zip.writestr(
+                zipfile.ZipInfo("mimetype", date_time=(1980, 1, 1, 0, 0, 0)),
+                MIMETYPE,
+                compress_type=zipfile.ZIP_STORED,
+            )
+        except Exception:
+            self._discard()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._discard()
+            return
+
+        try:
+            self._zip.close()
+        except Exception:
+            self._discard()
+            raise
+        self._zip = None
+        os.replace(self._tmp_path, self.path)
+
+    def _discard(self):
+        try:
+            self._zip.close()
+        except Exception:
+            pass
+        self._zip = None
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+    def add_bytes(self, name, data):
+        logger.debug(f"Add: {name}")
+        self._zip.writestr(
+            name,
+            data,
+            compress_type=self.compress_type,
+            compresslevel=self.compresslevel,
+        )
+
+    def add_file(self, name, path):
+        logger.debug(f"Add: {path} -> {name}")
+        self._zip.write(
+            path,
+            name,
+            compress_type=self.compress_type,
+            compresslevel=self.compresslevel,
+        )
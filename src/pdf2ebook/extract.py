@@ -0,0 +1,278 @@
+import io
+import os
+import re
+import subprocess
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf2ebook import logger
+from pdf2ebook.cache import ARTIFACT_CACHE
+from pdf2ebook.instrumentation import stage
+from pdf2ebook.constants import EXTRACT_WORKERS, MIN_PAGES_PER_SHARD
+
+
+@lru_cache(maxsize=None)
+def tool_version(tool):
+    """
+    First line of what tool -v says, poppler tools say it on stderr
+    """
+    try:
+        output = subprocess.run(
+            [tool, "-v"], capture_output=True, text=True, errors="replace"
+        )
+    except FileNotFoundError:
+        return None
+
+    lines = (output.stdout + output.stderr).strip().splitlines()
+    return lines[0] if lines else None
+
+
+def get_page_count(pdf_path):
+    try:
+        output = subprocess.run(
+            ["pdfinfo", pdf_path], capture_output=True, text=True, errors="replace"
+        ).stdout
+    except FileNotFoundError:
+        logger.warning("pdfinfo is not installed, can't split up extraction")
+        return None
+
+    match = re.search(r"^Pages:\s+(\d+)", output, re.MULTILINE)
+    if match:
+        return int(match.group(1))
+
+
+# How many page ranges of a pdf are extracted at once, fewer in a batch
+# worker process as the other workers want the cpus too, see set_workers
+_workers = EXTRACT_WORKERS
+
+
+def set_workers(count):
+    global _workers
+    _workers = max(1, count)
+
+
+def page_ranges(page_count, workers=None, min_pages=MIN_PAGES_PER_SHARD):
+    """
+    Contiguous, 1 indexed, inclusive (first, last) ranges covering every page
+
+    :param workers: most ranges to split into, see set_workers if None
+    """
+    workers = workers or _workers
+    shards = max(1, min(workers, page_count // max(min_pages, 1)))
+    size = -(-page_count // shards)
+    return [
+        (first, min(first + size - 1, page_count))
+        for first in range(1, page_count + 1, size)
+    ]
+
+
+def run(args):
+    try:
+        subprocess.run(args)
+    except FileNotFoundError:
+        logger.error(f"{args[0]} is not installed")
+
+
+def range_args(first, last):
+    if first is None:
+        return []
+    return ["-f", str(first), "-l", str(last)]
+
+
+def extract_pages_text(pdf_path, first, last):
+    """
+    pdftotext just pages first to last (1 indexed, inclusive), for a quick
+    look at a pdf
+
+    :return: list of the text of each page, or None if it couldn't be converted
+    """
+    try:
+        output = subprocess.run(
+            ["pdftotext", *range_args(first, last), pdf_path, "-"],
+            capture_output=True,
+        )
+    except FileNotFoundError:
+        logger.error("pdftotext is not installed")
+        return None
+
+    if output.returncode != 0:
+        return None
+    # Each page ends with a form feed
+    return output.stdout.decode("utf-8", errors="replace").split("\x0c")[:-1]
+
+
+def run_sharded(pdf_path, run_range):
+    """
+    Call run_range(first, last, idx) for page ranges of the pdf at once
+
+    :return: list of what run_range returned, in page order. A single
+        run_range(None, None, 0) over the whole pdf if it isn't worth splitting
+    """
+    page_count = get_page_count(pdf_path)
+    ranges = page_ranges(page_count) if page_count else []
+    if len(ranges) < 2:
+        return [run_range(None, None, 0)]
+
+    logger.debug(f"Extracting {page_count} pages in {len(ranges)} ranges")
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [
+            executor.submit(run_range, first, last, idx)
+            for idx, (first, last) in enumerate(ranges)
+        ]
+        return [future.result() for future in futures]
+
+
+def read_text(stream, chunk_size=1024 * 1024):
+    """
+    Read text from a stream noting where the form feeds between pages are
+    as it comes in, so the pages don't need to be found again afterwards
+
+    :return: tuple of the text and the offsets of each form feed in it
+    """
+    chunks = []
+    breaks = []
+    length = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        idx = chunk.find("\x0c")
+        while idx != -1:
+            breaks.append(length + idx)
+            idx = chunk.find("\x0c", idx + 1)
+        chunks.append(chunk)
+        length += len(chunk)
+    return "".join(chunks), breaks
+
+
+def extract_text(pdf_path):
+    """
+    pdftotext the pdf, read straight from its stdout
+
+    :return: tuple of the text and the offsets of each form feed in it, or
+        (None, None) if it couldn't be converted
+    """
+    key = ARTIFACT_CACHE.key(pdf_path, "pdftotext", tool_version("pdftotext"), [])
+    content = ARTIFACT_CACHE.get_text(key)
+    if content is not None:
+        logger.debug(f"Using cached pdftotext output of {pdf_path}")
+        return read_text(io.StringIO(content, newline=""))
+
+    def run_range(first, last, idx):
+        try:
+            process = subprocess.Popen(
+                ["pdftotext", *range_args(first, last), pdf_path, "-"],
+                stdout=subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            logger.error("pdftotext is not installed")
+            return None
+
+        with io.TextIOWrapper(
+            process.stdout, encoding="utf-8", errors="replace", newline=""
+        ) as stdout:
+            content, breaks = read_text(stdout)
+        if process.wait() != 0:
+            return None
+        return content, breaks
+
+    with stage("pdftotext"):
+        parts = run_sharded(pdf_path, run_range)
+    if any(part is None for part in parts):
+        return None, None
+
+    # Each page ends with a form feed so the ranges join up as one run would
+    breaks = []
+    length = 0
+    for content, part_breaks in parts:
+        breaks.extend(length + idx for idx in part_breaks)
+        length += len(content)
+    content = "".join(content for content, _ in parts)
+
+    ARTIFACT_CACHE.put_text(key, content)
+    return content, breaks
+
+
+def join_html(parts):
+    """
+    Join the html of pdftohtml runs over consecutive page ranges into what
+    one run over all of them would give, as far as splitting pages goes
+    """
+
+    def body_start(part):
+        # pages start on the line after <body>
+        return part.find("\n", part.find("<body")) + 1
+
+    content = [parts[0][: body_start(parts[0])]]
+    for part in parts:
+        end = part.rfind("</body>")
+        content.append(part[body_start(part) : end if end != -1 else len(part)])
+    content.append("</body>\n</html>\n")
+    return "".join(content)
+
+
+def extract_html(pdf_path, html_file):
+    """
+    pdftohtml the pdf into html_file which must be named <base>s.html, the
+    name pdftohtml gives the pages when told to write to <base>
+
+    What ends up in html_file's directory is cached, so nothing else should
+    be using it
+
+    :return: whether it could be converted
+    """
+    base = html_file[: -len("s.html")]
+    scratch_dir = os.path.dirname(html_file)
+
+    key = ARTIFACT_CACHE.key(
+        pdf_path,
+        "pdftohtml",
+        tool_version("pdftohtml"),
+        ["-q", os.path.basename(html_file)],
+    )
+    source_dir = ARTIFACT_CACHE.get_dir(key, scratch_dir)
+    if source_dir is not None and os.path.exists(html_file):
+        logger.debug(f"Using cached pdftohtml output of {pdf_path}")
+        if source_dir != scratch_dir:
+            # images are linked by their path when they were written
+            with open(html_file, "r") as f:
+                content = f.read()
+            with open(html_file, "w") as f:
+                f.write(
+                    content.replace(
+                        os.path.join(source_dir, ""), os.path.join(scratch_dir, "")
+                    )
+                )
+        return True
+
+    def run_range(first, last, idx):
+        out_base = base if first is None else f"{base}_{idx}"
+        run(["pdftohtml", "-q", *range_args(first, last), pdf_path, out_base])
+        out_file = f"{out_base}s.html"
+        if not os.path.exists(out_file):
+            return None
+        return out_file
+
+    with stage("pdftohtml"):
+        out_files = run_sharded(pdf_path, run_range)
+    if any(out_file is None for out_file in out_files):
+        return False
+
+    if len(out_files) > 1:
+        parts = []
+        for out_file in out_files:
+            with open(out_file, "r") as f:
+                parts.append(f.read())
+        with open(html_file, "w") as f:
+            f.write(join_html(parts))
+
+    ARTIFACT_CACHE.put_dir(
+        key,
+        scratch_dir,
+        exclude=[
+            os.path.basename(out_file)
+            for out_file in out_files
+            if out_file != html_file
+        ],
+    )
+    return True
@@ -1,8 +1,7 @@
 import re
-import difflib
 import os
+import html
 from io import StringIO
-import shutil
 
 import bs4
 
@@ -11,32 +10,83 @@ from ebooklib.utils import create_pagebreak
 
 from pdf2ebook import logger
 from pdf2ebook.base_page import BasePage
+from pdf2ebook.similarity import get_matcher
+from pdf2ebook.constants import HTML_PARSER
+
+
+TAG_PATTERN = re.compile(r"<[^>]*>")
+
+
+def line_text(line):
+    """
+    Text of one line of serialized html without parsing it
+    """
+    return html.unescape(TAG_PATTERN.sub("", line)).strip()
+
+
+def starts_line(node):
+    """
+    If node is text that starts on a new line of the html
+    """
+    return isinstance(node, bs4.NavigableString) and node.startswith("\n")
 
 
 class HTMLPage(BasePage):
-    def __init__(self, idx, content):
+    """
+    The parsed tree is the source of truth, content is only serialized from
+    it when asked for and the header, footer, page number and whitespace
+    are removed from the tree in place, so a page is parsed once
+    """
+
+    def __init__(self, idx, content, parser=None):
         self.idx = idx
         self.next_page = None
+        self.parser = parser or HTML_PARSER
+        # parsers other than html.parser wrap fragments in <html><body>
+        self._fragment = "<body" not in content.lower()
 
-        soup = bs4.BeautifulSoup(StringIO(content), "html.parser")
+        self._parse(content)
 
         try:
-            soup.hr.decompose()
+            self.soup.hr.decompose()
         except:
             pass
 
-        self.content = str(soup)
-
         super(HTMLPage, self).__init__()
 
+    def _parse(self, content):
+        self.soup = bs4.BeautifulSoup(StringIO(content), self.parser)
+        self.changed()
+
+    def changed(self):
+        self._content = None
+        self._text_content = None
+        self.invalidate_fingerprint()
+
     @property
-    def content_hash(self):
-        return hash(self.content)
+    def content(self):
+        if self._content is None:
+            if self._fragment and self.parser != "html.parser" and self.soup.body:
+                self._content = self.soup.body.decode_contents()
+            else:
+                self._content = str(self.soup)
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._parse(value)
+
+    @property
+    def fingerprint_content(self):
+        return self.content
+
+    @property
+    def is_empty(self):
+        return self.soup.text == "" and self.soup.find("img") is None
 
     @property
     def images(self):
-        soup = bs4.BeautifulSoup(StringIO(self.content), "html.parser")
-        imgs = soup.find_all("img")
+        imgs = self.soup.find_all("img")
         logger.debug(f"Found {len(imgs)} images in page {self.idx}")
 
         images = []
@@ -46,17 +96,14 @@ class HTMLPage(BasePage):
             real_path = img["src"]
 
             new_path = os.path.basename(real_path)
-            try:
-                shutil.copy(real_path, new_path)
-            except Exception as ex:
-                logger.debug(
-                    f'Could not copy image "{real_path}" -> "{new_path}": {ex}'
-                )
 
+            # Read from where it was extracted to rather than copying it into
+            # the working directory first
             try:
-                image_content = open(new_path, "rb").read()
+                with open(real_path, "rb") as f:
+                    image_content = f.read()
             except:
-                logger.error(f"Could not get image content from path: {new_path}")
+                logger.error(f"Could not get image content from path: {real_path}")
             else:
                 epub_image.uid = f"image_{self.idx}_{idx}"
                 epub_image.file_name = new_path
@@ -77,19 +124,22 @@ class HTMLPage(BasePage):
         t m0 xc h3 yf ff2 fs0 fc2 sc0 ls0 ws0
         t m0 x1 h3 y10 ff2 fs0 fc0 sc0 ls0 ws
         """
-        soup = bs4.BeautifulSoup(StringIO(self.content), "html.parser")
+        if self._text_content is not None:
+            return self._text_content
 
         content = []
-        for partial in soup.find_all("div", class_="t"):
+        for partial in self.soup.find_all("div", class_="t"):
             text = partial.text
             text = text.replace("", " ").strip()
             text = text.replace("\ue003", " ")
             content.append(text)
 
         if not content:
-            return soup.text.strip()
+            self._text_content = self.soup.text.strip()
+        else:
+            self._text_content = "\n".join(content)
 
-        return "\n".join(content)
+        return self._text_content
 
     @property
     def page_no(self):
@@ -97,10 +147,11 @@ class HTMLPage(BasePage):
 
     @property
     def html_content(self):
-        soup = bs4.BeautifulSoup(StringIO(self.content), "html.parser")
-        for img in soup.find_all("img"):
+        imgs = self.soup.find_all("img")
+        for img in imgs:
             img["src"] = os.path.basename(img["src"])
-        self.content = str(soup)
+        if imgs:
+            self.changed()
         return self.content
 
     @property
@@ -116,128 +167,120 @@ class HTMLPage(BasePage):
         epub_page.content += create_pagebreak(f"p_{self.idx}")
         return epub_page
 
+    @property
+    def root(self):
+        """
+        Where the page's content is in the tree, see content
+        """
+        if self._fragment and self.parser != "html.parser" and self.soup.body:
+            return self.soup.body
+        return self.soup
+
+    def lines(self):
+        """
+        The page's lines as lists of the nodes on them, the text divs of a
+        pdf2htmlEX page or else the top level nodes split where the html
+        has a newline, text nodes spanning lines are split up in place
+        """
+        text_divs = self.soup.find_all("div", class_="t")
+        if text_divs:
+            return [[div] for div in text_divs]
+
+        lines = [[]]
+        for node in list(self.root.children):
+            if isinstance(node, bs4.NavigableString) and "\n" in node[1:]:
+                parts = str(node).split("\n")
+                pieces = [parts[0]] + ["\n" + part for part in parts[1:]]
+                for piece in pieces:
+                    if piece:
+                        node.insert_before(type(node)(piece))
+                        self._add_node(lines, node.previous_sibling)
+                node.extract()
+            else:
+                self._add_node(lines, node)
+        return [line for line in lines if line]
+
+    @staticmethod
+    def _add_node(lines, node):
+        if starts_line(node):
+            lines.append([])
+        lines[-1].append(node)
+
+    @staticmethod
+    def text_of(line):
+        return line_text("".join(str(node) for node in line))
+
+    def remove_lines(self, lines, first=None):
+        """
+        :param first: the line that's left first, it no longer starts on a
+            new line
+        """
+        for line in lines:
+            for node in line:
+                node.extract()
+        if first and starts_line(first[0]):
+            first[0].replace_with(type(first[0])(first[0][1:]))
+        self.changed()
+
     def remove_header(self, header):
         if not header:
             return
-        # might need to remove tags
-        soup = bs4.BeautifulSoup(StringIO(self.content), "html.parser")
-        lines = str(soup).split("\n")
-        content = []
-        collect = False
-        for line in lines:
-            if collect:
-                content.append(line)
-            else:
-                soup_line = bs4.BeautifulSoup(StringIO(line), "html.parser")
-                if (
-                    difflib.SequenceMatcher(
-                        None, soup_line.text.strip(), header
-                    ).ratio()
-                    > 0.8
-                ):
-                    collect = True
-        if content:
-            self.content = "\n".join(content)
+        matcher = get_matcher(header)
+        lines = self.lines()
+        for idx, line in enumerate(lines[:-1]):
+            if matcher.matches(self.text_of(line)):
+                self.remove_lines(lines[: idx + 1], first=lines[idx + 1])
+                return
 
     def remove_footer(self, footer):
         if not footer:
             return
-        # might need to remove tags
-        soup = bs4.BeautifulSoup(StringIO(self.content), "html.parser")
-        lines = str(soup).split("\n")
-        content = []
-        collect = False
-        for line in reversed(lines):
-            if collect:
-                content.append(line)
-            else:
-                soup_line = bs4.BeautifulSoup(StringIO(line), "html.parser")
-                if (
-                    difflib.SequenceMatcher(
-                        None, soup_line.text.strip(), footer
-                    ).ratio()
-                    > 0.8
-                ):
-                    collect = True
-        if content:
-            self.content = "\n".join(reversed(content))
+        matcher = get_matcher(footer)
+        lines = self.lines()
+        for idx in range(len(lines) - 1, 0, -1):
+            if matcher.matches(self.text_of(lines[idx])):
+                self.remove_lines(lines[idx:])
+                return
 
     def remove_page_number(self):
         if self.included_page_no is None:
             return
 
-        # find the number from text and remove from html
-        soup = bs4.BeautifulSoup(StringIO(self.content), "html.parser")
-        lines = str(soup).split("\n")
-
-        if self.page_number_position == "top":
-            content = []
-            collect = False
-            for line in lines:
-                if collect:
-                    content.append(line)
-                else:
-                    text_line = bs4.BeautifulSoup(
-                        StringIO(line), "html.parser"
-                    ).text.strip()
-                    if text_line.startswith(self.included_page_no):
-                        content.append(
-                            re.sub("(^\d+)", "", text_line)
-                        )  # FIXME: this removes html elements
-                        collect = True
-            if content:
-                self.content = "\n".join(content)
-        elif self.page_number_position == "bottom":
-            content = []
-            collect = False
-            for line in reversed(lines):
-                if collect:
-                    content.append(line)
-                else:
-                    text_line = bs4.BeautifulSoup(
-                        StringIO(line), "html.parser"
-                    ).text.strip()
-                    if text_line.startswith(self.included_page_no):
-                        content.append(
-                            re.sub("(^\d+)", "", text_line)
-                        )  # FIXME: this removes html elements
-                        collect = True
-            if content:
-                self.content = "\n".join(reversed(content))
+        lines = self.lines()
+        top = self.page_number_position == "top"
+        if not top:
+            lines.reverse()
+
+        for idx, line in enumerate(lines):
+            text_line = self.text_of(line)
+            if text_line.startswith(self.included_page_no):
+                # FIXME: this removes html elements of the line
+                text = re.sub(r"(^\d+)", "", text_line)
+                if not top and starts_line(line[0]):
+                    text = "\n" + text
+                line[0].insert_before(bs4.NavigableString(text))
+                self.remove_lines(lines[:idx] + [line])
+                break
 
         self.strip_whitespace()
 
     def strip_whitespace(self):
-        soup = bs4.BeautifulSoup(StringIO(self.content), "html.parser")
-        lines = str(soup).split("\n")
-        content = []
-        collect = False
-        for line in lines:
-            if collect:
-                content.append(line)
-            else:
-                soup_line = bs4.BeautifulSoup(StringIO(line), "html.parser")
-                if soup_line.text.strip() == "" and soup.find("img") is None:
-                    continue
-                else:
-                    collect = True
-                    content.append(line)
-        if content:
-            self.content = "\n".join(content)
-
-        soup = bs4.BeautifulSoup(StringIO(self.content), "html.parser")
-        lines = str(soup).split("\n")
-        content = []
-        collect = False
-        for line in reversed(lines):
-            if collect:
-                content.append(line)
-            else:
-                soup_line = bs4.BeautifulSoup(StringIO(line), "html.parser")
-                if soup_line.text.strip() == "" and soup.find("img") is None:
-                    continue
-                else:
-                    collect = True
-                    content.append(line)
-        if content:
-            self.content = "\n".join(reversed(content))
+        # Nothing is blank if the page has an image
+        if self.soup.find("img") is not None:
+            return
+
+        lines = self.lines()
+        texts = [self.text_of(line) for line in lines]
+
+        start = 0
+        while start < len(lines) and texts[start] == "":
+            start += 1
+
+        end = len(lines)
+        while end > start and texts[end - 1] == "":
+            end -= 1
+
+        if start < end and (
+            (start, end) != (0, len(lines)) or starts_line(lines[0][0])
+        ):
+            self.remove_lines(lines[:start] + lines[end:], first=lines[start])
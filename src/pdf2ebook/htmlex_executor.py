@@ -0,0 +1,206 @@
+import os
+import threading
+import subprocess
+import multiprocessing.util
+
+from cached_property import cached_property
+
+from pdf2ebook import logger
+from pdf2ebook.constants import HTMLEX_WORKERS, HTMLEX_IMAGE
+from pdf2ebook.utils import is_local_htmlex_ok, is_docker_installed, get_scratch_dir
+
+
+HTMLEX_FLAGS = [
+    "--quiet",
+    "1",
+    "--embed-css",
+    "0",
+    "--embed-font",
+    "0",
+    "--embed-image",
+    "0",
+    "--embed-javascript",
+    "0",
+    "--embed-outline",
+    "0",
+    "--split-pages",
+    "1",
+    "--page-filename",
+    "convertedbook%04d.page",
+    "--css-filename",
+    "style.css",
+]
+
+
+def htmlex_args(pdf_path, dest_dir):
+    return ["pdf2htmlEX", *HTMLEX_FLAGS, "--dest-dir", dest_dir, pdf_path]
+
+
+class LocalExecutor:
+    """
+    Runs pdf2htmlEX as a local process, at most workers at once
+    """
+
+    def __init__(self, workers=HTMLEX_WORKERS):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers)
+
+    @cached_property
+    def version(self):
+        output = subprocess.run(
+            ["pdf2htmlEX", "--version"],
+            capture_output=True,
+            text=True,
+            errors="replace",
+        )
+        lines = (output.stdout + output.stderr).strip().splitlines()
+        return lines[0] if lines else None
+
+    def convert(self, pdf_path, dest_dir):
+        with self._slots:
+            return subprocess.run(htmlex_args(pdf_path, dest_dir)).returncode == 0
+
+    def close(self):
+        pass
+
+
+class DockerExecutor:
+    """
+    Keeps up to workers long lived pdf2htmlEX containers and runs
+    conversions in them with docker exec, rather than paying for a
+    docker run per book
+
+    The scratch dir (see get_scratch_dir) is mounted at the same path in
+    the containers so paths under it are the same inside and out, and
+    pdf2htmlEX runs as the current user so what it writes there is theirs
+    """
+
+    def __init__(self, workers=HTMLEX_WORKERS, image=HTMLEX_IMAGE, mount=None):
+        self.workers = workers
+        self.image = image
+        self.mount = os.path.realpath(mount or get_scratch_dir())
+
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._idle = []
+        self._containers = set()
+
+    @cached_property
+    def version(self):
+        output = subprocess.run(
+            ["docker", "image", "inspect", "-f", "{{.Id}}", self.image],
+            capture_output=True,
+            text=True,
+        )
+        return output.stdout.strip() or self.image
+
+    def start_container(self):
+        output = subprocess.run(
+            [
+                "docker",
+                "run",
+                "-d",
+                "--rm",
+                "--label",
+                "pdf2ebook",
+                "-v",
+                f"{self.mount}:{self.mount}",
+                "--entrypoint",
+                "sleep",
+                self.image,
+                "infinity",
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if output.returncode != 0:
+            raise Exception(f"Could not start pdf2htmlex container: {output.stderr}")
+
+        container = output.stdout.strip()
+        logger.debug(f"Started pdf2htmlex container: {container}")
+        with self._lock:
+            self._containers.add(container)
+        return container
+
+    def remove_container(self, container):
+        logger.debug(f"Removing pdf2htmlex container: {container}")
+        subprocess.run(["docker", "rm", "-f", container], capture_output=True)
+        with self._lock:
+            self._containers.discard(container)
+
+    def is_healthy(self, container):
+        output = subprocess.run(
+            ["docker", "inspect", "-f", "{{.State.Running}}", container],
+            capture_output=True,
+            text=True,
+        )
+        return output.returncode == 0 and output.stdout.strip() == "true"
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            with self._lock:
+                container = self._idle.pop() if self._idle else None
+
+            if container is not None and not self.is_healthy(container):
+                logger.warning(f"pdf2htmlex container {container} is unhealthy")
+                self.remove_container(container)
+                container = None
+
+            return container or self.start_container()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, container):
+        with self._lock:
+            if container in self._containers:
+                self._idle.append(container)
+        self._slots.release()
+
+    def convert(self, pdf_path, dest_dir):
+        pdf_path = os.path.realpath(pdf_path)
+        dest_dir = os.path.realpath(dest_dir)
+        for path in (pdf_path, dest_dir):
+            if not path.startswith(self.mount + os.sep):
+                raise Exception(f"{path} is not under {self.mount}")
+
+        container = self.acquire()
+        try:
+            args = ["docker", "exec", "-u", f"{os.getuid()}:{os.getgid()}"]
+            args.extend(["-w", dest_dir, container])
+            args.extend(htmlex_args(pdf_path, dest_dir))
+            return subprocess.run(args).returncode == 0
+        finally:
+            self.release(container)
+
+    def close(self):
+        with self._lock:
+            containers = list(self._containers)
+            self._idle = []
+        for container in containers:
+            self.remove_container(container)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    The executor shared by every conversion in this process, local
+    pdf2htmlEX if it's installed, docker otherwise
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if is_local_htmlex_ok():
+                _executor = LocalExecutor()
+            elif is_docker_installed():
+                _executor = DockerExecutor()
+            else:
+                raise Exception("Could not execute pdf2htmlex")
+
+            # Unlike atexit this also runs when a pool worker process exits
+            multiprocessing.util.Finalize(None, _executor.close, exitpriority=10)
+        return _executor
@@ -1,39 +1,26 @@
 import os
 import shutil
 import glob
-import uuid
+import weakref
+import tempfile
+import subprocess
+
+from cached_property import cached_property
 
 from pdf2ebook import logger
-from pdf2ebook.utils import is_local_htmlex_ok, is_docker_installed
+from pdf2ebook.epub import EpubPackager
+from pdf2ebook.cache import ARTIFACT_CACHE
+from pdf2ebook.instrumentation import stage
+from pdf2ebook.htmlex_executor import HTMLEX_FLAGS, get_executor
 from pdf2ebook.html_page import HTMLPage
 from pdf2ebook.pages import HtmlPages
 from pdf2ebook.base_pdf import BasePDF
+from pdf2ebook.utils import get_scratch_dir
 
 
-class HTMLEX_PDF(BasePDF):
-    ROOT = f"/tmp/{uuid.uuid4()}"
-    META_INF = f"{ROOT}/META-INF"
-    OEBPS = f"{ROOT}/OEBPS"
-    MIMETYPE = f"{ROOT}/mimetype"
-    CONTAINER = f"{META_INF}/container.xml"
-    NAV = f"{OEBPS}/nav.xhtml"
-    CONTENT = f"{OEBPS}/content.opf"
-
-    def __init__(self, *args, **kwargs):
-        self._title = kwargs.get("title", None)
-        self.pdf_path = kwargs["path"]
-        self.dot_pages = []
-        self.tmp_dir = f"/tmp/{os.path.basename(self.pdf_path)}_{uuid.uuid4()}"
-        os.mkdir(self.tmp_dir)
-        self.tmp_path = os.path.join(self.tmp_dir, os.path.basename(self.pdf_path))
-        shutil.copyfile(self.pdf_path, self.tmp_path)
+ASSET_EXTENSIONS = ["css", "woff", "png", "jpg", "svg"]
 
-    def modify_pages(self):
-        logger.info("Modifying pages")
-        for page in sorted(os.listdir(self.tmp_dir)):
-            if not page.endswith(".page"):
-                continue
-            head = """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
+PAGE_HEAD = """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
 <html xmlns:epub=\"http://www.idpf.org/2007/ops\" xmlns=\"http://www.w3.org/1999/xhtml\">
 <head>
   <meta charset=\"UTF-8\"/>
@@ -45,83 +32,62 @@ class HTMLEX_PDF(BasePDF):
   </head>
 <body>
 <div id=\"page-container\">"""
-            page_content = open(os.path.join(self.tmp_dir, page), "r").read()
-            foot = """</div>
+
+PAGE_FOOT = """</div>
 </body>
 </html>"""
-            content = head + page_content + foot
-            with open(page, "w") as f:
-                f.write(content)
-            logger.debug(f'Move: {page} -> {os.path.splitext(page)[0] + ".xhtml"}')
-            os.rename(page, os.path.splitext(page)[0] + ".xhtml")
+
+
+class HTMLEX_PDF(BasePDF):
+    def __init__(self, *args, **kwargs):
+        self._title = kwargs.get("title", None)
+        self.pdf_path = os.path.abspath(kwargs["path"])
+        self.dot_pages = []
+
+        # Everything for this conversion lives under its own workspace so
+        # conversions sharing a process or a cwd can't see each other's files
+        self.workspace = tempfile.mkdtemp(
+            prefix="pdf2ebook_",
+            dir=kwargs.get("scratch_root") or get_scratch_dir(),
+        )
+        weakref.finalize(self, shutil.rmtree, self.workspace, ignore_errors=True)
+
+        self.tmp_dir = os.path.join(self.workspace, "html")
+        os.mkdir(self.tmp_dir)
+        self.tmp_path = os.path.join(self.tmp_dir, os.path.basename(self.pdf_path))
+        shutil.copyfile(self.pdf_path, self.tmp_path)
+
+    def modify_pages(self):
+        logger.info("Modifying pages")
+        # The pages parsed before are of the old .page files
+        self.__dict__.pop("pages", None)
+        for page in sorted(os.listdir(self.tmp_dir)):
+            if not page.endswith(".page"):
+                continue
             self.dot_pages.append(
                 (page, page.replace(".page", "").replace("convertedbook", ""))
             )  # FIXME: icky
 
-    def create_structure(self):
-        logger.info("Creating structure")
-        try:
-            shutil.rmtree(self.ROOT)
-        except:
-            pass
-
-        logger.debug(f"mkdir: {self.ROOT}")
-        os.mkdir(self.ROOT)
-        logger.debug(f"mkdir: {self.META_INF}")
-        os.mkdir(self.META_INF)
-        logger.debug(f"mkdir: {self.OEBPS}")
-        os.mkdir(self.OEBPS)
-
-    def move_to_oebps(self):
-        logger.info("Move to oebps")
-        for data in sorted(glob.glob("*.css")):
-            logger.debug(f"Move: {data} -> {self.OEBPS}")
-            shutil.move(data, self.OEBPS)
-        for data in sorted(glob.glob("*.woff")):
-            logger.debug(f"Move: {data} -> {self.OEBPS}")
-            shutil.move(data, self.OEBPS)
-        for data in sorted(glob.glob("*.xhtml")):
-            logger.debug(f"Move: {data} -> {self.OEBPS}")
-            shutil.move(data, self.OEBPS)
-
-        for data in sorted(glob.glob("*.png")):
-            logger.debug(f"Move: {data} -> {self.OEBPS}")
-            shutil.move(data, self.OEBPS)
-        for data in sorted(glob.glob("*.jpg")):
-            logger.debug(f"Move: {data} -> {self.OEBPS}")
-            shutil.move(data, self.OEBPS)
-        for data in sorted(glob.glob("*.svg")):
-            logger.debug(f"Move: {data} -> {self.OEBPS}")
-            shutil.move(data, self.OEBPS)
-
-    def write_mimetype(self):
-        logger.info("Write mimetype")
-
-        logger.debug(f"Write: {self.MIMETYPE}")
-        with open(self.MIMETYPE, "w") as f:
-            f.write("application/epub+zip")
-
-    def write_container(self):
-        logger.info("Write container")
-
-        logger.debug(f"Write: {self.CONTAINER}")
-        with open(self.CONTAINER, "w") as f:
-            f.write(
-                """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
+    def page_xhtml(self, page):
+        """
+        The xhtml of a pdf2htmlEX .page, built when needed rather than
+        written out next to it
+        """
+        with open(os.path.join(self.tmp_dir, page), "r") as f:
+            page_content = f.read()
+        return PAGE_HEAD + page_content + PAGE_FOOT
+
+    def container_xml(self):
+        return """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
 <container version=\"1.0\" xmlns=\"urn:oasis:names:tc:opendocument:xmlns:container\">
   <rootfiles>
     <rootfile full-path=\"OEBPS/content.opf\" media-type=\"application/oebps-package+xml\"/>
   </rootfiles>
 </container>"""
-            )
 
-    def write_nav(self):
-        logger.info("Write nav")
-
-        logger.debug(f"Write: {self.NAV}")
-        with open(self.NAV, "w") as f:
-            f.write(
-                """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
+    def nav_xhtml(self):
+        nav = [
+            """<?xml version=\"1.0\" encoding=\"UTF-8\"?>
 <html xmlns:epub=\"http://www.idpf.org/2007/ops\"   xmlns=\"http://www.w3.org/1999/xhtml\">
 <head>
   <title>title</title>
@@ -133,25 +99,27 @@ class HTMLEX_PDF(BasePDF):
   </nav>
   <nav epub:type=\"page-list\" hidden=\"\">
   <ol>"""
-            )
+        ]
 
-            for page in sorted(self.dot_pages):
-                logger.debug(f"Add page: href={page[0]}   content={page[1]}")
-                f.write(f'   <li>\n    <a href="{page[0]}">{page[1]}</a>\n   </li>')
+        for page in sorted(self.dot_pages):
+            logger.debug(f"Add page: href={page[0]}   content={page[1]}")
+            nav.append(f'   <li>\n    <a href="{page[0]}">{page[1]}</a>\n   </li>')
 
-            f.write(
-                """  </ol>
+        nav.append(
+            """  </ol>
   </nav>
 </body>
 </html>"""
-            )
-
-    def write_content(self):
-        logger.info("Write content")
+        )
+        return "".join(nav)
 
-        logger.debug(f"Write: {self.CONTENT}")
-        with open(self.CONTENT, "w") as f:
-            content = f"""<?xml version=\"1.0\" encoding=\"UTF-8\"?>
+    def content_opf(self):
+        has_cover = os.path.exists(self.cover_path)
+        cover_meta = (
+            '    <meta name="cover" content="cover-image"/>\n' if has_cover else ""
+        )
+        content = [
+            f"""<?xml version=\"1.0\" encoding=\"UTF-8\"?>
 <package xmlns=\"http://www.idpf.org/2007/opf\" prefix=\"rendition: http://www.idpf.org/vocab/rendition/#\" unique-identifier=\"pub-id\" version=\"3.0\">
   <metadata xmlns:dc=\"http://purl.org/dc/elements/1.1/\">
     <dc:identifier id=\"pub-id\">{self.get_isbn()}</dc:identifier>
@@ -162,103 +130,128 @@ class HTMLEX_PDF(BasePDF):
     <dc:subject></dc:subject>
     <dc:date>{self.get_published_date()}</dc:date>
     <dc:description></dc:description>
-    <meta name=\"cover\" content=\"cover-image\"/>
-    <meta property=\"dcterms:modified\">date</meta>
+{cover_meta}    <meta property=\"dcterms:modified\">date</meta>
     <meta property=\"rendition:layout\">pre-paginated</meta>
     <meta property=\"rendition:spread\">auto</meta>
   </metadata>
   <manifest>"""
+        ]
 
-            f.write(content)
-
-            for data in sorted(glob.glob(f"{self.OEBPS}/*.xhtml")):
-                logger.debug(
-                    f"Add page: id={os.path.splitext(os.path.basename(data))[0]}   href={os.path.basename(data)}"
-                )
-                f.write(
-                    f'    <item id="{os.path.splitext(os.path.basename(data))[0]}" href="{os.path.basename(data)}" media-type="application/xhtml+xml"/>\n'
-                )
+        page_ids = [os.path.splitext(page)[0] for page, _ in sorted(self.dot_pages)]
+        for page_id in page_ids:
+            logger.debug(f"Add page: id={page_id}   href={page_id}.xhtml")
+            content.append(
+                f'    <item id="{page_id}" href="{page_id}.xhtml" media-type="application/xhtml+xml"/>\n'
+            )
 
-            # TODO: for png, svg, jpg as well as xhtml
+        # TODO: for png, svg, jpg as well as xhtml
 
-            f.write(
-                """    <item id="base-min-css" href="base.min.css" media-type="text/css"/>
+        if has_cover:
+            content.append(
+                '    <item id="cover-image" href="cover.png" media-type="image/png" properties="cover-image"/>\n'
+            )
+        content.append(
+            """    <item id="base-min-css" href="base.min.css" media-type="text/css"/>
     <item id="style-css" href="style.css" media-type="text/css"/>
-    <item id="cover-image" href="cover.png" media-type="image/png" properties="cover-image"/>
     <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
   </manifest>
   <spine>"""
+        )
+        for page_id in page_ids + ["nav"]:
+            logger.debug(f"Write spine item: {page_id}")
+            content.append(
+                f'    <itemref idref="{page_id}" properties="rendition:layout-pre-paginated"/>\n'
             )
-            for data in sorted(glob.glob(f"{self.OEBPS}/*.xhtml")):
-                logger.debug(
-                    f"Write spine item: {os.path.splitext(os.path.basename(data))[0]}"
-                )
-                f.write(
-                    f'    <itemref idref="{os.path.splitext(os.path.basename(data))[0]}" properties="rendition:layout-pre-paginated"/>\n'
-                )
-            f.write(
-                """  </spine>
+        content.append(
+            """  </spine>
   <guide>
     <reference type="cover" title="Cover" href="convertedbook0001.xhtml"/>
     <reference type="text" title="Text" href="convertedbook0002.xhtml"/>
   </guide>
 </package>"""
-            )
+        )
+        return "".join(content)
 
-    def write_cover(self):
-        os.system(f"pdftoppm {self.tmp_path} cover -cropbox -png -f 1 -singlefile")
+    @property
+    def cover_path(self):
+        return os.path.join(self.tmp_dir, "cover.png")
 
-        logger.debug(f"Move: cover.png -> {self.OEBPS}")
-        shutil.move("cover.png", self.OEBPS)
+    def write_cover(self):
+        """
+        :return: whether the first page could be rendered as the cover
+        """
+        try:
+            subprocess.run(
+                [
+                    "pdftoppm",
+                    self.tmp_path,
+                    os.path.splitext(self.cover_path)[0],
+                    "-cropbox",
+                    "-png",
+                    "-f",
+                    "1",
+                    "-singlefile",
+                ],
+                check=True,
+            )
+        except FileNotFoundError:
+            logger.warning("pdftoppm is not installed, can't make a cover")
+            return False
+        except subprocess.CalledProcessError as ex:
+            logger.warning(f"Could not make a cover: {ex}")
+            return False
+        return os.path.exists(self.cover_path)
 
     def to_html(self):
-        if is_local_htmlex_ok():
-            os.system(
-                f"pdf2htmlEX --quiet 1 --embed-css 0 --embed-font 0 --embed-image 0 --embed-javascript 0 --embed-outline 0 --split-pages 1 --page-filename convertedbook%04d.page --dest-dir {self.tmp_dir} --css-filename style.css {self.tmp_path}"
-            )
-        elif is_docker_installed():
-            os.system(
-                f"docker run -ti --rm -v {self.tmp_dir}:/pdf bwits/pdf2htmlex pdf2htmlEX --embed-css 0 --embed-font 0 --embed-image 0 --embed-javascript 0 --embed-outline 0 --split-pages 1 --page-filename convertedbook%04d.page --css-filename style.css {os.path.basename(self.tmp_path)}"
-            )
-        else:
-            raise Exception("Could not execute pdf2htmlex")
+        executor = get_executor()
+        key = ARTIFACT_CACHE.key(
+            self.pdf_path, "pdf2htmlEX", executor.version, HTMLEX_FLAGS
+        )
+        if ARTIFACT_CACHE.get_dir(key, self.tmp_dir) is not None:
+            logger.debug(f"Using cached pdf2htmlEX output of {self.pdf_path}")
+            return
+
+        with stage("pdf2htmlex"):
+            converted = executor.convert(self.tmp_path, self.tmp_dir)
+        if not converted:
+            raise Exception(f"pdf2htmlex could not convert {self.pdf_path}")
+
+        ARTIFACT_CACHE.put_dir(
+            key, self.tmp_dir, exclude=[os.path.basename(self.tmp_path)]
+        )
 
     def to_epub(self, path=None):
         self.to_html()
         self.modify_pages()
-        self.create_structure()
-        self.write_mimetype()
-        self.move_to_oebps()
-        self.write_container()
-        self.write_nav()
-        self.write_content()
-        self.write_cover()
-
-        dir_path = os.path.dirname(os.path.realpath(__file__))
-
-        if path:
-            path_to_out_epub = os.path.join(dir_path, path)
-        else:
-            path_to_out_epub = os.path.join(dir_path, "converted_pdf.epub")
-
-        os.system(
-            f"cd {self.ROOT} && zip -0Xq {path_to_out_epub} ./mimetype && zip -Xr9Dq {path_to_out_epub} ./* -x ./mimetype -x {path_to_out_epub}"
-        )
+        with stage("cover"):
+            self.write_cover()
+
+        path_to_out_epub = os.path.abspath(path or "converted_pdf.epub")
+
+        with stage("metadata"):
+            content_opf = self.content_opf()
+
+        logger.info("Packaging epub")
+        with stage("package"), EpubPackager(path_to_out_epub) as epub:
+            epub.add_bytes("META-INF/container.xml", self.container_xml())
+            for page, _ in self.dot_pages:
+                epub.add_bytes(
+                    f"OEBPS/{os.path.splitext(page)[0]}.xhtml", self.page_xhtml(page)
+                )
+            for extension in ASSET_EXTENSIONS:
+                pattern = os.path.join(self.tmp_dir, f"*.{extension}")
+                for data in sorted(glob.glob(pattern)):
+                    epub.add_file(f"OEBPS/{os.path.basename(data)}", data)
+            epub.add_bytes("OEBPS/nav.xhtml", self.nav_xhtml())
+            epub.add_bytes("OEBPS/content.opf", content_opf)
 
         logger.debug(f"Epub saved: {path_to_out_epub}")
 
-    @property
+    @cached_property
     def pages(self):
         pages = HtmlPages()
         for idx, (page, _) in enumerate(self.dot_pages):
-            page = page.replace(".page", ".xhtml")
-            page_path = os.path.join(self.OEBPS, page)
-
-            content = None
-            with open(page_path, "r") as html_file:
-                content = html_file.read()
-
-            pages.append(HTMLPage(idx, content))
+            pages.append(HTMLPage(idx, self.page_xhtml(page)))
 
         pages.set_context()
 
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not on windows
+    resource = None
+
+
+def peak_rss():
+    """
+    Most memory the process has had resident so far, in bytes
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Report:
+    """
+    Time spent in each stage of a conversion and counts of things that
+    happened along the way, e.g. cache hits
+
+    Stages add up over every time they're entered. wall is seconds on the
+    clock, cpu is seconds of this process on a cpu (every thread) and
+    child_cpu seconds of the tools it waited on. peak_rss is the most the
+    process had resident by the end of the stage, it only ever goes up
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = Counter()
+            self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        times = os.times()
+        try:
+            yield
+        finally:
+            end_times = os.times()
+            with self._lock:
+                stage = self.stages.setdefault(
+                    name,
+                    {"calls": 0, "wall": 0.0, "cpu": 0.0, "child_cpu": 0.0},
+                )
+                stage["calls"] += 1
+                stage["wall"] += time.perf_counter() - wall
+                # os.times() is user, system, children user, children system
+                stage["cpu"] += sum(end_times[:2]) - sum(times[:2])
+                stage["child_cpu"] += sum(end_times[2:4]) - sum(times[2:4])
+                stage["peak_rss"] = peak_rss()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "wall": time.perf_counter() - self.started,
+                "peak_rss": peak_rss(),
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+
+REPORT = Report()
+
+
+def stage(name):
+    return REPORT.stage(name)
+
+
+def count(name, value=1):
+    REPORT.count(name, value)
+
+
+def write_report(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4, sort_keys=True)
@@ -0,0 +1,82 @@
+import re
+
+import isbnlib
+
+from pdf2ebook.constants import ISBN_FRONT_PAGES, ISBN_BACK_PAGES
+
+# Dashes pdfs use between the groups of an isbn
+DASHES = re.compile("[\u2010\u2011\u2012\u2013\u2014\u2212\u00ad]")
+
+# 13 / 10 digits with at most one space or hyphen between each, not part
+# of a longer number
+ISBN13_PATTERN = re.compile(r"(?<![0-9])97[89](?:[ -]?[0-9]){10}(?![0-9])")
+ISBN10_PATTERN = re.compile(
+    r"(?<![0-9])[0-9](?:[ -]?[0-9]){8}[ -]?[0-9Xx](?![0-9Xx])"
+)
+
+LABEL_PATTERN = re.compile(r"isbn(?:-1[03])?[^0-9a-z]{0,6}$", re.IGNORECASE)
+COPYRIGHT_PATTERN = re.compile(
+    r"copyright|©|all rights reserved|first published", re.IGNORECASE
+)
+
+
+def find_isbns(text):
+    """
+    Valid isbns in text, as isbn13s with whether "ISBN" came before them
+
+    :return: list of (isbn13, labelled) in the order they appear
+    """
+    text = DASHES.sub("-", text)
+
+    found = []
+    spans = []
+    for match in ISBN13_PATTERN.finditer(text):
+        isbn = isbnlib.canonical(match.group())
+        if isbnlib.is_isbn13(isbn):
+            found.append((match.start(), isbn))
+            spans.append(match.span())
+
+    for match in ISBN10_PATTERN.finditer(text):
+        if any(start < match.end() and match.start() < end for start, end in spans):
+            continue
+        isbn = isbnlib.canonical(match.group())
+        if isbnlib.is_isbn10(isbn):
+            found.append((match.start(), isbnlib.to_isbn13(isbn)))
+
+    return [
+        (isbn, bool(LABEL_PATTERN.search(text[max(start - 12, 0) : start])))
+        for start, isbn in sorted(found)
+    ]
+
+
+def scan_isbns(pages):
+    """
+    Every valid isbn in the text of the pages, best candidates first
+
+    Ones labelled "ISBN" come first, then by where they are: the front
+    matter / copyright page, then the back of the book, then anywhere
+    else, and then by the order they appear in
+
+    :param pages: text of each page in order
+    :return: list of isbn13s
+    """
+    ranks = {}
+    order = 0
+    for idx, text in enumerate(pages):
+        if not text:
+            continue
+
+        if idx < ISBN_FRONT_PAGES or COPYRIGHT_PATTERN.search(text):
+            where = 0
+        elif idx >= len(pages) - ISBN_BACK_PAGES:
+            where = 1
+        else:
+            where = 2
+
+        for isbn, labelled in find_isbns(text):
+            rank = (not labelled, where, order)
+            order += 1
+            if isbn not in ranks or rank < ranks[isbn]:
+                ranks[isbn] = rank
+
+    return sorted(ranks, key=ranks.get)
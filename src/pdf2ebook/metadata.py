@@ -0,0 +1,233 @@
+import time
+from itertools import takewhile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import isbnlib
+
+from pdf2ebook import logger
+from pdf2ebook import catalog
+from pdf2ebook.cache import META_CACHE, MISSING
+from pdf2ebook.constants import (
+    META_LOOKUP_WORKERS,
+    META_LOOKUP_DEADLINE,
+    META_PREFETCH_DEADLINE,
+)
+from pdf2ebook.utils import isbns_from_words, get_thumbnail_url_from_isbn
+
+
+def get_services():
+    return list(isbnlib._metadata.get_services().keys())
+
+
+def query_service(isbn, service):
+    """
+    :return: tuple of the data found (or None) and whether the service failed
+        rather than just not knowing the isbn
+    """
+    try:
+        data = isbnlib.meta(isbn, service=service)
+    except isbnlib.dev._exceptions.ISBNNotConsistentError:
+        logger.warning(f"ISBN is not consistent: {isbn}")
+    except isbnlib._exceptions.NotValidISBNError:
+        logger.warning(f"ISBN is not valid: {isbn}")
+    except isbnlib.dev._exceptions.DataNotFoundAtServiceError:
+        logger.warning(f"ISBN data not found at service ({service}): {isbn}")
+    except isbnlib.dev._exceptions.ISBNLibHTTPError:
+        logger.warning(f"ISBNLib HTTP Error ({service}): {isbn}")
+        return None, True
+    except (
+        isbnlib.dev._exceptions.ISBNLibURLError,
+        isbnlib.dev._exceptions.ServiceIsDownError,
+    ):
+        logger.warning(f"ISBNLib could not reach service ({service}): {isbn}")
+        return None, True
+    else:
+        if data:
+            logger.debug(f"Found ISBNLib data ({isbn}): {data}")
+            return data, False
+    return None, False
+
+
+def _resolve(isbns, first_only, deadline, workers):
+    """
+    :return: tuple of the list of (isbn, metadata) found, in the order
+        given, and whether that's all there is to find, False if a service
+        failed or the deadline passed before the answer was known
+    """
+    isbns = list(dict.fromkeys(isbn for isbn in isbns if isbn))
+
+    found = {}
+    outstanding = {}
+    for isbn in isbns:
+        data = catalog.CATALOG.meta(isbn) if catalog.CATALOG else None
+        if data:
+            found[isbn] = data
+            continue
+
+        data = META_CACHE.get("isbn_meta", isbn)
+        if data is MISSING:
+            outstanding[isbn] = 0
+        elif data:
+            found[isbn] = data
+
+    def decided():
+        # Earlier isbns are preferred so only stop once nothing before the
+        # first found one is still being looked up
+        if not first_only:
+            return all(isbn in found or not outstanding.get(isbn) for isbn in isbns)
+        for isbn in isbns:
+            if isbn in found:
+                return True
+            if outstanding.get(isbn):
+                return False
+        return True
+
+    tasks = [(isbn, service) for isbn in outstanding for service in get_services()]
+    if not tasks:
+        return [(isbn, found[isbn]) for isbn in isbns if isbn in found], True
+    if deadline <= 0:
+        # Out of time before asking, what's known so far is all there is
+        return [(isbn, found[isbn]) for isbn in isbns if isbn in found], False
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(tasks)))
+    try:
+        futures = {}
+        for isbn, service in tasks:
+            futures[executor.submit(query_service, isbn, service)] = isbn
+            outstanding[isbn] += 1
+        http_errors = set()
+        timed_out = False
+
+        end = time.monotonic() + deadline
+        not_done = set(futures)
+        while not_done and not decided():
+            done, not_done = wait(
+                not_done,
+                timeout=max(end - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                logger.warning(f"Gave up looking up isbn metadata after {deadline}s")
+                timed_out = True
+                break
+
+            for future in done:
+                isbn = futures[future]
+                outstanding[isbn] -= 1
+                data, http_error = future.result()
+                if http_error:
+                    http_errors.add(isbn)
+                if data and isbn not in found:
+                    found[isbn] = data
+                    META_CACHE.set("isbn_meta", isbn, data)
+                elif not outstanding[isbn] and isbn not in found:
+                    # Don't remember an outage as not found
+                    if isbn not in http_errors:
+                        META_CACHE.set("isbn_meta", isbn, None)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Only the isbns before the one picked matter when picking the first
+    relevant = isbns
+    if first_only:
+        relevant = list(takewhile(lambda isbn: isbn not in found, isbns))
+    complete = not timed_out and not any(isbn in http_errors for isbn in relevant)
+
+    return [(isbn, found[isbn]) for isbn in isbns if isbn in found], complete
+
+
+def resolve_meta(
+    isbns,
+    deadline=META_LOOKUP_DEADLINE,
+    workers=META_LOOKUP_WORKERS,
+    with_complete=False,
+):
+    """
+    Look up every isbn at every service at once
+
+    :param with_complete: also return whether the answer is final, see
+        _resolve, so an outage isn't remembered as nothing found
+    :return: tuple of the first isbn (in the order given) that has metadata
+        and the metadata, or (None, None)
+    """
+    resolved, complete = _resolve(isbns, True, deadline, workers)
+    result = resolved[0] if resolved else (None, None)
+    return (result, complete) if with_complete else result
+
+
+def resolve_all_meta(
+    isbns,
+    deadline=META_LOOKUP_DEADLINE,
+    workers=META_LOOKUP_WORKERS,
+    with_complete=False,
+):
+    """
+    :param with_complete: also return whether the answer is final
+    :return: list of (isbn, metadata) for every isbn that has metadata,
+        in the order given
+    """
+    resolved, complete = _resolve(isbns, False, deadline, workers)
+    return (resolved, complete) if with_complete else resolved
+
+
+def lookup_thumbnail_url(isbn):
+    thumbnail_url = META_CACHE.get("thumbnail", isbn)
+    if thumbnail_url is MISSING:
+        thumbnail_url = get_thumbnail_url_from_isbn(isbn)
+        META_CACHE.set("thumbnail", isbn, thumbnail_url)
+    return thumbnail_url
+
+
+def lookup_title_isbn(title, multi=False):
+    """
+    isbnlib's guess at the isbn of a title, or with multi every isbn google
+    has for it. Titles close enough to ones in the catalog don't go online
+    """
+    if catalog.CATALOG:
+        isbns = catalog.CATALOG.search(title)
+        if isbns:
+            return isbns if multi else isbns[0]
+
+    namespace = "title_isbns" if multi else "title_isbn"
+    result = META_CACHE.get(namespace, title)
+    if result is MISSING:
+        if multi:
+            result = isbns_from_words(title)
+        else:
+            result = isbnlib.isbn_from_words(title)
+        META_CACHE.set(namespace, title, result)
+    return result
+
+
+def prefetch_lookups(
+    lookup, keys, deadline=META_PREFETCH_DEADLINE, workers=META_LOOKUP_WORKERS
+):
+    """
+    Call lookup(key) for every key at once so what they find is in META_CACHE
+    for later, ones that fail are logged and left to be tried again then
+
+    :return: dict of key to what lookup returned, for the ones that finished
+    """
+    keys = list(dict.fromkeys(key for key in keys if key))
+    if not keys:
+        return {}
+
+    results = {}
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(keys)))
+    try:
+        futures = {executor.submit(lookup, key): key for key in keys}
+        done, not_done = wait(futures, timeout=deadline)
+        for future in done:
+            if future.exception():
+                logger.warning(
+                    f"Could not prefetch {futures[future]}: {future.exception()}"
+                )
+            else:
+                results[futures[future]] = future.result()
+        if not_done:
+            logger.warning(
+                f"Gave up prefetching {len(not_done)} lookups after {deadline:.0f}s"
+            )
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
@@ -0,0 +1,308 @@
+import ssl
+import time
+import random
+import threading
+import http.client
+import urllib.error
+import urllib.request
+
+from pdf2ebook import logger
+from pdf2ebook.instrumentation import count
+from pdf2ebook.constants import (
+    NETWORK_POOLING,
+    NETWORK_TIMEOUT,
+    NETWORK_POOL_SIZE,
+    NETWORK_HOST_RATE,
+    NETWORK_RETRIES,
+    NETWORK_BACKOFF,
+    NETWORK_BREAKER_FAILURES,
+    NETWORK_BREAKER_COOLDOWN,
+)
+
+# Worth trying again, the service is overloaded / having a moment
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Longest Retry-After to respect rather than backing off as usual
+MAX_RETRY_AFTER = 60
+
+
+class PooledResponse(http.client.HTTPResponse):
+    reusable = True
+
+    def close(self):
+        if not self.isclosed():
+            # the rest of the body would be read as the next response
+            self.reusable = False
+        super().close()
+
+
+class HTTPConnection(http.client.HTTPConnection):
+    response_class = PooledResponse
+
+
+class HTTPSConnection(http.client.HTTPSConnection):
+    response_class = PooledResponse
+
+
+class Host:
+    """
+    Idle connections, rate limit and circuit breaker of one scheme + host
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (connection, its last response), reusable once the response is read
+        self.connections = []
+        self.next_request = 0
+        self.failures = 0
+        self.open_until = 0
+
+
+class Network:
+    """
+    Sends every urllib request over kept alive connections shared per host
+
+    Requests to a host are spaced out to at most rate a second. Connection
+    errors and overloaded responses (RETRY_STATUSES) of requests without
+    a body are retried with exponential backoff. A host that fails
+    breaker_failures requests in a row is skipped for breaker_cooldown
+    seconds, requests to it fail straight away with a 503, after which
+    one more failure skips it again
+    """
+
+    def __init__(
+        self,
+        pool_size=NETWORK_POOL_SIZE,
+        rate=NETWORK_HOST_RATE,
+        retries=NETWORK_RETRIES,
+        backoff=NETWORK_BACKOFF,
+        breaker_failures=NETWORK_BREAKER_FAILURES,
+        breaker_cooldown=NETWORK_BREAKER_COOLDOWN,
+        timeout=NETWORK_TIMEOUT,
+    ):
+        self.pool_size = pool_size
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._ssl_context = None
+
+    def host(self, key):
+        with self._lock:
+            if key not in self._hosts:
+                self._hosts[key] = Host()
+            return self._hosts[key]
+
+    def check_breaker(self, req, host):
+        with host.lock:
+            remaining = host.open_until - time.monotonic()
+        if remaining > 0:
+            count("network.breaker_skipped")
+            raise urllib.error.HTTPError(
+                req.full_url,
+                503,
+                f"{req.host} failed too often, skipping it for {remaining:.0f}s",
+                http.client.HTTPMessage(),
+                None,
+            )
+
+    def record(self, req, host, ok):
+        with host.lock:
+            if ok:
+                host.failures = 0
+                return
+            host.failures += 1
+            if host.failures < self.breaker_failures:
+                return
+            host.open_until = time.monotonic() + self.breaker_cooldown
+            # a single failure after the cooldown opens it again
+            host.failures = self.breaker_failures - 1
+        count("network.breaker_opened")
+        logger.warning(
+            f"{req.host} failed {self.breaker_failures} times in a row, "
+            f"skipping it for {self.breaker_cooldown}s"
+        )
+
+    def throttle(self, host):
+        if not self.rate:
+            return
+        with host.lock:
+            now = time.monotonic()
+            wait = host.next_request - now
+            host.next_request = max(now, host.next_request) + 1 / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def new_connection(self, req, timeout):
+        if req.type == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            return HTTPSConnection(req.host, timeout=timeout, context=self._ssl_context)
+        return HTTPConnection(req.host, timeout=timeout)
+
+    def get_connection(self, req, host, timeout):
+        """
+        :return: tuple of a connection to the host and whether it was reused
+        """
+        with host.lock:
+            for idx, (connection, response) in enumerate(host.connections):
+                if response.isclosed():
+                    del host.connections[idx]
+                    break
+            else:
+                connection = None
+
+        if connection is None:
+            return self.new_connection(req, timeout), False
+        if not response.reusable:
+            connection.close()
+            return self.new_connection(req, timeout), False
+
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection, True
+
+    def put_connection(self, host, connection, response):
+        with host.lock:
+            host.connections.append((connection, response))
+            # forget the oldest, closing them if nothing is reading from them
+            while len(host.connections) > self.pool_size:
+                old_connection, old_response = host.connections.pop(0)
+                if old_response.isclosed():
+                    old_connection.close()
+
+    def send(self, req, host, timeout):
+        headers = dict(req.unredirected_hdrs)
+        headers.update(
+            {key: value for key, value in req.headers.items() if key not in headers}
+        )
+        headers = {key.title(): value for key, value in headers.items()}
+
+        connection, reused = self.get_connection(req, host, timeout)
+        while True:
+            try:
+                connection.request(
+                    req.get_method(),
+                    req.selector,
+                    req.data,
+                    headers,
+                    encode_chunked=req.has_header("Transfer-encoding"),
+                )
+                response = connection.getresponse()
+            except ConnectionError:
+                connection.close()
+                if not reused:
+                    raise
+                # the server closed it while it sat idle, try a fresh one
+                connection, reused = self.new_connection(req, timeout), False
+                continue
+            except Exception:
+                connection.close()
+                raise
+            break
+
+        if reused:
+            count("network.reused")
+        self.put_connection(host, connection, response)
+        return response
+
+    def delay(self, attempt, response=None):
+        retry_after = response.getheader("Retry-After") if response else None
+        if retry_after and retry_after.isdigit():
+            if int(retry_after) <= MAX_RETRY_AFTER:
+                return int(retry_after)
+        return self.backoff * 2**attempt * random.uniform(0.5, 1)
+
+    def open(self, req):
+        """
+        The response to req, for urllib to treat like that of HTTPHandler
+        """
+        host = self.host((req.type, req.host))
+        self.check_breaker(req, host)
+
+        timeout = req.timeout
+        if not isinstance(timeout, (int, float)):
+            timeout = self.timeout
+
+        retries = self.retries if req.data is None else 0
+        attempt = 0
+        while True:
+            self.throttle(host)
+            count("network.requests")
+            try:
+                response = self.send(req, host, timeout)
+            except OSError as ex:
+                if attempt >= retries:
+                    self.record(req, host, False)
+                    raise urllib.error.URLError(ex)
+                delay = self.delay(attempt)
+                logger.debug(f"Retrying {req.full_url} in {delay:.1f}s: {ex}")
+            else:
+                if response.status not in RETRY_STATUSES:
+                    self.record(req, host, True)
+                    break
+                if attempt >= retries:
+                    self.record(req, host, False)
+                    break
+                delay = self.delay(attempt, response)
+                logger.debug(
+                    f"Retrying {req.full_url} in {delay:.1f}s: {response.status}"
+                )
+                response.read()
+                response.close()
+
+            count("network.retries")
+            attempt += 1
+            time.sleep(delay)
+
+        response.url = req.get_full_url()
+        response.msg = response.reason
+        return response
+
+    def close(self):
+        with self._lock:
+            hosts = list(self._hosts.values())
+            self._hosts = {}
+        for host in hosts:
+            with host.lock:
+                for connection, _ in host.connections:
+                    connection.close()
+                host.connections = []
+
+
+NETWORK = Network()
+
+
+class PooledHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        if req.has_proxy():
+            return super().http_open(req)
+        return NETWORK.open(req)
+
+
+class PooledHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        if req.has_proxy():
+            return super().https_open(req)
+        return NETWORK.open(req)
+
+
+def install():
+    """
+    Make urlopen, and so urlretrieve and isbnlib, go through NETWORK
+    unless NETWORK_POOLING is off
+
+    Done by the entry points and batch worker processes rather than on
+    import so using pdf2ebook as a library leaves the process' opener be
+    """
+    if not NETWORK_POOLING:
+        return
+    urllib.request.install_opener(
+        urllib.request.build_opener(PooledHTTPHandler, PooledHTTPSHandler)
+    )
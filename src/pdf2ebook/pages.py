@@ -2,12 +2,66 @@ import re
 from collections import Counter
 
 from pdf2ebook import logger
-from pdf2ebook.utils import window
+from pdf2ebook.utils import window, page_offsets
+from pdf2ebook.instrumentation import stage, count
+from pdf2ebook.text_page import TextPage
+
+
+MAX_CLEAN_PASSES = 10
+
+# How many lines at the top / bottom of a page to look at for headers,
+# footers and page numbers
+EDGE_LINES = 3
+
+
+class LineIndex:
+    """
+    The first and last few lines of each page's cleaned_text_content
+
+    A page's lines are only worked out again after the page changes, and
+    only the lines needed, not every line of the page
+    """
+
+    def __init__(self, size=EDGE_LINES):
+        self.size = size
+        self._entries = {}
+
+    def get(self, page):
+        """
+        :return: tuple of the first and the last lines of the page
+        """
+        entry = self._entries.get(id(page))
+        if entry is None or entry[0] is not page or entry[1] != page.fingerprint:
+            entry = (page, page.fingerprint, self._edges(page.text_content))
+            self._entries[id(page)] = entry
+        return entry[2]
+
+    def _edges(self, text):
+        lines = text.split("\n")
+
+        first = 0
+        while first < len(lines) and not lines[first].strip():
+            first += 1
+        if first == len(lines):
+            return [""], [""]
+
+        last = len(lines) - 1
+        while not lines[last].strip():
+            last -= 1
+
+        head = [
+            line.strip() for line in lines[first : min(first + self.size, last + 1)]
+        ]
+        tail = [
+            line.strip() for line in lines[max(last + 1 - self.size, first) : last + 1]
+        ]
+        return head, tail
 
 
 class BasePages:
     def __init__(self, *args, **kwargs):
         self._data = []
+        self.line_index = LineIndex()
 
     def append(self, item):
         self._data.append(item)
@@ -25,54 +79,88 @@ class BasePages:
         for one, two in window(self._data, window_size=2):
             one.set_next_page(two)
 
-
-class TextPages(BasePages):
-    def detect_header(self):
-        lines = []
-        for page in self:
-            lines.extend(
-                [
-                    i
-                    for i in page.cleaned_text_content.split("\n")[:3]
-                    if i  # FIXME: shouldn't need to check, cleaned data should be stripped
-                ]
+    def clean(self, max_passes=MAX_CLEAN_PASSES):
+        """
+        Remove page numbers, headers and footers until that stops changing
+        anything
+
+        Cleaning is deterministic so a page that a pass didn't change won't
+        be changed by the next pass either, unless what was detected changed.
+        Only the pages changed by the last pass are cleaned again.
+
+        :return: number of passes it took
+        """
+        dirty = set(range(len(self)))
+        detected = None
+        passes = 0
+        while dirty and passes < max_passes:
+            passes += 1
+
+            with stage("clean.detect"):
+                self.set_page_number_position()
+                header = self.detect_header()
+                footer = self.detect_footer()
+
+            current = (header, footer, [page.page_number_position for page in self])
+            if detected is not None and current != detected:
+                dirty = set(range(len(self)))
+            detected = current
+
+            changed = set()
+            with stage("clean.pages"):
+                for idx in sorted(dirty):
+                    page = self[idx]
+                    before = page.fingerprint
+                    page.remove_page_number()
+                    page.remove_header(header)
+                    page.remove_footer(footer)
+                    if page.fingerprint != before:
+                        changed.add(idx)
+            count("clean.passes")
+            count("clean.pages_cleaned", len(dirty))
+
+            logger.debug(
+                f"Cleaning pass {passes}: cleaned {len(dirty)} pages, {len(changed)} changed"
             )
-        if len(Counter(lines).most_common(1)):
-            line, count = Counter(lines).most_common(1)[0]
-            # look over the first x lines and watch for similarities
-            if count > len(self) / 4:
-                logger.debug(f"Detected header: {line}")
-                return line
+            dirty = changed
 
-    def detect_footer(self):
-        lines = []
-        for page in self:
-            lines.extend(
-                [
-                    i
-                    for i in page.cleaned_text_content.split("\n")[-3:]
-                    if i  # FIXME: shouldn't need to check, cleaned data should be stripped
-                ]
-            )
+        if dirty:
+            logger.warning(f"Stopped cleaning after {passes} passes, still changing")
+
+        return passes
 
-        if len(Counter(lines).most_common(1)):
-            line, count = Counter(lines).most_common(1)[0]
+    def _most_common_line(self, lines):
+        most_common = Counter(line for line in lines if line).most_common(1)
+        if most_common:
+            line, count = most_common[0]
             # look over the first x lines and watch for similarities
             if count > len(self) / 4:
-                logger.debug(f"Detected footer: {line}")
                 return line
 
+    def detect_header(self):
+        line = self._most_common_line(
+            line for page in self for line in self.line_index.get(page)[0]
+        )
+        if line:
+            logger.debug(f"Detected header: {line}")
+        return line
+
+    def detect_footer(self):
+        line = self._most_common_line(
+            line for page in self for line in self.line_index.get(page)[1]
+        )
+        if line:
+            logger.debug(f"Detected footer: {line}")
+        return line
+
     def set_page_number_position(self):
         top_matches = 0
-        for page in self:
-            first_line = page.cleaned_text_content.split("\n")[0]
-            if re.match("^\d+", first_line) or re.match("\d+$", first_line):
-                top_matches += 1
-
         bottom_matches = 0
         for page in self:
-            last_line = page.cleaned_text_content.split("\n")[-1]
-            if re.match("^\d+", last_line) or re.match("\d+$", last_line):
+            head, tail = self.line_index.get(page)
+            if re.match(r"^\d+", head[0]) or re.match(r"\d+$", head[0]):
+                top_matches += 1
+            if re.match(r"^\d+", tail[-1]) or re.match(r"\d+$", tail[-1]):
                 bottom_matches += 1
 
         # make sure 50% of pages follow the pattern
@@ -86,61 +174,28 @@ class TextPages(BasePages):
                 page.page_number_position = "bottom"
 
 
-class HtmlPages(BasePages):
-    def detect_header(self):
-        lines = []
-        for page in self:
-            lines.extend(
-                [
-                    i
-                    for i in page.cleaned_text_content.split("\n")[:3]
-                    if i  # FIXME: shouldn't need to check, cleaned data should be stripped
-                ]
-            )
-        if len(Counter(lines).most_common(1)):
-            line, count = Counter(lines).most_common(1)[0]
-            # look over the first x lines and watch for similarities
-            if count > len(self) / 4:
-                logger.debug(f"Detected header: {line}")
-                return line
-
-    def detect_footer(self):
-        lines = []
-        for page in self:
-            lines.extend(
-                [
-                    i
-                    for i in page.cleaned_text_content.split("\n")[-3:]
-                    if i  # FIXME: shouldn't need to check, cleaned data should be stripped
-                ]
-            )
-
-        if len(Counter(lines).most_common(1)):
-            line, count = Counter(lines).most_common(1)[0]
-            # look over the first x lines and watch for similarities
-            if count > len(self) / 4:
-                logger.debug(f"Detected footer: {line}")
-                return line
-
-    def set_page_number_position(self):
-        # FIXME: For html use tag context rather than just text
-
-        top_matches = 0
-        for page in self:
-            first_line = page.cleaned_text_content.split("\n")[0]
-            if re.match("^\d+", first_line) or re.match("\d+$", first_line):
-                top_matches += 1
+class TextPages(BasePages):
+    def __init__(self, *args, **kwargs):
+        super(TextPages, self).__init__(*args, **kwargs)
+        self.content = kwargs.get("content", "")
+        self.offsets = page_offsets(self.content, breaks=kwargs.get("breaks", None))
+
+    @classmethod
+    def from_content(cls, content, breaks=None):
+        """
+        One page per form feed separated page of pdftotext output, all
+        sharing the one copy of the text and its page offsets
+
+        :kwarg breaks: offsets of the form feeds if already known
+        """
+        pages = cls(content=content, breaks=breaks)
+        # The last two pieces don't get a page of their own, the last page
+        # runs to the end of the content
+        for idx in range(max(len(pages.offsets) - 2, 0)):
+            pages.append(TextPage(idx, content, offsets=pages.offsets))
+        return pages
 
-        bottom_matches = 0
-        for page in self:
-            last_line = page.cleaned_text_content.split("\n")[-1]
-            if re.match("^\d+", last_line) or re.match("\d+$", last_line):
-                bottom_matches += 1
 
-        # make sure 50% of pages follow the pattern
-        if top_matches > len(self) / 2 and bottom_matches < len(self) / 2:
-            for page in self:
-                page.page_number_position = "top"
-        elif bottom_matches > len(self) / 2 and top_matches < len(self) / 2:
-            for page in self:
-                page.page_number_position = "bottom"
+class HtmlPages(BasePages):
+    # FIXME: For html use tag context rather than just text for page numbers
+    pass
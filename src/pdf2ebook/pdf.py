@@ -1,19 +1,21 @@
 import os
+import shutil
+import weakref
+import tempfile
 import urllib.request
-from io import StringIO
 
-import bs4
 from ebooklib import epub
 from ebooklib.plugins import standard
 from cached_property import cached_property
 
 from pdf2ebook import logger
-from pdf2ebook.utils import is_local_htmlex_ok, is_docker_installed
-from pdf2ebook.text_page import TextPage
+from pdf2ebook.utils import is_local_htmlex_ok, is_docker_installed, get_scratch_dir
 from pdf2ebook.html_page import HTMLPage
 from pdf2ebook.pages import TextPages, HtmlPages
-from pdf2ebook.utils import window
+from pdf2ebook.utils import split_html_pages, count_html_words
 from pdf2ebook.base_pdf import BasePDF
+from pdf2ebook.extract import extract_text, extract_html
+from pdf2ebook.instrumentation import stage
 
 
 class PDF(BasePDF):
@@ -26,13 +28,16 @@ class PDF(BasePDF):
         self._title = kwargs.get("title", None)
 
         self.text_content = None
+        self.text_breaks = None
         self.html_ex_content = None
 
         self.text_file = None
         self.html_file = None
+        self.scratch_dir = None
         self.html_ex_file = None
 
-        self.loaded = False
+        self.text_loaded = False
+        self.html_loaded = False
 
     def set_title(self, book):
         title = self.get_title()
@@ -71,7 +76,8 @@ class PDF(BasePDF):
         return book
 
     def to_epub(self, path=None):
-        self.load()
+        with stage("load"):
+            self.load()
 
         if self.use_text:
             logger.warning("Only using text, images will not be included")
@@ -79,93 +85,93 @@ class PDF(BasePDF):
         book = epub.EpubBook()
 
         if self.use_html:
+            with stage("images"):
+                for page in self.pages:
+                    for image in page.images:
+                        book.add_item(image)
+
+        passes = self.pages.clean()
+        logger.debug(f"Cleaned pages in {passes} passes")
+
+        with stage("epub_content"):
             for page in self.pages:
-                for image in page.images:
-                    book.add_item(image)
-
-        last_hash = None
-        while last_hash != self.content_hash:
-            last_hash = self.content_hash
-            self.pages.set_page_number_position()
-            header = self.pages.detect_header()
-            footer = self.pages.detect_footer()
-            for page in self.pages:
-                page.remove_page_number()
-                page.remove_header(header)
-                page.remove_footer(footer)
-
-        for page in self.pages:
-            if (
-                bs4.BeautifulSoup(
-                    StringIO(page.epub_content.content), "html.parser"
-                ).text
-                == ""
-                and bs4.BeautifulSoup(
-                    StringIO(page.epub_content.content), "html.parser"
-                ).find("img")
-                is None
-            ):
-                continue
-            page.strip_whitespace()
-            book.add_item(page.epub_content)
-
-        book.add_item(epub.EpubNcx())
-        book.add_item(epub.EpubNav())
-
-        book.spine = ["nav"] + [c.epub_content for c in self.pages]
-
-        langs = [page.lang for page in self.pages]
-        lang = max(set(langs), key=langs.count)
+                if page.is_empty:
+                    continue
+                page.strip_whitespace()
+                book.add_item(page.epub_content)
+
+            book.add_item(epub.EpubNcx())
+            book.add_item(epub.EpubNav())
+
+            book.spine = ["nav"] + [c.epub_content for c in self.pages]
+
+        with stage("lang"):
+            langs = [page.lang for page in self.pages]
+            lang = max(set(langs), key=langs.count)
         if lang is None:
             logger.warning("Could not detect language")
         else:
             logger.debug(f"Language detected: {lang}")
             book.set_language(lang)
 
-        book = self.set_identifier(book)
-        book = self.set_authors(book)
-        book = self.set_title(book)
-        book = self.set_published_date(book)
-        book = self.set_publisher(book)
+        with stage("metadata"):
+            book = self.set_identifier(book)
+            book = self.set_authors(book)
+            book = self.set_title(book)
+            book = self.set_published_date(book)
+            book = self.set_publisher(book)
 
         if self.get_thumbnail_url():
-            # NOTE: https://github.com/aerkalov/ebooklib/issues/220
-            urllib.request.urlretrieve(
-                self.get_thumbnail_url(),
-                f"/tmp/{os.path.splitext(os.path.basename(self.pdf_path))[0]}___cover.jpg",
-            )
-
-        opts = {"plugins": [standard.SyntaxPlugin()]}
-        epub.write_epub(path, book, opts)
+            with stage("thumbnail"):
+                # NOTE: https://github.com/aerkalov/ebooklib/issues/220
+                urllib.request.urlretrieve(
+                    self.get_thumbnail_url(),
+                    f"/tmp/{os.path.splitext(os.path.basename(self.pdf_path))[0]}___cover.jpg",
+                )
+
+        with stage("write_epub"):
+            opts = {"plugins": [standard.SyntaxPlugin()]}
+            epub.write_epub(path, book, opts)
         logger.debug(f"Epub saved: {path}")
 
     def load_text(self):
-        self.text_file = self.pdf_path + ".txt"
+        if self.text_loaded:
+            return
+        self.text_loaded = True
 
-        os.system(f"pdftotext '{self.pdf_path}' '{self.text_file}'")
+        text_content, text_breaks = extract_text(self.pdf_path)
 
-        if not os.path.exists(self.text_file):
-            logger.error("Could not convert pdf to text: %s" % (self.text_file))
+        if text_content is None:
+            logger.error("Could not convert pdf to text: %s" % (self.pdf_path))
             return
 
-        self.text_content = open(self.text_file, "r").read()
+        self.text_content = text_content
+        self.text_breaks = text_breaks
 
     def load_html(self):
-        self.html_file = self.pdf_path.replace(".pdf", "s.html")
+        if self.html_loaded:
+            return
+        self.html_loaded = True
 
-        os.system(f"pdftohtml -q '{self.pdf_path}'")
+        # Keep everything pdftohtml writes out of the input's directory
+        self.scratch_dir = tempfile.mkdtemp(prefix="pdf2ebook_", dir=get_scratch_dir())
+        weakref.finalize(self, shutil.rmtree, self.scratch_dir, ignore_errors=True)
+        self.html_file = os.path.join(
+            self.scratch_dir,
+            os.path.splitext(os.path.basename(self.pdf_path))[0] + "s.html",
+        )
 
-        if not os.path.exists(self.html_file):
+        if not extract_html(self.pdf_path, self.html_file):
             logger.error("Could not convert pdf to html: %s" % (self.html_file))
-            self.loaded = True
+            self.html_file = None
             return
 
     def load(self):
-        if self.loaded:
-            return
-
-        self.load_text()
-        self.load_html()
+        # Only run the extractor that's going to be used
+        if self.use_html:
+            self.load_html()
+        else:
+            self.load_text()
 
     @property
     def use_text(self):
@@ -177,17 +183,25 @@ class PDF(BasePDF):
 
         return False
 
-    @property
+    @cached_property
+    def html_content(self):
+        with open(self.html_file, "r") as f:
+            return f.read()
+
+    @cached_property
     def use_html(self):
         if self._use_html is not None:
             return self._use_html
 
-        soup = bs4.BeautifulSoup(open(self.html_file), "html.parser")
+        if self._use_text:
+            return False
 
-        if len(soup.text.split(" ")) > 2000:
-            return True
+        self.load_html()
+        if self.html_file is None:
+            return False
 
-        return False
+        with open(self.html_file, "r") as f:
+            return count_html_words(f, limit=2000) > 2000
 
     @property
     def use_html_ex(self):
@@ -200,6 +214,10 @@ class PDF(BasePDF):
     def pages(self):
         self.load()
 
+        with stage("pages"):
+            return self._make_pages()
+
+    def _make_pages(self):
         # TODO Find contents / table of contents and start after that. Who needs acks
         pages = None
 
@@ -207,38 +225,12 @@ class PDF(BasePDF):
             pages = HtmlPages()
             logger.debug("Generating pages using html")
 
-            soup = bs4.BeautifulSoup(open(self.html_file), "html.parser")
-            html_content = open(self.html_file, "r").read()
-            body = soup.find("body")
-            breaks = body.find_all("hr")
-
-            page_idx = 0
-
-            pages.append(
-                HTMLPage(
-                    page_idx,
-                    "\n".join(
-                        html_content.split("\n")[body.sourceline : breaks[0].sourceline]
-                    ),
-                )
-            )
-            for idx, (i, j) in enumerate(window(breaks, window_size=2)):
-                pages.append(
-                    HTMLPage(
-                        idx + 1,
-                        "\n".join(
-                            html_content.split("\n")[i.sourceline : j.sourceline]
-                        ),
-                    )
-                )
+            for idx, page_content in enumerate(split_html_pages(self.html_content)):
+                pages.append(HTMLPage(idx, page_content))
         elif self.use_text:
-            pages = TextPages()
             logger.debug("Generating pages using only text")
             # TODO: if all the content looks to be in html, use that rather than text
-            for idx, (p, c, n) in enumerate(
-                window(self.text_content.split("\x0c"), window_size=3)
-            ):
-                pages.append(TextPage(idx, self.text_content))
+            pages = TextPages.from_content(self.text_content, breaks=self.text_breaks)
 
         else:
             raise Exception("Could not convert")
@@ -0,0 +1,44 @@
+import difflib
+
+
+class SequenceMatcherEngine:
+    """
+    The same decisions as difflib.SequenceMatcher(None, line, target).ratio() > threshold
+
+    The target is indexed once rather than for every line, and lines are
+    rejected on the cheap upper bounds of the ratio (their length, then
+    their characters) before the full ratio is worked out
+    """
+
+    def __init__(self, target, threshold=0.8):
+        self.target = target
+        self.threshold = threshold
+        self._matcher = difflib.SequenceMatcher(None, "", target)
+
+    def matches(self, line):
+        total = len(line) + len(self.target)
+        if not total:
+            # ratio() of two empty strings is 1
+            return 1.0 > self.threshold
+
+        # real_quick_ratio(), the ratio if every character of the shorter matched
+        if 2.0 * min(len(line), len(self.target)) / total <= self.threshold:
+            return False
+
+        self._matcher.set_seq1(line)
+        if self._matcher.quick_ratio() <= self.threshold:
+            return False
+        return self._matcher.ratio() > self.threshold
+
+    def match_many(self, lines):
+        return [self.matches(line) for line in lines]
+
+
+def get_matcher(target, threshold=0.8):
+    """
+    Matcher for lines similar to target
+
+    A new one every call, matching changes the matcher's state so one
+    can't be shared between threads converting pages at once
+    """
+    return SequenceMatcherEngine(target, threshold=threshold)
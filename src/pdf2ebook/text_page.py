@@ -1,32 +1,53 @@
-import difflib
-
 from boltons.iterutils import strip
 
 from ebooklib import epub
 from ebooklib.utils import create_pagebreak
 
 from pdf2ebook.base_page import BasePage
+from pdf2ebook.similarity import get_matcher
+from pdf2ebook.utils import page_offsets
 from pdf2ebook.w2n import word_to_num
 
 
 class TextPage(BasePage):
-    def __init__(self, idx, content):
+    """
+    A view on the pages from idx up to the next page of the whole document's
+    text, content is shared between pages and the text is only sliced out
+    of it when first used
+    """
+
+    def __init__(self, idx, content, offsets=None):
         self.idx = idx
         self.next_page = None
         self.content = content
-
-        if self.next_page is not None:
-            self.raw_content = "\n".join(
-                self.content.split("\x0c")[self.idx : self.next_page.idx]
-            )
-        else:
-            self.raw_content = "\n".join(self.content.split("\x0c")[self.idx :])
+        self.offsets = offsets if offsets is not None else page_offsets(content)
+        self._raw_content = None
 
         super(TextPage, self).__init__()
 
     @property
-    def content_hash(self):
-        return hash(self.text_content)
+    def raw_content(self):
+        if self._raw_content is None:
+            stop = len(self.offsets)
+            if self.next_page is not None:
+                stop = min(self.next_page.idx, stop)
+
+            if self.idx >= stop:
+                self._raw_content = ""
+            else:
+                self._raw_content = self.content[
+                    self.offsets[self.idx][0] : self.offsets[stop - 1][1]
+                ].replace("\x0c", "\n")
+        return self._raw_content
+
+    @raw_content.setter
+    def raw_content(self, value):
+        self._raw_content = value
+        self.invalidate_fingerprint()
+
+    @property
+    def fingerprint_content(self):
+        return self.raw_content
 
     @property
     def text_content(self):
@@ -72,6 +93,11 @@ class TextPage(BasePage):
             content += "<p>" + para + "</p>"
         return content
 
+    @property
+    def is_empty(self):
+        # What's left of html_content once the paragraph tags are gone
+        return "".join(self.text_content.split("\n\n")) == ""
+
     @property
     def epub_content(self):
         # need a different content that strips headers and footers
@@ -91,15 +117,10 @@ class TextPage(BasePage):
     def remove_header(self, header):
         if not header:
             return
-        content = []
-        for idx, line in enumerate(self.text_content.split("\n")):
-            if idx < 5:
-                if difflib.SequenceMatcher(None, line, header).ratio() > 0.8:
-                    pass
-                else:
-                    content.append(line)
-            else:
-                content.append(line)
+        lines = self.text_content.split("\n")
+        matched = get_matcher(header).match_many(lines[:5])
+        content = [line for line, match in zip(lines, matched) if not match]
+        content.extend(lines[5:])
 
         if content:
             self.raw_content = "\n".join(content)
@@ -107,27 +128,18 @@ class TextPage(BasePage):
     def remove_footer(self, footer):
         if not footer:
             return
-        content = []
-        for idx, line in enumerate(reversed(self.text_content.split("\n"))):
-            if idx < 5:
-                if difflib.SequenceMatcher(None, line, footer).ratio() > 0.8:
-                    pass
-                else:
-                    content.append(line)
-            else:
-                content.append(line)
+        lines = self.text_content.split("\n")
+        matched = get_matcher(footer).match_many(lines[-5:])
+        content = lines[: max(len(lines) - 5, 0)]
+        content.extend(line for line, match in zip(lines[-5:], matched) if not match)
 
         if content:
-            self.raw_content = "\n".join(reversed(content))
+            self.raw_content = "\n".join(content)
 
     def set_next_page(self, next_page):
         self.next_page = next_page
-        if self.next_page is not None:
-            self.raw_content = "\n".join(
-                self.content.split("\x0c")[self.idx : self.next_page.idx]
-            )
-        else:
-            self.raw_content = "\n".join(self.content.split("\x0c")[self.idx :])
+        self._raw_content = None
+        self.invalidate_fingerprint()
 
     def strip_whitespace(self):
         self.raw_content = "\n".join(strip(self.raw_content.split("\n"), ""))
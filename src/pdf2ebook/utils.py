@@ -1,15 +1,25 @@
 import re
 import os
+import time
+import hashlib
+import tempfile
 from shutil import which
 from itertools import islice
 from urllib.request import urlopen
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import bs4
 from googlesearch import search
 import isbnlib
 
 from pdf2ebook import logger
-
+from pdf2ebook.constants import (
+    ISBN_SEARCH_WORKERS,
+    ISBN_SEARCH_TIMEOUT,
+    ISBN_SEARCH_DEADLINE,
+    ISBN_SEARCH_MAX_BYTES,
+    SCRATCH_ROOT,
+)
 
 try:  # pragma: no cover
     from urllib.parse import quote
@@ -22,6 +32,9 @@ from isbnlib.dev import webservice
 ISBN_REGEX = r"978[0-9\-]+"
 ISBN_PATTERN = re.compile(ISBN_REGEX, re.UNICODE)
 
+BODY_PATTERN = re.compile(r"<body[\s>]", re.IGNORECASE)
+HR_PATTERN = re.compile(r"<hr[\s/>]", re.IGNORECASE)
+
 
 def get_isbn(text):
     isbns = get_isbns(text)
@@ -51,6 +64,112 @@ def window(sequence, window_size=2):
         yield result
 
 
+def split_html_pages(html_content):
+    """
+    Yields the html of each page of pdftohtml output in one pass
+
+    A page is every line after the line with the previous <hr> (or <body>)
+    up to and including the line with its own <hr>
+    """
+    body = BODY_PATTERN.search(html_content)
+    if body is None:
+        return
+
+    start = html_content.find("\n", body.start())
+    if start == -1:
+        return
+    start += 1
+
+    for match in HR_PATTERN.finditer(html_content, start):
+        if match.start() < start:
+            # Another <hr> on the line of the last one
+            yield ""
+            continue
+
+        end = html_content.find("\n", match.start())
+        if end == -1:
+            end = len(html_content)
+
+        yield html_content[start:end]
+        start = end + 1
+
+
+def count_html_words(stream, limit=None, chunk_size=64 * 1024):
+    """
+    Roughly len(BeautifulSoup(html).text.split(" ")) without parsing the
+    html, reading it a chunk at a time and stopping once past limit
+    """
+    words = 1
+    in_tag = False
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return words
+
+        pos = 0
+        while pos < len(chunk):
+            if in_tag:
+                end = chunk.find(">", pos)
+                if end == -1:
+                    break
+                in_tag = False
+                pos = end + 1
+            else:
+                start = chunk.find("<", pos)
+                if start == -1:
+                    words += chunk.count(" ", pos)
+                    break
+                words += chunk.count(" ", pos, start)
+                in_tag = True
+                pos = start + 1
+
+        if limit is not None and words > limit:
+            return words
+
+
+def page_offsets(content, separator="\x0c", breaks=None):
+    """
+    (start, end) of each separator delimited page in content, the same
+    pieces as content.split(separator) without copying them out
+
+    :kwarg breaks: offsets of every separator in content if already known
+    """
+    if breaks is None:
+        breaks = []
+        idx = content.find(separator)
+        while idx != -1:
+            breaks.append(idx)
+            idx = content.find(separator, idx + len(separator))
+
+    offsets = []
+    start = 0
+    for end in breaks:
+        offsets.append((start, end))
+        start = end + len(separator)
+    offsets.append((start, len(content)))
+    return offsets
+
+
+def fingerprint(content):
+    """
+    Stable digest of some text, unlike hash() it is the same between processes
+    """
+    return hashlib.blake2b(
+        content.encode("utf-8", "surrogatepass"), digest_size=16
+    ).digest()
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """
+    sha256 hexdigest of a file's contents, read in chunks
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def remove_page_no(content):
     # bit risky, should be told if to remove from start or end
     return re.sub("(^\d+)|(\d+$)", "", content).strip()
@@ -85,32 +204,121 @@ def is_docker_installed():
     return bool(which("docker"))
 
 
-def get_isbn_from_content(content, engine="google"):
-    for url_result in search(content, stop=10):
-        url_isbn = get_isbn(url_result)
-        if url_isbn:
-            return url_isbn
+def get_scratch_dir():
+    """
+    The directory only pdf2ebook's working files go in, under SCRATCH_ROOT
+    or the system temp dir, so it alone can be mounted into containers
+    """
+    scratch_dir = os.path.join(SCRATCH_ROOT or tempfile.gettempdir(), "pdf2ebook")
+    os.makedirs(scratch_dir, mode=0o700, exist_ok=True)
+    return scratch_dir
 
-        # if it ends in .pdf we can skip, likely what we have
-        if url_result.endswith(".pdf"):
-            continue
 
-        try:
-            source = urlopen(url_result)
-            soup = bs4.BeautifulSoup(source, "html.parser")
-
-            title_isbn = get_isbn(soup.title.text)
-            if title_isbn:
-                return title_isbn
-
-            content_isbns = get_isbns(soup.text)
-            if len(content_isbns) > 1:
-                # TODO: be smarter, may ref other books
-                pass
-            elif len(content_isbns) == 1:
-                return content_isbns[0]
-        except Exception as ex:
-            logger.warning(f"Could not search for isbn from content: {ex}")
+def google_search(query):
+    return search(query, stop=10)
+
+
+def fetch(url, timeout, max_bytes):
+    """
+    Up to max_bytes of url, giving up once timeout seconds have passed
+    overall rather than only between reads
+    """
+    end = time.monotonic() + timeout
+    chunks = []
+    size = 0
+    with urlopen(url, timeout=timeout) as response:
+        while size < max_bytes:
+            if time.monotonic() > end:
+                raise TimeoutError(f"Took longer than {timeout}s to read {url}")
+            chunk = response.read(min(64 * 1024, max_bytes - size))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+    return b"".join(chunks)
+
+
+def get_isbn_from_page(url, timeout, max_bytes):
+    try:
+        soup = bs4.BeautifulSoup(fetch(url, timeout, max_bytes), "html.parser")
+    except Exception as ex:
+        logger.warning(f"Could not search for isbn from content: {ex}")
+        return None
+
+    if soup.title:
+        title_isbn = get_isbn(soup.title.text)
+        if title_isbn:
+            return title_isbn
+
+    content_isbns = get_isbns(soup.text)
+    if len(content_isbns) > 1:
+        # TODO: be smarter, may ref other books
+        pass
+    elif len(content_isbns) == 1:
+        return content_isbns[0]
+
+
+def get_isbn_from_content(
+    content,
+    engine="google",
+    search_fn=google_search,
+    workers=ISBN_SEARCH_WORKERS,
+    timeout=ISBN_SEARCH_TIMEOUT,
+    deadline=ISBN_SEARCH_DEADLINE,
+    max_bytes=ISBN_SEARCH_MAX_BYTES,
+):
+    """
+    Search for the content and look for an isbn in the results, in each
+    result's url and then its page, the pages fetched at once
+
+    Earlier results are preferred, so a result's isbn is only used once
+    every result before it has come up empty
+    """
+    urls = list(search_fn(content))
+    if not urls:
+        return None
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(urls)))
+    try:
+        # What each result says, in order, from its url or else its page
+        futures = []
+        for url in urls:
+            url_isbn = get_isbn(url)
+            if url_isbn:
+                future = Future()
+                future.set_result(url_isbn)
+                futures.append(future)
+                # no result after this one is needed
+                break
+            # if it ends in .pdf we can skip, likely what we have
+            if not url.endswith(".pdf"):
+                futures.append(
+                    executor.submit(get_isbn_from_page, url, timeout, max_bytes)
+                )
+
+        end = time.monotonic() + deadline
+        not_done = {future for future in futures if not future.done()}
+        while True:
+            for future in futures:
+                if future in not_done:
+                    break
+                if future.result():
+                    return future.result()
+            else:
+                return None
+
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Gave up searching for isbn after {deadline}s")
+                break
+            _, not_done = wait(not_done, timeout=remaining, return_when=FIRST_COMPLETED)
+
+        for future in futures:
+            if future.done() and future.result():
+                return future.result()
+    finally:
+        # Don't wait on pages that are no longer needed
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 def get_thumbnail_url_from_isbn(isbn):
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import tempfile
+
+from mock import patch
+from unittest import TestCase
+
+from pdf2ebook.batch import (
+    Job,
+    convert,
+    jobs_from_dir,
+    jobs_from_manifest,
+    run_batch,
+    run_job,
+    init_worker,
+    scan_book,
+    prefetch_metadata,
+)
+from pdf2ebook.cache import ResultCache
+
+
+class BatchTest(TestCase):
+    def test_jobs_from_dir(self):
+        with tempfile.TemporaryDirectory() as in_dir:
+            for filename in ["b.pdf", "a.PDF", "notes.txt"]:
+                open(os.path.join(in_dir, filename), "w").close()
+
+            jobs = jobs_from_dir(in_dir, "/tmp/out")
+
+        self.assertEqual(
+            [(os.path.basename(j.in_file), j.out_file) for j in jobs],
+            [("a.PDF", "/tmp/out/a.epub"), ("b.pdf", "/tmp/out/b.epub")],
+        )
+
+    def test_jobs_from_manifest(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as manifest:
+            manifest.write("/books/one.pdf\n")
+            manifest.write("\n# comment\n")
+            manifest.write(
+                json.dumps(
+                    {"in": "/books/two.pdf", "out": "/else/2.epub", "title": "Two"}
+                )
+                + "\n"
+            )
+            manifest.flush()
+
+            jobs = jobs_from_manifest(manifest.name, "/tmp/out")
+
+        self.assertEqual(
+            jobs,
+            [
+                Job("/books/one.pdf", "/tmp/out/one.epub", None),
+                Job("/books/two.pdf", "/else/2.epub", "Two"),
+            ],
+        )
+
+    def test_run_batch_keeps_going(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            jobs = [
+                Job("/tmp/does_not_exist_1.pdf", f"{out_dir}/1.epub", None),
+                Job("/tmp/does_not_exist_2.pdf", f"{out_dir}/2.epub", None),
+            ]
+            results = run_batch(jobs, workers=2, force_text=True, htmlex_ok=False)
+
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(not result.ok for result in results))
+        self.assertTrue(all(result.error for result in results))
+
+    def test_convert_uses_result_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            in_file = os.path.join(tmp_dir, "book.pdf")
+            with open(in_file, "wb") as f:
+                f.write(b"%PDF-1.4")
+            out_file = os.path.join(tmp_dir, "book.epub")
+
+            def to_epub(path=None):
+                with open(path, "wb") as f:
+                    f.write(b"epub")
+
+            cache = ResultCache(path=os.path.join(tmp_dir, "results"))
+            with patch("pdf2ebook.batch.RESULT_CACHE", cache), patch(
+                "pdf2ebook.pdf.PDF.to_epub", side_effect=to_epub
+            ) as pdf_to_epub:
+                convert(in_file, out_file, force_text=True, htmlex_ok=False)
+                os.remove(out_file)
+                convert(in_file, out_file, force_text=True, htmlex_ok=False)
+                self.assertEqual(pdf_to_epub.call_count, 1)
+
+                with open(out_file, "rb") as f:
+                    self.assertEqual(f.read(), b"epub")
+
+                convert(
+                    in_file, out_file, force_text=True, htmlex_ok=False, use_cache=False
+                )
+                self.assertEqual(pdf_to_epub.call_count, 2)
+
+    def test_run_job_report(self):
+        job = Job("/tmp/book.pdf", "/tmp/book.epub", None)
+        with patch("pdf2ebook.batch.convert") as convert:
+            result = run_job(job, {"force_text": True})
+        convert.assert_called_once_with(
+            "/tmp/book.pdf", "/tmp/book.epub", title=None, force_text=True
+        )
+        self.assertTrue(result.ok)
+        self.assertEqual(result.report["in_file"], "/tmp/book.pdf")
+        self.assertEqual(result.report["stages"]["convert"]["calls"], 1)
+
+        with patch("pdf2ebook.batch.convert", side_effect=Exception("broken")):
+            result = run_job(job, {})
+        self.assertFalse(result.ok)
+        self.assertEqual(result.report["stages"]["convert"]["calls"], 1)
+
+    def test_scan_book(self):
+        job = Job("/tmp/alice_by_lewis_carroll.pdf", "/tmp/alice.epub", None)
+        pages = {
+            (1, 10): ["Alice\nby Lewis Carroll\n1", "ISBN 978-0-14-143951-8"]
+            + [""] * 8,
+            (96, 100): ["", "", "", "", "9780140434965"],
+        }
+        with patch("pdf2ebook.batch.get_page_count", return_value=100), patch(
+            "pdf2ebook.batch.extract_pages_text",
+            side_effect=lambda path, first, last: pages[(first, last)],
+        ):
+            self.assertEqual(
+                scan_book(job), (["9780141439518", "9780140434965"], "alice")
+            )
+            self.assertEqual(
+                scan_book(job._replace(title="Given"))[1],
+                "Given",
+            )
+
+        with patch("pdf2ebook.batch.get_page_count", return_value=3), patch(
+            "pdf2ebook.batch.extract_pages_text", return_value=["", "", "9780140434965"]
+        ) as extract_pages_text:
+            self.assertEqual(scan_book(job), (["9780140434965"], None))
+        extract_pages_text.assert_called_once_with(job.in_file, 1, 3)
+
+        with patch("pdf2ebook.batch.get_page_count", return_value=None):
+            self.assertEqual(scan_book(job._replace(title="Given")), ([], "Given"))
+
+    def test_prefetch_metadata(self):
+        jobs = [
+            Job("/tmp/one.pdf", "/tmp/one.epub", None),
+            Job("/tmp/one_again.pdf", "/tmp/one_again.epub", "One"),
+            Job("/tmp/two.pdf", "/tmp/two.epub", "Two"),
+            Job("/tmp/three.pdf", "/tmp/three.epub", "Two"),
+        ]
+        books = {
+            "/tmp/one.pdf": (["1", "2"], None),
+            "/tmp/one_again.pdf": (["2", "1"], "One"),
+            "/tmp/two.pdf": (["3"], "Two"),
+            "/tmp/three.pdf": ([], "Two"),
+        }
+        title_isbns = {"One": ["1", "4"], "Two": ["5"]}
+        prefetched = []
+
+        def prefetch_lookups(lookup, keys, **kwargs):
+            keys = list(keys)
+            prefetched.append(keys)
+            if getattr(lookup, "keywords", None) == {"multi": True}:
+                return {key: title_isbns[key] for key in keys}
+            if len(prefetched) == 2:
+                return {key: "6" for key in keys}
+            return {}
+
+        with patch(
+            "pdf2ebook.batch.scan_book", side_effect=lambda job: books[job.in_file]
+        ), patch(
+            "pdf2ebook.batch.resolve_all_meta",
+            side_effect=[[("1", {"Title": "One"})], [("5", {"Title": "Two"})]],
+        ) as resolve_all_meta, patch(
+            "pdf2ebook.batch.prefetch_lookups", side_effect=prefetch_lookups
+        ):
+            prefetch_metadata(jobs)
+
+        self.assertEqual(
+            [call[0][0] for call in resolve_all_meta.call_args_list],
+            [["1", "2", "3"], ["4", "5", "6"]],
+        )
+        # every title, isbnlib's guess for books with nothing found, thumbnails
+        self.assertEqual(
+            prefetched, [["One", "Two", "Two"], ["Two", "Two"], ["1", "5"]]
+        )
+
+    def test_prefetch_metadata_deadline(self):
+        jobs = [Job("/tmp/one.pdf", "/tmp/one.epub", None)]
+
+        def scan_book(job):
+            time.sleep(1)
+            return ["1"], None
+
+        start = time.monotonic()
+        with patch("pdf2ebook.batch.scan_book", side_effect=scan_book), patch(
+            "pdf2ebook.batch.resolve_all_meta", return_value=[]
+        ) as resolve_all_meta, patch(
+            "pdf2ebook.batch.prefetch_lookups", return_value={}
+        ):
+            prefetch_metadata(jobs, deadline=0.2)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(resolve_all_meta.call_args_list[0][0][0], [])
+        self.assertEqual(resolve_all_meta.call_args_list[0][1]["deadline"], 0)
+
+    @patch("pdf2ebook.batch.EXTRACT_WORKERS", 8)
+    def test_init_worker(self):
+        with patch("pdf2ebook.batch.extract.set_workers") as set_workers, patch(
+            "pdf2ebook.batch.network.install"
+        ) as install:
+            init_worker(4)
+        set_workers.assert_called_once_with(2)
+        install.assert_called_once_with()
+
+    def test_run_batch_prefetch(self):
+        with patch("pdf2ebook.batch.prefetch_metadata") as prefetch_metadata, patch(
+            "pdf2ebook.batch.META_CACHE"
+        ) as meta_cache:
+            run_batch([], workers=1, htmlex_ok=False)
+            prefetch_metadata.assert_called_once_with([])
+            meta_cache.purge_expired.assert_called_once_with()
+
+            prefetch_metadata.reset_mock()
+            run_batch([], workers=1, prefetch=False, htmlex_ok=False)
+            prefetch_metadata.assert_not_called()
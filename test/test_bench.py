@@ -0,0 +1,56 @@
+import os
+import re
+import tempfile
+
+from unittest import TestCase
+
+from bench.run import compare
+from bench.synthetic import make_pdf
+
+
+def run(wall, stages):
+    return {
+        "ok": True,
+        "wall": wall,
+        "stages": {k: {"wall": v} for k, v in stages.items()},
+    }
+
+
+class BenchTest(TestCase):
+    def test_make_pdf(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = make_pdf(os.path.join(tmp_dir, "book.pdf"), 12)
+            with open(path, "rb") as f:
+                content = f.read()
+
+        self.assertTrue(content.startswith(b"%PDF-1.4"))
+        self.assertIn(b"/Count 12", content)
+        self.assertEqual(len(re.findall(rb"/Type /Page\b", content)), 12)
+
+        # every xref entry points at the object it's for
+        xref = int(re.search(rb"startxref\n(\d+)", content).group(1))
+        entries = re.findall(rb"(\d{10}) 00000 n", content[xref:])
+        for idx, offset in enumerate(entries, start=1):
+            self.assertTrue(content[int(offset) :].startswith(b"%d 0 obj" % idx))
+
+    def test_compare(self):
+        baseline = {
+            "runs": {
+                "alice/text": run(2.0, {"clean.pages": 1.0, "lang": 0.01}),
+                "alice/html": {"ok": False, "error": "pdftohtml is not installed"},
+            }
+        }
+        results = {
+            "runs": {
+                "alice/text": run(2.1, {"clean.pages": 1.5, "lang": 0.03}),
+                "alice/html": run(1.0, {}),
+                "moby_dick/text": run(9.0, {}),
+            }
+        }
+
+        # lang is 3x slower but only by 20ms
+        self.assertEqual(
+            compare(results, baseline, tolerance=0.2),
+            [("alice/text", "clean.pages", 1.0, 1.5)],
+        )
+        self.assertEqual(compare(results, baseline, tolerance=0.6), [])
@@ -0,0 +1,178 @@
+import os
+import tempfile
+
+from mock import patch
+from unittest import TestCase
+
+from pdf2ebook.cache import ArtifactCache, MetaCache, ResultCache, MISSING
+from pdf2ebook.instrumentation import REPORT
+
+
+class MetaCacheTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "meta.sqlite3")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_set(self):
+        cache = MetaCache(path=self.path)
+        self.assertIs(cache.get("isbn_meta", "9780141439761"), MISSING)
+
+        cache.set("isbn_meta", "9780141439761", {"Title": "Middlemarch"})
+        self.assertEqual(
+            cache.get("isbn_meta", "9780141439761"), {"Title": "Middlemarch"}
+        )
+
+    def test_persists(self):
+        MetaCache(path=self.path).set("isbn", "abc", "9780141439761")
+        self.assertEqual(MetaCache(path=self.path).get("isbn", "abc"), "9780141439761")
+
+    def test_negative(self):
+        cache = MetaCache(path=self.path, ttl=100, negative_ttl=-1)
+        cache.set("isbn", "found", "9780141439761")
+        cache.set("isbn", "not_found", None)
+
+        self.assertEqual(cache.get("isbn", "found"), "9780141439761")
+        self.assertIs(cache.get("isbn", "not_found"), MISSING)
+
+        cache = MetaCache(path=self.path, ttl=100, negative_ttl=100)
+        cache.set("isbn", "not_found", None)
+        self.assertIsNone(cache.get("isbn", "not_found"))
+
+    def test_ttl(self):
+        cache = MetaCache(path=self.path)
+        cache.set("isbn", "abc", "9780141439761", ttl=-1)
+        self.assertIs(cache.get("isbn", "abc"), MISSING)
+
+    def test_counts(self):
+        REPORT.reset()
+        cache = MetaCache(path=self.path)
+        cache.get("isbn", "abc")
+        cache.set("isbn", "abc", "9780141439761")
+        cache.get("isbn", "abc")
+        cache.get("isbn", "abc")
+        self.assertEqual(REPORT.counters["meta_cache.isbn.hits"], 2)
+        self.assertEqual(REPORT.counters["meta_cache.isbn.misses"], 1)
+
+    def test_purge_expired(self):
+        cache = MetaCache(path=self.path)
+        cache.set("isbn", "old", "9780141439761", ttl=-1)
+        cache.set("isbn", "new", "9780141439761")
+        cache.purge_expired()
+        rows = cache.connection.execute("SELECT key FROM meta").fetchall()
+        self.assertEqual(rows, [("new",)])
+
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(path=os.path.join(self.tmp_dir.name, "results"))
+        self.pdf = self.write("book.pdf", b"%PDF-1.4 book")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_key(self):
+        key = self.cache.key(self.pdf, {"force_text": True})
+        self.assertEqual(key, self.cache.key(self.pdf, {"force_text": True}))
+        self.assertNotEqual(key, self.cache.key(self.pdf, {"force_text": None}))
+
+        other = self.write("other.pdf", b"%PDF-1.4 other")
+        self.assertNotEqual(key, self.cache.key(other, {"force_text": True}))
+
+        with patch("pdf2ebook.cache.get_version", return_value="0.0.0"):
+            self.assertNotEqual(key, self.cache.key(self.pdf, {"force_text": True}))
+
+    def test_get_put(self):
+        out_file = os.path.join(self.tmp_dir.name, "out.epub")
+        self.assertFalse(self.cache.get("abcd", out_file))
+        self.assertFalse(os.path.exists(out_file))
+
+        self.cache.put("abcd", self.write("converted.epub", b"epub"))
+        self.assertTrue(self.cache.get("abcd", out_file))
+        self.assertEqual(self.read(out_file), b"epub")
+
+    def test_evicts_least_recently_used(self):
+        self.cache.max_size = 10
+        epub = self.write("converted.epub", b"epub")
+        for idx, key in enumerate(["aa01", "bb02"]):
+            self.cache.put(key, epub)
+            os.utime(self.cache.entry_path(key, ".epub"), (idx, idx))
+
+        # using aa01 makes bb02 the least recently used
+        self.cache.get("aa01", os.path.join(self.tmp_dir.name, "out.epub"))
+        self.cache.put("cc03", epub)
+
+        self.assertTrue(os.path.exists(self.cache.entry_path("aa01", ".epub")))
+        self.assertFalse(os.path.exists(self.cache.entry_path("bb02", ".epub")))
+        self.assertTrue(os.path.exists(self.cache.entry_path("cc03", ".epub")))
+
+
+class ArtifactCacheTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ArtifactCache(path=os.path.join(self.tmp_dir.name, "artifacts"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_key(self):
+        pdf = os.path.join(self.tmp_dir.name, "book.pdf")
+        with open(pdf, "wb") as f:
+            f.write(b"%PDF-1.4")
+
+        key = self.cache.key(pdf, "pdftotext", "pdftotext version 22.02.0", [])
+        self.assertEqual(
+            key, self.cache.key(pdf, "pdftotext", "pdftotext version 22.02.0", [])
+        )
+        self.assertNotEqual(
+            key, self.cache.key(pdf, "pdftotext", "pdftotext version 23.01.0", [])
+        )
+        self.assertNotEqual(
+            key, self.cache.key(pdf, "pdftotext", "pdftotext version 22.02.0", ["-q"])
+        )
+        self.assertNotEqual(
+            key, self.cache.key(pdf, "pdftohtml", "pdftotext version 22.02.0", [])
+        )
+
+    def test_text(self):
+        self.assertIsNone(self.cache.get_text("abcd"))
+        self.cache.put_text("abcd", "one\x0ctwö\x0c")
+        self.assertEqual(self.cache.get_text("abcd"), "one\x0ctwö\x0c")
+
+    def test_dir(self):
+        src_dir = os.path.join(self.tmp_dir.name, "src")
+        os.mkdir(src_dir)
+        os.mkdir(os.path.join(src_dir, "nested"))
+        for name in ("books.html", "books-1_1.png", "book.pdf"):
+            with open(os.path.join(src_dir, name), "w") as f:
+                f.write(name)
+
+        dest_dir = os.path.join(self.tmp_dir.name, "dest")
+        os.mkdir(dest_dir)
+        self.assertIsNone(self.cache.get_dir("abcd", dest_dir))
+
+        self.cache.put_dir("abcd", src_dir, exclude=["book.pdf"])
+        self.assertEqual(self.cache.get_dir("abcd", dest_dir), src_dir)
+        self.assertEqual(sorted(os.listdir(dest_dir)), ["books-1_1.png", "books.html"])
+        with open(os.path.join(dest_dir, "books.html")) as f:
+            self.assertEqual(f.read(), "books.html")
+
+    def test_gzip(self):
+        with patch("pdf2ebook.cache.zstandard", None):
+            cache = ArtifactCache(path=self.cache.path)
+            cache.put_text("abcd", "text")
+            self.assertTrue(os.path.exists(cache.entry_path("abcd", ".gz")))
+            self.assertEqual(cache.get_text("abcd"), "text")
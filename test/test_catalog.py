@@ -0,0 +1,113 @@
+import os
+import json
+import tempfile
+
+from mock import patch
+from unittest import TestCase
+
+from pdf2ebook.cache import MetaCache
+from pdf2ebook.catalog import (
+    Catalog,
+    read_records,
+    normalise_isbn,
+    normalise_title,
+)
+from pdf2ebook.metadata import resolve_meta, lookup_title_isbn
+
+BOOKS = [
+    {
+        "isbn": "978-0-14-143951-8",
+        "title": "Pride and Prejudice",
+        "authors": ["Jane Austen"],
+        "publisher": "Penguin",
+        "year": 2003,
+    },
+    {
+        "isbn": "0140434968",
+        "title": "A Room with a View",
+        "authors": ["E. M. Forster"],
+        "publisher": "Penguin",
+        "year": 2000,
+    },
+    {"isbn": "not an isbn", "title": "Broken"},
+    {"isbn": "9780141439518", "title": ""},
+]
+
+
+class CatalogTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+        self.jsonl = os.path.join(self.tmp_dir.name, "books.jsonl")
+        with open(self.jsonl, "w") as f:
+            for book in BOOKS:
+                f.write(json.dumps(book) + "\n")
+
+        self.csv = os.path.join(self.tmp_dir.name, "books.csv")
+        with open(self.csv, "w") as f:
+            f.write("isbn,title,authors,publisher,year\n")
+            f.write("9780141439600,Alice's Adventures in Wonderland,")
+            f.write("Lewis Carroll; John Tenniel,Penguin,1998\n")
+
+    def catalog(self, **kwargs):
+        catalog = Catalog(os.path.join(self.tmp_dir.name, "catalog.sqlite3"), **kwargs)
+        self.assertEqual(catalog.add(read_records(self.jsonl)), (2, 2))
+        self.assertEqual(catalog.add(read_records(self.csv)), (1, 0))
+        return catalog
+
+    def test_normalise(self):
+        self.assertEqual(normalise_isbn("0-14-043496-8"), "9780140434965")
+        self.assertEqual(normalise_isbn("978-0-14-143951-8"), "9780141439518")
+        self.assertIsNone(normalise_isbn("1234"))
+        self.assertEqual(normalise_title("  Café: The  NOVEL!"), "cafe the novel")
+
+    def test_meta(self):
+        catalog = self.catalog()
+        self.assertEqual(
+            catalog.meta("0-14-043496-8"),
+            {
+                "ISBN-13": "9780140434965",
+                "Title": "A Room with a View",
+                "Authors": ["E. M. Forster"],
+                "Publisher": "Penguin",
+                "Year": "2000",
+                "Language": "",
+            },
+        )
+        self.assertEqual(
+            catalog.meta("9780141439600")["Authors"], ["Lewis Carroll", "John Tenniel"]
+        )
+        self.assertIsNone(catalog.meta("9780306406157"))
+        self.assertIsNone(catalog.meta(None))
+
+    def test_search(self):
+        for use_fts in (True, False):
+            catalog = self.catalog(use_fts=use_fts)
+            self.assertEqual(catalog.search("pride and prejudice"), ["9780141439518"])
+            self.assertEqual(
+                catalog.search("Alices adventures in wonderland"), ["9780141439600"]
+            )
+            self.assertEqual(catalog.search("a room with a view."), ["9780140434965"])
+            self.assertEqual(catalog.search("pride"), [])
+            self.assertEqual(catalog.search("moby dick"), [])
+            self.assertEqual(catalog.search(""), [])
+
+    def test_before_network(self):
+        catalog = self.catalog()
+        cache = MetaCache(path=os.path.join(self.tmp_dir.name, "meta.sqlite3"))
+        with patch("pdf2ebook.catalog.CATALOG", catalog), patch(
+            "pdf2ebook.metadata.META_CACHE", cache
+        ), patch("pdf2ebook.metadata.isbnlib") as isbnlib, patch(
+            "pdf2ebook.metadata.isbns_from_words"
+        ) as isbns_from_words:
+            self.assertEqual(
+                resolve_meta(["9780141439518"])[1]["Title"], "Pride and Prejudice"
+            )
+            self.assertEqual(lookup_title_isbn("Pride and prejudice"), "9780141439518")
+            self.assertEqual(
+                lookup_title_isbn("Pride and prejudice", multi=True), ["9780141439518"]
+            )
+        isbnlib.meta.assert_not_called()
+        isbnlib.isbn_from_words.assert_not_called()
+        isbns_from_words.assert_not_called()
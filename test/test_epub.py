@@ -0,0 +1,74 @@
+import os
+import zipfile
+import tempfile
+from unittest import TestCase
+
+from pdf2ebook.epub import EpubPackager
+
+
+class EpubPackagerTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "book.epub")
+
+    def test_mimetype_first_and_stored(self):
+        asset = os.path.join(self.dir, "style.css")
+        with open(asset, "w") as f:
+            f.write("body {}" * 100)
+
+        with EpubPackager(self.path) as epub:
+            epub.add_bytes("META-INF/container.xml", "<container/>")
+            epub.add_file("OEBPS/style.css", asset)
+
+        with zipfile.ZipFile(self.path) as archive:
+            self.assertIsNone(archive.testzip())
+            infos = archive.infolist()
+            self.assertEqual(
+                [info.filename for info in infos],
+                ["mimetype", "META-INF/container.xml", "OEBPS/style.css"],
+            )
+            self.assertEqual(infos[0].compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(infos[0].extra, b"")
+            self.assertEqual(infos[2].compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(archive.read("OEBPS/style.css"), b"body {}" * 100)
+
+        # the mimetype has to be readable at a fixed offset
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(58)[30:], b"mimetypeapplication/epub+zip")
+
+    def test_compresslevel(self):
+        data = "lorem ipsum " * 1000
+        sizes = []
+        for level in (0, 9):
+            with EpubPackager(self.path, compresslevel=level) as epub:
+                epub.add_bytes("OEBPS/page.xhtml", data)
+            with zipfile.ZipFile(self.path) as archive:
+                sizes.append(archive.getinfo("OEBPS/page.xhtml").compress_size)
+        self.assertGreater(sizes[0], sizes[1])
+
+    def test_compresslevel_0_stored(self):
+        with EpubPackager(self.path, compresslevel=0) as epub:
+            epub.add_bytes("OEBPS/page.xhtml", "lorem ipsum")
+        with zipfile.ZipFile(self.path) as archive:
+            info = archive.getinfo("OEBPS/page.xhtml")
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+
+    def test_error_leaves_nothing_behind(self):
+        with open(self.path, "wb") as f:
+            f.write(b"old")
+
+        with self.assertRaises(ValueError):
+            with EpubPackager(self.path) as epub:
+                epub.add_bytes("OEBPS/page.xhtml", "lorem ipsum")
+                raise ValueError()
+
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"old")
+        self.assertEqual(os.listdir(self.dir), ["book.epub"])
+
+        # written in full over the old one on success
+        with EpubPackager(self.path) as epub:
+            epub.add_bytes("OEBPS/page.xhtml", "lorem ipsum")
+        with zipfile.ZipFile(self.path) as archive:
+            self.assertIsNone(archive.testzip())
+        self.assertEqual(os.listdir(self.dir), ["book.epub"])
@@ -0,0 +1,131 @@
+import io
+import os
+import tempfile
+
+from mock import patch
+from unittest import TestCase
+
+from pdf2ebook.cache import ArtifactCache
+from pdf2ebook.extract import (
+    page_ranges,
+    set_workers,
+    join_html,
+    run_sharded,
+    read_text,
+    extract_text,
+    extract_html,
+)
+from pdf2ebook.utils import split_html_pages
+
+
+def pdftohtml_output(pages):
+    return (
+        "<!DOCTYPE html><html>\n<head>\n<title>book</title>\n</head>\n"
+        '<body bgcolor="#A0A0A0">\n'
+        + "".join(f"<a name={page}></a>Page {page}<br/>\n<hr/>\n" for page in pages)
+        + "</body>\n</html>\n"
+    )
+
+
+class ExtractTest(TestCase):
+    def test_page_ranges(self):
+        self.assertEqual(page_ranges(10, workers=4, min_pages=50), [(1, 10)])
+        self.assertEqual(
+            page_ranges(100, workers=4, min_pages=25),
+            [(1, 25), (26, 50), (51, 75), (76, 100)],
+        )
+        self.assertEqual(
+            page_ranges(101, workers=2, min_pages=10), [(1, 51), (52, 101)]
+        )
+
+    @patch("pdf2ebook.extract._workers", 4)
+    def test_page_ranges_set_workers(self):
+        self.assertEqual(len(page_ranges(100, min_pages=10)), 4)
+        set_workers(2)
+        self.assertEqual(page_ranges(100, min_pages=10), [(1, 50), (51, 100)])
+        set_workers(0)
+        self.assertEqual(page_ranges(100, min_pages=10), [(1, 100)])
+
+    def test_join_html(self):
+        joined = join_html(
+            [pdftohtml_output([1, 2]), pdftohtml_output([3]), pdftohtml_output([4])]
+        )
+        self.assertEqual(
+            list(split_html_pages(joined)),
+            list(split_html_pages(pdftohtml_output([1, 2, 3, 4]))),
+        )
+
+    @patch("pdf2ebook.extract.get_page_count", return_value=200)
+    def test_run_sharded(self, _):
+        with patch(
+            "pdf2ebook.extract.page_ranges", return_value=[(1, 100), (101, 200)]
+        ):
+            self.assertEqual(
+                run_sharded("book.pdf", lambda first, last, idx: (first, last, idx)),
+                [(1, 100, 0), (101, 200, 1)],
+            )
+
+        with patch("pdf2ebook.extract.page_ranges", return_value=[(1, 200)]):
+            self.assertEqual(
+                run_sharded("book.pdf", lambda first, last, idx: (first, last, idx)),
+                [(None, None, 0)],
+            )
+
+    def test_read_text(self):
+        content = "one\x0ctwo\x0c\x0cthree\x0c"
+        self.assertEqual(
+            read_text(io.StringIO(content), chunk_size=3),
+            (content, [3, 7, 8, 14]),
+        )
+
+
+@patch("pdf2ebook.extract.tool_version", return_value="version 22.02.0")
+@patch("pdf2ebook.extract.get_page_count", return_value=1)
+class ExtractCacheTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pdf = os.path.join(self.tmp_dir.name, "book.pdf")
+        with open(self.pdf, "wb") as f:
+            f.write(b"%PDF-1.4")
+
+        patcher = patch(
+            "pdf2ebook.extract.ARTIFACT_CACHE",
+            ArtifactCache(path=os.path.join(self.tmp_dir.name, "artifacts")),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def scratch_dir(self):
+        return tempfile.mkdtemp(dir=self.tmp_dir.name)
+
+    def test_extract_text(self, *_):
+        content = "one\x0ctwo\x0c"
+        with patch("pdf2ebook.extract.subprocess.Popen") as popen:
+            popen.return_value.stdout = io.BytesIO(content.encode())
+            popen.return_value.wait.return_value = 0
+            self.assertEqual(extract_text(self.pdf), (content, [3, 7]))
+            self.assertEqual(extract_text(self.pdf), (content, [3, 7]))
+            popen.assert_called_once()
+
+    def test_extract_html(self, *_):
+        def pdftohtml(args):
+            with open(f"{args[-1]}s.html", "w") as f:
+                f.write(f'<img src="{args[-1]}-1_1.png"/>')
+            with open(f"{args[-1]}-1_1.png", "w") as f:
+                f.write("png")
+
+        first = os.path.join(self.scratch_dir(), "books.html")
+        second = os.path.join(self.scratch_dir(), "books.html")
+        with patch("pdf2ebook.extract.run", side_effect=pdftohtml) as run:
+            self.assertTrue(extract_html(self.pdf, first))
+            self.assertTrue(extract_html(self.pdf, second))
+            run.assert_called_once()
+
+        # image links follow the files to where they were restored
+        image = os.path.join(os.path.dirname(second), "book-1_1.png")
+        self.assertTrue(os.path.exists(image))
+        with open(second) as f:
+            self.assertEqual(f.read(), f'<img src="{image}"/>')
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import threading
+from subprocess import CompletedProcess
+
+from mock import patch
+from unittest import TestCase
+
+from pdf2ebook.htmlex_executor import DockerExecutor, LocalExecutor, htmlex_args
+
+
+class FakeDocker:
+    def __init__(self):
+        self.started = 0
+        self.running = set()
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, args, **kwargs):
+        with self.lock:
+            self.calls.append(args)
+            if args[1] == "run":
+                self.started += 1
+                container = f"container{self.started}"
+                self.running.add(container)
+                return CompletedProcess(args, 0, stdout=f"{container}\n", stderr="")
+            if args[1] == "inspect":
+                running = "true" if args[-1] in self.running else "false"
+                return CompletedProcess(args, 0, stdout=f"{running}\n", stderr="")
+            if args[1] == "rm":
+                self.running.discard(args[-1])
+            return CompletedProcess(args, 0, stdout="", stderr="")
+
+
+class DockerExecutorTest(TestCase):
+    def setUp(self):
+        self.mount = tempfile.mkdtemp()
+        self.dest_dir = os.path.join(self.mount, "html")
+        self.pdf_path = os.path.join(self.dest_dir, "book.pdf")
+        self.docker = FakeDocker()
+        patcher = patch("pdf2ebook.htmlex_executor.subprocess.run", self.docker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reuses_container(self):
+        executor = DockerExecutor(workers=2, mount=self.mount)
+        self.assertTrue(executor.convert(self.pdf_path, self.dest_dir))
+        self.assertTrue(executor.convert(self.pdf_path, self.dest_dir))
+
+        self.assertEqual(self.docker.started, 1)
+        execs = [args for args in self.docker.calls if args[1] == "exec"]
+        self.assertEqual(len(execs), 2)
+        self.assertEqual(
+            execs[0][:7],
+            [
+                "docker",
+                "exec",
+                "-u",
+                f"{os.getuid()}:{os.getgid()}",
+                "-w",
+                self.dest_dir,
+                "container1",
+            ],
+        )
+        self.assertEqual(execs[0][7:], htmlex_args(self.pdf_path, self.dest_dir))
+
+    def test_container_mounts_scratch_at_same_path(self):
+        executor = DockerExecutor(mount=self.mount)
+        executor.convert(self.pdf_path, self.dest_dir)
+
+        run = next(args for args in self.docker.calls if args[1] == "run")
+        self.assertIn(f"{executor.mount}:{executor.mount}", run)
+        self.assertNotIn("-ti", run)
+
+    def test_mounts_scratch_dir_only(self):
+        with patch("pdf2ebook.utils.SCRATCH_ROOT", self.mount):
+            executor = DockerExecutor()
+        self.assertEqual(
+            executor.mount, os.path.realpath(os.path.join(self.mount, "pdf2ebook"))
+        )
+        self.assertEqual(os.stat(executor.mount).st_mode & 0o777, 0o700)
+        with self.assertRaises(Exception):
+            executor.convert(self.pdf_path, self.dest_dir)
+
+    def test_replaces_unhealthy_container(self):
+        executor = DockerExecutor(mount=self.mount)
+        executor.convert(self.pdf_path, self.dest_dir)
+        self.docker.running.clear()
+
+        executor.convert(self.pdf_path, self.dest_dir)
+        self.assertEqual(self.docker.started, 2)
+        self.assertEqual(executor._containers, {"container2"})
+
+    def test_concurrency_limit(self):
+        executor = DockerExecutor(workers=2, mount=self.mount)
+        containers = [executor.acquire(), executor.acquire()]
+        self.assertFalse(executor._slots.acquire(blocking=False))
+
+        executor.release(containers[0])
+        self.assertEqual(executor.acquire(), containers[0])
+        self.assertEqual(self.docker.started, 2)
+
+    def test_outside_mount(self):
+        executor = DockerExecutor(mount=self.mount)
+        with self.assertRaises(Exception):
+            executor.convert("/somewhere/else/book.pdf", self.dest_dir)
+
+    def test_close(self):
+        executor = DockerExecutor(workers=2, mount=self.mount)
+        executor.release(executor.acquire())
+        executor.close()
+        self.assertEqual(self.docker.running, set())
+        self.assertEqual(executor._containers, set())
+
+
+class LocalExecutorTest(TestCase):
+    @patch(
+        "pdf2ebook.htmlex_executor.subprocess.run",
+        return_value=CompletedProcess([], 1),
+    )
+    def test_convert(self, run):
+        self.assertFalse(LocalExecutor().convert("/tmp/book.pdf", "/tmp"))
+        run.assert_called_once_with(htmlex_args("/tmp/book.pdf", "/tmp"))
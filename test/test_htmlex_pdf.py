@@ -0,0 +1,174 @@
+import os
+import gc
+import zipfile
+import tempfile
+
+from mock import patch
+from unittest import TestCase
+
+from pdf2ebook.cache import ArtifactCache
+from pdf2ebook.htmlex_pdf import HTMLEX_PDF
+
+
+class HTMLEXPDFTest(TestCase):
+    PDF_PATH = "test/resources/alice_in_wonderland.pdf"
+
+    def setUp(self):
+        self.scratch_root = tempfile.mkdtemp()
+        patcher = patch(
+            "pdf2ebook.htmlex_pdf.ARTIFACT_CACHE",
+            ArtifactCache(path=os.path.join(self.scratch_root, "artifacts")),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_workspaces_are_separate(self):
+        one = HTMLEX_PDF(path=self.PDF_PATH, scratch_root=self.scratch_root)
+        two = HTMLEX_PDF(path=self.PDF_PATH, scratch_root=self.scratch_root)
+
+        self.assertNotEqual(one.workspace, two.workspace)
+        self.assertNotEqual(one.tmp_dir, two.tmp_dir)
+        for pdf in (one, two):
+            self.assertTrue(os.path.isabs(pdf.tmp_path))
+            self.assertTrue(pdf.tmp_dir.startswith(pdf.workspace))
+            self.assertTrue(os.path.exists(pdf.tmp_path))
+
+    def test_workspace_removed_with_pdf(self):
+        pdf = HTMLEX_PDF(path=self.PDF_PATH, scratch_root=self.scratch_root)
+        workspace = pdf.workspace
+        self.assertTrue(os.path.isdir(workspace))
+
+        del pdf
+        gc.collect()
+        self.assertFalse(os.path.exists(workspace))
+
+    @staticmethod
+    def convert(pdf_path, dest_dir):
+        for idx in (1, 2):
+            with open(os.path.join(dest_dir, f"convertedbook{idx:04}.page"), "w") as f:
+                f.write(f'<div class="pf">page {idx}</div>')
+        for name in ("style.css", "base.min.css"):
+            with open(os.path.join(dest_dir, name), "w") as f:
+                f.write("body {}")
+        return True
+
+    @patch("pdf2ebook.htmlex_pdf.get_executor")
+    def test_to_html_uses_artifact_cache(self, get_executor):
+        get_executor.return_value.version = "pdf2htmlEX version 0.18.8.rc1"
+        get_executor.return_value.convert.side_effect = self.convert
+
+        one = HTMLEX_PDF(path=self.PDF_PATH, scratch_root=self.scratch_root)
+        one.to_html()
+        two = HTMLEX_PDF(path=self.PDF_PATH, scratch_root=self.scratch_root)
+        two.to_html()
+
+        get_executor.return_value.convert.assert_called_once()
+        self.assertEqual(
+            sorted(os.listdir(one.tmp_dir)), sorted(os.listdir(two.tmp_dir))
+        )
+
+        get_executor.return_value.version = "pdf2htmlEX version 0.18.8"
+        HTMLEX_PDF(path=self.PDF_PATH, scratch_root=self.scratch_root).to_html()
+        self.assertEqual(get_executor.return_value.convert.call_count, 2)
+
+    def test_to_epub(self):
+        pdf = HTMLEX_PDF(path=self.PDF_PATH, scratch_root=self.scratch_root)
+
+        def pdftoppm(args, check):
+            self.assertEqual(args[1], pdf.tmp_path)
+            with open(args[2] + ".png", "wb") as f:
+                f.write(b"png")
+
+        out_file = os.path.join(self.scratch_root, "book.epub")
+        with patch("pdf2ebook.htmlex_pdf.get_executor") as get_executor, patch(
+            "pdf2ebook.htmlex_pdf.subprocess.run", side_effect=pdftoppm
+        ), patch.multiple(
+            HTMLEX_PDF,
+            get_isbn=lambda self: "9780000000002",
+            get_title=lambda self: "Title",
+            get_authors=lambda self: ["Author"],
+            get_publisher=lambda self: "Publisher",
+            get_published_date=lambda self: "2000",
+            lang="en",
+        ):
+            get_executor.return_value.version = "pdf2htmlEX version 0.18.8.rc1"
+            get_executor.return_value.convert.side_effect = self.convert
+            pdf.to_epub(path=out_file)
+
+        with zipfile.ZipFile(out_file) as epub:
+            infos = epub.infolist()
+            self.assertEqual(infos[0].filename, "mimetype")
+            self.assertEqual(infos[0].compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(epub.read("mimetype"), b"application/epub+zip")
+            self.assertEqual(
+                sorted(info.filename for info in infos[1:]),
+                [
+                    "META-INF/container.xml",
+                    "OEBPS/base.min.css",
+                    "OEBPS/content.opf",
+                    "OEBPS/convertedbook0001.xhtml",
+                    "OEBPS/convertedbook0002.xhtml",
+                    "OEBPS/cover.png",
+                    "OEBPS/nav.xhtml",
+                    "OEBPS/style.css",
+                ],
+            )
+            self.assertIn(b"page 2", epub.read("OEBPS/convertedbook0002.xhtml"))
+            content = epub.read("OEBPS/content.opf").decode()
+            self.assertEqual(content.count('<item id="nav"'), 1)
+            self.assertIn('idref="convertedbook0002"', content)
+
+        self.assertEqual(
+            [page.text_content.split()[-2:] for page in pdf.pages],
+            [["page", "1"], ["page", "2"]],
+        )
+
+    def test_write_cover(self):
+        pdf_path = os.path.join(self.scratch_root, "Alice's $(touch pwned).pdf")
+        with open(self.PDF_PATH, "rb") as f, open(pdf_path, "wb") as out:
+            out.write(f.read())
+        pdf = HTMLEX_PDF(path=pdf_path, scratch_root=self.scratch_root)
+
+        with patch("pdf2ebook.htmlex_pdf.subprocess.run") as run:
+            self.assertFalse(pdf.write_cover())
+        self.assertEqual(
+            run.call_args[0][0][:3],
+            ["pdftoppm", pdf.tmp_path, os.path.join(pdf.tmp_dir, "cover")],
+        )
+
+        with patch(
+            "pdf2ebook.htmlex_pdf.subprocess.run", side_effect=FileNotFoundError
+        ):
+            self.assertFalse(pdf.write_cover())
+
+        # no cover, nothing in the manifest pointing at one
+        with patch.multiple(
+            HTMLEX_PDF,
+            get_isbn=lambda self: "9780000000002",
+            get_title=lambda self: "Title",
+            get_authors=lambda self: ["Author"],
+            get_publisher=lambda self: "Publisher",
+            get_published_date=lambda self: "2000",
+            lang="en",
+        ):
+            self.assertNotIn("cover.png", pdf.content_opf())
+            with open(pdf.cover_path, "wb") as f:
+                f.write(b"png")
+            self.assertIn('href="cover.png"', pdf.content_opf())
+            self.assertIn('<meta name="cover"', pdf.content_opf())
+
+    def test_pages_cached(self):
+        pdf = HTMLEX_PDF(path=self.PDF_PATH, scratch_root=self.scratch_root)
+        self.convert(pdf.tmp_path, pdf.tmp_dir)
+        pdf.modify_pages()
+
+        with patch.object(pdf, "page_xhtml", wraps=pdf.page_xhtml) as page_xhtml:
+            self.assertIs(pdf.pages, pdf.pages)
+            pdf.text_content
+            self.assertEqual(page_xhtml.call_count, 2)
+
+            # new .pages mean new pages
+            pdf.dot_pages = []
+            pdf.modify_pages()
+            self.assertEqual(len(pdf.pages), 2)
+            self.assertEqual(page_xhtml.call_count, 4)
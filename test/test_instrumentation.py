@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+
+from unittest import TestCase
+
+from pdf2ebook.instrumentation import Report, write_report
+
+
+class ReportTest(TestCase):
+    def test_stage(self):
+        report = Report()
+        for _ in range(2):
+            with report.stage("sleep"):
+                time.sleep(0.01)
+        with report.stage("child"):
+            subprocess.run([sys.executable, "-c", "sum(range(10 ** 6))"])
+
+        stages = report.as_dict()["stages"]
+        self.assertEqual(stages["sleep"]["calls"], 2)
+        self.assertGreaterEqual(stages["sleep"]["wall"], 0.02)
+        self.assertLess(stages["sleep"]["cpu"], stages["sleep"]["wall"])
+        self.assertGreater(stages["child"]["child_cpu"], 0)
+        self.assertGreater(stages["child"]["peak_rss"], 0)
+
+    def test_stage_raises(self):
+        report = Report()
+        with self.assertRaises(ValueError):
+            with report.stage("broken"):
+                raise ValueError()
+        self.assertEqual(report.as_dict()["stages"]["broken"]["calls"], 1)
+
+    def test_count(self):
+        report = Report()
+        report.count("meta_cache.isbn.hits")
+        report.count("meta_cache.isbn.hits", 2)
+        self.assertEqual(report.as_dict()["counters"], {"meta_cache.isbn.hits": 3})
+
+        report.reset()
+        self.assertEqual(report.as_dict()["counters"], {})
+        self.assertEqual(report.as_dict()["stages"], {})
+
+    def test_write_report(self):
+        report = Report()
+        with report.stage("convert"):
+            report.count("clean.passes")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "report.json")
+            write_report(path, report.as_dict())
+            with open(path) as f:
+                data = json.load(f)
+
+        self.assertEqual(set(data), {"wall", "peak_rss", "stages", "counters"})
+        self.assertEqual(data["counters"], {"clean.passes": 1})
@@ -0,0 +1,36 @@
+from unittest import TestCase
+
+from pdf2ebook.isbn_scanner import find_isbns, scan_isbns
+
+
+class IsbnScannerTest(TestCase):
+    def test_find_isbns(self):
+        self.assertEqual(
+            find_isbns(
+                "ISBN 978-0-14-143976-1 (pbk)\n"
+                "ISBN-10: 0–14–143976–9\n"
+                "Printed 9780141439760, call 020 7946 0958"
+            ),
+            [("9780141439761", True), ("9780141439761", True)],
+        )
+
+    def test_find_isbns_979_and_unlabelled(self):
+        self.assertEqual(
+            find_isbns("the 979 10 90636 07 1 edition"),
+            [("9791090636071", False)],
+        )
+
+    def test_not_part_of_longer_numbers(self):
+        self.assertEqual(find_isbns("order 19780141439761 or 97801414397612"), [])
+
+    def test_scan_isbns_ranking(self):
+        pages = ["Title page"] + ["Chapter text"] * 30
+        pages[15] = "an ad for 978-1-86197-876-9 in the middle"
+        pages[20] = "Copyright 2001, ISBN 978-0-14-143976-1"
+        pages[29] = "also available 9780099518471"
+        pages[3] = "9780099518471 on an early page"
+
+        self.assertEqual(
+            scan_isbns(pages),
+            ["9780141439761", "9780099518471", "9781861978769"],
+        )
@@ -0,0 +1,149 @@
+import os
+import time
+import tempfile
+import threading
+
+import isbnlib
+from mock import patch, Mock
+from unittest import TestCase
+
+from pdf2ebook.cache import MetaCache, MISSING
+from pdf2ebook.metadata import (
+    resolve_meta,
+    resolve_all_meta,
+    lookup_title_isbn,
+    lookup_thumbnail_url,
+    prefetch_lookups,
+)
+
+RELEASE_SLOW = threading.Event()
+
+
+def fake_meta(isbn, service="default"):
+    if isbn == "slow":
+        RELEASE_SLOW.wait(5)
+    if isbn == "broken":
+        raise isbnlib.dev._exceptions.ISBNLibHTTPError("down")
+    if isbn.startswith("good") and service == "openl":
+        return {"ISBN-13": isbn}
+    raise isbnlib.dev._exceptions.DataNotFoundAtServiceError(isbn)
+
+
+class ResolveMetaTest(TestCase):
+    def setUp(self):
+        RELEASE_SLOW.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = MetaCache(path=os.path.join(self.tmp_dir.name, "meta.sqlite3"))
+        self.patches = [
+            patch("pdf2ebook.metadata.META_CACHE", self.cache),
+            patch("pdf2ebook.metadata.isbnlib.meta", fake_meta),
+            patch("pdf2ebook.metadata.logger", Mock()),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        # Let the lookups left running by the resolver finish first
+        RELEASE_SLOW.set()
+        time.sleep(0.2)
+        for p in self.patches:
+            p.stop()
+        self.tmp_dir.cleanup()
+
+    def test_resolve_meta(self):
+        self.assertEqual(
+            resolve_meta([None, "bad", "good_1", "good_2"]),
+            ("good_1", {"ISBN-13": "good_1"}),
+        )
+        self.assertEqual(resolve_meta(["bad"]), (None, None))
+        self.assertEqual(resolve_meta([]), (None, None))
+
+    def test_resolve_all_meta(self):
+        self.assertEqual(
+            resolve_all_meta(["good_2", "bad", "good_1", "good_2"]),
+            [("good_2", {"ISBN-13": "good_2"}), ("good_1", {"ISBN-13": "good_1"})],
+        )
+
+    def test_does_not_wait_on_later_isbns(self):
+        start = time.monotonic()
+        self.assertEqual(resolve_meta(["good_1", "slow"])[0], "good_1")
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_deadline(self):
+        start = time.monotonic()
+        self.assertEqual(resolve_meta(["slow", "good_1"], deadline=0.5)[0], "good_1")
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_complete(self):
+        self.assertEqual(
+            resolve_meta(["bad", "good_1"], with_complete=True),
+            (("good_1", {"ISBN-13": "good_1"}), True),
+        )
+        # a service down for an isbn after the one picked doesn't matter
+        self.assertTrue(resolve_meta(["good_1", "broken"], with_complete=True)[1])
+        self.assertFalse(resolve_meta(["broken", "good_1"], with_complete=True)[1])
+        self.assertFalse(resolve_all_meta(["good_1", "broken"], with_complete=True)[1])
+        self.assertFalse(resolve_meta(["slow"], deadline=0.2, with_complete=True)[1])
+
+    def test_cached(self):
+        resolve_all_meta(["good_1", "bad", "broken"])
+        self.assertEqual(self.cache.get("isbn_meta", "good_1"), {"ISBN-13": "good_1"})
+        self.assertIsNone(self.cache.get("isbn_meta", "bad"))
+        self.assertIs(self.cache.get("isbn_meta", "broken"), MISSING)
+
+
+class LookupTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache = MetaCache(path=os.path.join(self.tmp_dir.name, "meta.sqlite3"))
+        for p in (
+            patch("pdf2ebook.metadata.META_CACHE", self.cache),
+            patch("pdf2ebook.metadata.logger", Mock()),
+        ):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_lookup_thumbnail_url(self):
+        with patch(
+            "pdf2ebook.metadata.get_thumbnail_url_from_isbn",
+            return_value="http://covers/1.jpg",
+        ) as get_thumbnail_url:
+            self.assertEqual(lookup_thumbnail_url("1"), "http://covers/1.jpg")
+            self.assertEqual(lookup_thumbnail_url("1"), "http://covers/1.jpg")
+        self.assertEqual(get_thumbnail_url.call_count, 1)
+
+    def test_lookup_title_isbn(self):
+        with patch(
+            "pdf2ebook.metadata.isbnlib.isbn_from_words", return_value="1"
+        ) as isbn_from_words, patch(
+            "pdf2ebook.metadata.isbns_from_words", return_value=["1", "2"]
+        ) as isbns_from_words:
+            self.assertEqual(lookup_title_isbn("a book"), "1")
+            self.assertEqual(lookup_title_isbn("a book"), "1")
+            self.assertEqual(lookup_title_isbn("a book", multi=True), ["1", "2"])
+            self.assertEqual(lookup_title_isbn("a book", multi=True), ["1", "2"])
+        self.assertEqual(isbn_from_words.call_count, 1)
+        self.assertEqual(isbns_from_words.call_count, 1)
+
+    def test_prefetch_lookups(self):
+        looked_up = []
+
+        def lookup(key):
+            looked_up.append(key)
+            if key == "broken":
+                raise Exception("down")
+
+        prefetch_lookups(lookup, ["a", "b", "a", None, "broken"])
+        self.assertEqual(sorted(looked_up), ["a", "b", "broken"])
+
+        prefetch_lookups(lookup, [])
+        self.assertEqual(len(looked_up), 3)
+
+    def test_prefetch_lookups_deadline(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        start = time.monotonic()
+        prefetch_lookups(lambda key: release.wait(5), ["slow"], deadline=0.2)
+        self.assertLess(time.monotonic() - start, 1)
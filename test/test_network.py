@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from unittest import TestCase, mock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from isbnlib.dev import webservice
+
+from pdf2ebook.network import Network, PooledHTTPHandler, install
+from pdf2ebook.instrumentation import REPORT
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address[1]))
+            failures = server.failures.get(self.path, 0)
+            if failures:
+                server.failures[self.path] -= 1
+
+        status = 503 if failures or self.path == "/down" else 200
+        body = self.path.encode() * (10000 if self.path == "/big" else 1)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class NetworkTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.server.daemon_threads = True
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.failures = {}
+        REPORT.reset()
+
+        self.network = Network(
+            rate=0, retries=2, backoff=0.01, breaker_failures=3, breaker_cooldown=60
+        )
+        patcher = mock.patch("pdf2ebook.network.NETWORK", self.network)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.network.close)
+
+        install()
+        self.addCleanup(urllib.request.install_opener, None)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def get(self, path):
+        with urllib.request.urlopen(self.url(path)) as response:
+            return response.read()
+
+    def test_reuses_connections(self):
+        self.assertEqual(self.get("/a"), b"/a")
+        self.assertEqual(self.get("/b"), b"/b")
+        self.assertEqual(self.get("/c"), b"/c")
+
+        ports = {port for _, port in self.server.requests}
+        self.assertEqual(len(ports), 1)
+        self.assertEqual(REPORT.counters["network.reused"], 2)
+
+    def test_partly_read_not_reused(self):
+        with urllib.request.urlopen(self.url("/big")) as response:
+            response.read(10)
+        self.assertEqual(self.get("/a"), b"/a")
+
+        ports = [port for _, port in self.server.requests]
+        self.assertNotEqual(ports[0], ports[1])
+
+    def test_retries(self):
+        self.server.failures["/flaky"] = 2
+        self.assertEqual(self.get("/flaky"), b"/flaky")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(REPORT.counters["network.retries"], 2)
+
+    def test_gives_up(self):
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self.get("/down")
+        self.assertEqual(ctx.exception.code, 503)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_connection_error(self):
+        with self.assertRaises(urllib.error.URLError):
+            urllib.request.urlopen("http://127.0.0.1:1/")
+        self.assertEqual(REPORT.counters["network.requests"], 3)
+
+    def test_circuit_breaker(self):
+        self.network.retries = 0
+        for _ in range(3):
+            with self.assertRaises(urllib.error.HTTPError):
+                self.get("/down")
+        self.assertEqual(len(self.server.requests), 3)
+
+        # skipped without a request while open
+        start = time.monotonic()
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self.get("/a")
+        self.assertEqual(ctx.exception.code, 503)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(REPORT.counters["network.breaker_skipped"], 1)
+
+        # after the cooldown a success closes it
+        self.network.breaker_cooldown = 0
+        host = self.network.host(("http", f"127.0.0.1:{self.server.server_port}"))
+        host.open_until = 0
+        self.assertEqual(self.get("/a"), b"/a")
+        self.assertEqual(host.failures, 0)
+
+    def test_success_resets_failures(self):
+        self.network.retries = 0
+        for path in ("/down", "/down", "/a", "/down", "/down"):
+            try:
+                self.get(path)
+            except urllib.error.HTTPError:
+                pass
+        self.assertEqual(self.get("/a"), b"/a")
+
+    def test_rate_limit(self):
+        self.network.rate = 10
+        start = time.monotonic()
+        for _ in range(4):
+            self.get("/a")
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+
+    def test_isbnlib(self):
+        self.assertEqual(webservice.query(self.url("/isbnlib")), "/isbnlib")
+        self.assertEqual(REPORT.counters["network.requests"], 1)
+
+    def test_urlretrieve(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "cover.jpg")
+            urllib.request.urlretrieve(self.url("/cover"), path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"/cover")
+        self.assertEqual(self.get("/a"), b"/a")
+        self.assertEqual(REPORT.counters["network.reused"], 1)
+
+
+class InstallTest(TestCase):
+    def test_not_on_import(self):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import urllib.request, pdf2ebook.batch;"
+                "print(urllib.request._opener)",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        self.assertEqual(output.strip(), "None")
+
+    def test_install(self):
+        self.addCleanup(urllib.request.install_opener, None)
+        with mock.patch("pdf2ebook.network.NETWORK_POOLING", False):
+            install()
+        self.assertIsNone(urllib.request._opener)
+
+        install()
+        self.assertTrue(
+            any(
+                isinstance(handler, PooledHTTPHandler)
+                for handler in urllib.request._opener.handlers
+            )
+        )
@@ -1,5 +1,6 @@
 import os
 
+from mock import patch
 from unittest import TestCase, skip
 
 from PIL import Image
@@ -75,6 +76,17 @@ class TextPageTest(TestCase):
         first = TextPage(0, "blah\n\nblah blah blah")
         self.assertEqual(first.html_content, "<p>blah</p><p>blah blah blah</p>")
 
+    def test_fingerprint(self):
+        page = TextPage(0, "Header\x0csomething blah blah")
+        self.assertEqual(
+            page.fingerprint, TextPage(0, "Header\x0csomething blah blah").fingerprint
+        )
+
+        before = page.fingerprint
+        page.remove_header("Header")
+        self.assertNotEqual(page.fingerprint, before)
+        self.assertEqual(page.fingerprint, TextPage(0, "something blah blah").fingerprint)
+
     def test_epub_content(self):
         first = TextPage(0, "blah\n\nblah blah blah")
         self.assertEqual(
@@ -116,11 +128,64 @@ class HTMLPageTest(TestCase):
         page.remove_header("something")
         self.assertEqual(page.text_content, "Blah blah")
 
+    def test_lxml(self):
+        page = HTMLPage(
+            0,
+            '<p>something &amp; something</p>\n<img src="/tmp/test_images.png"/><hr/>',
+            parser="lxml",
+        )
+        self.assertEqual(page.text_content, "something & something")
+        self.assertEqual(
+            page.html_content,
+            '<p>something &amp; something</p>\n<img src="test_images.png"/>',
+        )
+
+    def test_is_empty(self):
+        self.assertTrue(HTMLPage(0, "<p></p><hr/>").is_empty)
+        self.assertFalse(HTMLPage(0, "<p></p><img src='a.png'/>").is_empty)
+        self.assertFalse(HTMLPage(0, "<p>something</p>").is_empty)
+
+    def test_strip_whitespace(self):
+        page = HTMLPage(0, "<br/>\n <br/>\n<p>something</p>\n<br/>\n")
+        page.strip_whitespace()
+        self.assertEqual(page.content, "<p>something</p>")
+
+    def test_fingerprint(self):
+        page = HTMLPage(0, "<p>something</p>\nBlah blah</br>")
+        before = page.fingerprint
+        page.remove_header("something")
+        self.assertNotEqual(page.fingerprint, before)
+
     def test_remove_footer(self):
         page = HTMLPage(0, "<p>something</p>\nBlah blah</br>")
         page.remove_footer("Blah blah")
         self.assertEqual(page.text_content, "something")
 
+    def test_edits_in_place(self):
+        page = HTMLPage(
+            0,
+            "\n<b>Header</b><br/>\nfirst line<br/>\n<i>second</i> line<br/>\n"
+            "Footer<br/>\n12<br/>\n",
+        )
+        page.page_number_position = "bottom"
+        with patch.object(page, "_parse") as parse:
+            page.remove_page_number()
+            page.remove_header("Header")
+            page.remove_footer("Footer")
+        parse.assert_not_called()
+        self.assertEqual(page.content, "first line<br/>\n<i>second</i> line<br/>")
+
+        # no line left, nothing removed
+        page = HTMLPage(0, "<p>Header</p>")
+        page.remove_header("Header")
+        page.remove_footer("Header")
+        self.assertEqual(page.content, "<p>Header</p>")
+
+    def test_remove_page_number_top(self):
+        page = HTMLPage(0, "<br/>\n7<br/>\nsomething<br/>")
+        page.page_number_position = "top"
+        page.remove_page_number()
+        self.assertEqual(page.content, "something<br/>")
 
 class HTMLExPageTest(TestCase):
     @skip("Need to implement")
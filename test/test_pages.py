@@ -1,7 +1,7 @@
 from unittest import TestCase
 
 from pdf2ebook.text_page import TextPage
-from pdf2ebook.pages import TextPages
+from pdf2ebook.pages import TextPages, LineIndex
 
 
 class PagesTest(TestCase):
@@ -28,3 +28,76 @@ class PagesTest(TestCase):
             )
 
         self.assertEqual(pages.detect_footer(), "eight")
+
+    def test_from_content(self):
+        pages = TextPages.from_content("one\x0ctwo\x0cthree\x0cfour\x0c")
+        pages.set_context()
+
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(
+            [page.text_content for page in pages], ["one", "two", "three\nfour\n"]
+        )
+        self.assertTrue(all(page.content is pages.content for page in pages))
+
+    def test_clean(self):
+        def make_pages():
+            content = "\x0c".join(
+                f"The Header\n{i}\nsome text on page {i}\nmore on {i}\nThe Footer"
+                for i in range(20)
+            )
+            pages = TextPages.from_content(content + "\x0c")
+            pages.set_context()
+            return pages
+
+        pages = make_pages()
+        passes = pages.clean()
+
+        # the same as cleaning every page until nothing changes
+        expected = make_pages()
+        expected_passes = 0
+        last_hash = None
+        while last_hash != [page.fingerprint for page in expected]:
+            expected_passes += 1
+            last_hash = [page.fingerprint for page in expected]
+            expected.set_page_number_position()
+            header = expected.detect_header()
+            footer = expected.detect_footer()
+            for page in expected:
+                page.remove_page_number()
+                page.remove_header(header)
+                page.remove_footer(footer)
+
+        self.assertEqual(passes, expected_passes)
+        self.assertEqual(
+            [page.text_content for page in pages],
+            [page.text_content for page in expected],
+        )
+        self.assertGreater(passes, 1)
+
+    def test_clean_max_passes(self):
+        pages = TextPages.from_content("1\n2\n3\n4\x0c" * 4)
+        pages.set_context()
+        for page in pages:
+            page.page_number_position = "top"
+        self.assertEqual(pages.clean(max_passes=1), 1)
+
+    def test_line_index(self):
+        index = LineIndex(size=3)
+        for content in [
+            "",
+            "\n \n",
+            "one",
+            "  one \ntwo",
+            "\n\n one\n\n two \nthree\nfour\nfive\n\nsix \n\n",
+        ]:
+            page = TextPage(0, content)
+            lines = page.cleaned_text_content.split("\n")
+            self.assertEqual(index.get(page), (lines[:3], lines[-3:]))
+
+    def test_line_index_invalidated(self):
+        index = LineIndex()
+        page = TextPage(0, "Header\nsomething\x0cother stuff")
+        self.assertEqual(index.get(page)[0], ["Header", "something", "other stuff"])
+
+        page.remove_header("Header")
+        self.assertEqual(index.get(page)[0], ["something", "other stuff"])
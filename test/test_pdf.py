@@ -0,0 +1,91 @@
+import os
+import tempfile
+
+from mock import patch, ANY
+from unittest import TestCase
+
+from pdf2ebook.pdf import PDF
+from pdf2ebook.cache import MetaCache, MISSING
+
+
+@patch("pdf2ebook.pdf.extract_html", return_value=True)
+@patch(
+    "pdf2ebook.pdf.extract_text", return_value=("one\x0ctwo\x0cthree\x0c", [3, 7, 13])
+)
+class PDFTest(TestCase):
+    def test_force_text_only_extracts_text(self, extract_text, extract_html):
+        pdf = PDF(path="book.pdf", use_text=True)
+        self.assertEqual(len(pdf.pages), 2)
+        self.assertFalse(pdf.use_html)
+        extract_text.assert_called_once_with("book.pdf")
+        extract_html.assert_not_called()
+
+    def test_force_html_only_extracts_html(self, extract_text, extract_html):
+        pdf = PDF(path="book.pdf", use_html=True)
+        pdf.load()
+        extract_html.assert_called_once()
+        extract_text.assert_not_called()
+
+
+class PDFIsbnTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache = MetaCache(path=os.path.join(self.tmp_dir.name, "meta.sqlite3"))
+        patcher = patch("pdf2ebook.base_pdf.META_CACHE", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch(
+        "pdf2ebook.base_pdf.resolve_meta",
+        return_value=(("9780141439761", {}), True),
+    )
+    def test_only_top_candidates_looked_up(self, resolve_meta):
+        pages = ["ISBN 978-0-14-143976-1"] + [
+            f"page {idx} 978-1-86197-876-9 9780099518471 9791090636071"
+            for idx in range(40)
+        ]
+        content = "\x0c".join(pages) + "\x0c"
+        with patch("pdf2ebook.pdf.extract_text", return_value=(content, None)):
+            pdf = PDF(path="book.pdf", use_text=True)
+            self.assertEqual(pdf._find_isbn(), ("9780141439761", True))
+
+        resolve_meta.assert_called_once_with(
+            ["9780141439761", "9781861978769", "9780099518471"],
+            deadline=ANY,
+            with_complete=True,
+        )
+
+    @patch("pdf2ebook.base_pdf.META_LOOKUP_DEADLINE", 30)
+    @patch("pdf2ebook.base_pdf.time.monotonic", side_effect=[100, 100, 110, 200])
+    def test_lookup_deadline_per_book(self, _):
+        with patch("pdf2ebook.pdf.extract_text", return_value=("text\x0c", None)):
+            pdf = PDF(path="book.pdf", use_text=True)
+        self.assertEqual(pdf.lookup_deadline(), 30)
+        self.assertEqual(pdf.lookup_deadline(), 20)
+        self.assertEqual(pdf.lookup_deadline(), 0)
+
+    @patch("pdf2ebook.base_pdf.get_isbn_from_content", return_value=None)
+    @patch("pdf2ebook.base_pdf.lookup_title_isbn", return_value=None)
+    @patch("pdf2ebook.base_pdf.resolve_meta")
+    def test_outage_not_cached(self, resolve_meta, *_):
+        with patch(
+            "pdf2ebook.pdf.extract_text",
+            return_value=("ISBN 978-0-14-143976-1\x0c", None),
+        ):
+            pdf = PDF(path="book.pdf", use_text=True, title="Emma")
+
+            resolve_meta.return_value = ((None, None), False)
+            self.assertIsNone(pdf.get_isbn())
+            self.assertIs(self.cache.get("isbn", pdf.meta_key), MISSING)
+
+            resolve_meta.return_value = (("9780141439761", {}), True)
+            self.assertEqual(pdf.get_isbn(), "9780141439761")
+            self.assertEqual(self.cache.get("isbn", pdf.meta_key), "9780141439761")
+
+    def test_meta_key_has_title(self):
+        with patch("pdf2ebook.pdf.extract_text", return_value=("text\x0c", None)):
+            emma = PDF(path="book.pdf", use_text=True, title="Emma")
+            persuasion = PDF(path="book.pdf", use_text=True, title="Persuasion")
+            self.assertEqual(emma.fingerprint, persuasion.fingerprint)
+            self.assertNotEqual(emma.meta_key, persuasion.meta_key)
@@ -0,0 +1,51 @@
+import random
+import difflib
+import threading
+
+from unittest import TestCase
+
+from pdf2ebook.similarity import SequenceMatcherEngine, get_matcher
+
+
+class SimilarityTest(TestCase):
+    def test_same_as_difflib(self):
+        rand = random.Random(0)
+        targets = ["", "Header", "Alice's Adventures in Wonderland", "CHAPTER I"]
+        lines = ["", "header", "Header", "Headers", "Head", "CHAPTER II", "1"]
+        for _ in range(500):
+            target = rand.choice(targets)
+            lines.append(
+                "".join(
+                    rand.choice(target + "xyz ") for _ in range(rand.randint(0, 40))
+                )
+            )
+
+        for target in targets:
+            matcher = SequenceMatcherEngine(target, threshold=0.8)
+            self.assertEqual(
+                matcher.match_many(lines),
+                [
+                    difflib.SequenceMatcher(None, line, target).ratio() > 0.8
+                    for line in lines
+                ],
+            )
+
+    def test_get_matcher(self):
+        self.assertIsNot(get_matcher("Header"), get_matcher("Header"))
+        self.assertTrue(get_matcher("Header").matches("Headers"))
+        self.assertFalse(get_matcher("Header").matches("Something else"))
+
+    def test_threads(self):
+        lines = ["Header", "Something else", "Headers", "header"] * 50
+        expected = [True, False, True, True] * 50
+        results = []
+
+        def match():
+            results.append(get_matcher("Header").match_many(lines))
+
+        threads = [threading.Thread(target=match) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [expected] * 8)
@@ -1,6 +1,21 @@
+import io
+import time
+import threading
 from unittest import TestCase
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
-from pdf2ebook.utils import window, get_isbn, isbns_from_words, remove_page_no
+import bs4
+
+from pdf2ebook.utils import (
+    window,
+    get_isbn,
+    isbns_from_words,
+    remove_page_no,
+    page_offsets,
+    count_html_words,
+    split_html_pages,
+    get_isbn_from_content,
+)
 
 
 class UtilsTest(TestCase):
@@ -34,3 +49,205 @@ class UtilsTest(TestCase):
         self.assertEqual(remove_page_no("123 something 123"), "something")
         self.assertEqual(remove_page_no("123 something"), "something")
         self.assertEqual(remove_page_no("something 123"), "something")
+
+    def test_split_html_pages(self):
+        html = """<!DOCTYPE html><html>
+<head>
+<title>book</title>
+</head>
+<body bgcolor="#A0A0A0" vlink="blue" link="blue">
+<a name=1></a><b>Title</b><br/>
+Page one<br/>
+<hr/>
+<a name=2></a>Page two<br/>
+<hr/><hr/>
+<a name=4></a>Page four<br/>
+<hr/>
+</body>
+</html>"""
+        self.assertEqual(
+            list(split_html_pages(html)),
+            [
+                "<a name=1></a><b>Title</b><br/>\nPage one<br/>\n<hr/>",
+                "<a name=2></a>Page two<br/>\n<hr/><hr/>",
+                "",
+                "<a name=4></a>Page four<br/>\n<hr/>",
+            ],
+        )
+        self.assertEqual(list(split_html_pages("<p>no body</p>")), [])
+
+    def test_page_offsets(self):
+        for content in ["", "one", "one\x0ctwo\x0c", "\x0c\x0cthree"]:
+            self.assertEqual(
+                [content[start:end] for start, end in page_offsets(content)],
+                content.split("\x0c"),
+            )
+        self.assertEqual(
+            page_offsets("one\x0ctwo", breaks=[3]), page_offsets("one\x0ctwo")
+        )
+
+    def test_count_html_words(self):
+        html = (
+            "<!DOCTYPE html><html><head><title>a book</title></head><body>"
+            + '<p class="x y">some words here</p> <br/>\n' * 50
+            + "</body></html>"
+        )
+        self.assertEqual(
+            count_html_words(io.StringIO(html), chunk_size=7),
+            len(bs4.BeautifulSoup(html, "html.parser").text.split(" ")),
+        )
+        self.assertLess(count_html_words(io.StringIO(html), limit=10, chunk_size=7), 20)
+
+
+PAGES = {
+    "/title": b"<html><head><title>Book 9780141439518</title></head></html>",
+    "/content": b"<html><body>ISBN 978-0-14-143951-8</body></html>",
+    "/many": b"<html><body>9780141439518 and 9780140434965</body></html>",
+    "/other": b"<html><head><title>Other 9780140434965</title></head></html>",
+    "/big": b"<html><body>" + b"x" * 100000 + b" 9780141439518</body></html>",
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(2)
+        body = PAGES.get(self.path, b"<html></html>")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class IsbnSearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def search(self, *paths):
+        return lambda content: [self.url(path) for path in paths]
+
+    def test_isbn_in_url(self):
+        start = time.monotonic()
+        self.assertEqual(
+            get_isbn_from_content(
+                "x",
+                search_fn=lambda content: [
+                    "http://example.com/book/9780141439518",
+                    self.url("/slow"),
+                ],
+            ),
+            "9780141439518",
+        )
+        self.assertLess(time.monotonic() - start, 1)
+
+        # a url is only as good as where its result is
+        self.assertEqual(
+            get_isbn_from_content(
+                "x",
+                search_fn=lambda content: [
+                    self.url("/other"),
+                    "http://example.com/book/9780141439518",
+                ],
+            ),
+            "9780140434965",
+        )
+        self.assertEqual(
+            get_isbn_from_content(
+                "x",
+                search_fn=lambda content: [
+                    self.url("/slow"),
+                    "http://example.com/book/9780141439518",
+                ],
+            ),
+            "9780141439518",
+        )
+
+    def test_title_and_content(self):
+        self.assertEqual(
+            get_isbn_from_content("x", search_fn=self.search("/title")),
+            "9780141439518",
+        )
+        self.assertEqual(
+            get_isbn_from_content("x", search_fn=self.search("/content")),
+            "978-0-14-143951-8",
+        )
+
+    def test_nothing_found(self):
+        self.assertIsNone(
+            get_isbn_from_content(
+                "x", search_fn=self.search("/many", "/missing", "/book.pdf")
+            )
+        )
+        self.assertIsNone(get_isbn_from_content("x", search_fn=self.search()))
+        self.assertIsNone(
+            get_isbn_from_content("x", search_fn=self.search("/slow"), deadline=0.5)
+        )
+
+    def test_prefers_earlier_results(self):
+        self.assertEqual(
+            get_isbn_from_content("x", search_fn=self.search("/other", "/title")),
+            "9780140434965",
+        )
+
+    def test_skips_failures(self):
+        self.assertEqual(
+            get_isbn_from_content(
+                "x",
+                search_fn=lambda content: [
+                    "http://127.0.0.1:1/refused",
+                    self.url("/title"),
+                ],
+            ),
+            "9780141439518",
+        )
+
+    def test_found_before_slow_ones(self):
+        start = time.monotonic()
+        self.assertEqual(
+            get_isbn_from_content("x", search_fn=self.search("/title", "/slow")),
+            "9780141439518",
+        )
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_deadline(self):
+        # past the deadline the best of what has come back is used
+        start = time.monotonic()
+        self.assertEqual(
+            get_isbn_from_content(
+                "x", search_fn=self.search("/slow", "/title"), deadline=0.5
+            ),
+            "9780141439518",
+        )
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_timeout(self):
+        self.assertEqual(
+            get_isbn_from_content(
+                "x", search_fn=self.search("/slow", "/title"), timeout=0.5
+            ),
+            "9780141439518",
+        )
+
+    def test_max_bytes(self):
+        self.assertEqual(
+            get_isbn_from_content("x", search_fn=self.search("/big")),
+            "9780141439518",
+        )
+        self.assertIsNone(
+            get_isbn_from_content("x", search_fn=self.search("/big"), max_bytes=50000)
+        )